@@ -0,0 +1,335 @@
+# backends.py
+"""Interchangeable inference backends for the YOLO model.
+
+Every backend loads into an ultralytics model, so callers get the same
+Results objects and, through extract_detections, the same detections
+structure whichever runtime does the work.
+
+Usage:
+    python backends.py export --backend onnx|openvino [--int8 --calibration DIR]
+    python backends.py parity --backend onnx|openvino [--int8] --images DIR
+"""
+import argparse
+import os
+import shutil
+import sys
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from inference import extract_detections
+
+# Backend selection (can be overridden through the environment)
+BACKEND = os.environ.get("IQMS_BACKEND", "pytorch")  # "pytorch", "onnx", "openvino" or "stub"
+INT8 = os.environ.get("IQMS_INT8", "0") in ("1", "true", "yes")
+
+# Images used from the calibration folder for INT8 quantization
+CALIBRATION_IMAGES = 300
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".bmp", ".webp", ".tif", ".tiff"}
+
+# Confidence threshold used by the model (ultralytics default)
+CONF_THRESHOLD = 0.25
+
+
+def list_images(folder, limit=None):
+    images = sorted(p for p in Path(folder).rglob("*") if p.suffix.lower() in IMAGE_SUFFIXES)
+    return images[:limit] if limit else images
+
+
+def letterbox(image, imgsz):
+    """Resize and pad a BGR image to imgsz x imgsz the way ultralytics does,
+    returning a normalized 1x3xHxW float32 RGB tensor"""
+    height, width = image.shape[:2]
+    scale = min(imgsz / height, imgsz / width)
+    resized = cv2.resize(image, (round(width * scale), round(height * scale)), interpolation=cv2.INTER_LINEAR)
+    canvas = np.full((imgsz, imgsz, 3), 114, dtype=np.uint8)
+    top = (imgsz - resized.shape[0]) // 2
+    left = (imgsz - resized.shape[1]) // 2
+    canvas[top:top + resized.shape[0], left:left + resized.shape[1]] = resized
+    tensor = canvas[:, :, ::-1].transpose(2, 0, 1)[None]
+    return np.ascontiguousarray(tensor, dtype=np.float32) / 255.0
+
+
+def calibration_tensors(folder, imgsz, limit=CALIBRATION_IMAGES):
+    images = list_images(folder, limit)
+    if not images:
+        raise ValueError(f"No calibration images found in {folder}")
+    for path in images:
+        image = cv2.imread(str(path))
+        if image is not None:
+            yield letterbox(image, imgsz)
+
+
+class Backend:
+    """Locates, exports and loads the model for one runtime"""
+
+    name = None
+
+    def artifact(self, weights, int8=False):
+        """Path of the exported model for these weights"""
+        raise NotImplementedError
+
+    def export(self, weights, imgsz, int8=False, calibration=None):
+        raise NotImplementedError
+
+    def load(self, weights, int8=False):
+        from ultralytics import YOLO
+
+        path = self.artifact(weights, int8)
+        if not Path(path).exists():
+            command = f"python backends.py export --backend {self.name} --weights {weights}"
+            if int8:
+                command += " --int8 --calibration DIR"
+            raise FileNotFoundError(f"{path} not found; create it with: {command}")
+        return YOLO(str(path), task="detect")
+
+    def _stem(self, weights, int8):
+        stem = str(Path(weights).with_suffix(""))
+        return stem + "_int8" if int8 else stem
+
+
+class PyTorchBackend(Backend):
+    name = "pytorch"
+
+    def artifact(self, weights, int8=False):
+        if int8:
+            raise ValueError("INT8 is only available for the onnx and openvino backends")
+        return Path(weights)
+
+    def export(self, weights, imgsz, int8=False, calibration=None):
+        return self.artifact(weights, int8)
+
+    def load(self, weights, int8=False):
+        from ultralytics import YOLO
+
+        # Weights are downloaded by ultralytics if they are not present
+        self.artifact(weights, int8)
+        return YOLO(weights)
+
+
+class OnnxBackend(Backend):
+    """ONNX Runtime; INT8 uses static QDQ quantization from onnxruntime"""
+
+    name = "onnx"
+
+    def artifact(self, weights, int8=False):
+        return Path(self._stem(weights, int8) + ".onnx")
+
+    def export(self, weights, imgsz, int8=False, calibration=None):
+        from ultralytics import YOLO
+
+        fp32 = self.artifact(weights)
+        if not fp32.exists():
+            # Dynamic axes keep batched inference working
+            exported = YOLO(weights).export(format="onnx", imgsz=imgsz, dynamic=True, simplify=True)
+            if Path(exported) != fp32:
+                shutil.move(exported, fp32)
+        if not int8:
+            return fp32
+
+        import onnx
+        from onnxruntime.quantization import (
+            CalibrationDataReader, QuantFormat, QuantType, quantize_static,
+        )
+
+        class Reader(CalibrationDataReader):
+            def __init__(self):
+                self.input_name = onnx.load(str(fp32), load_external_data=False).graph.input[0].name
+                self.tensors = calibration_tensors(calibration, imgsz)
+
+            def get_next(self):
+                tensor = next(self.tensors, None)
+                return None if tensor is None else {self.input_name: tensor}
+
+        target = self.artifact(weights, int8=True)
+        quantize_static(
+            str(fp32), str(target), Reader(),
+            quant_format=QuantFormat.QDQ,
+            per_channel=True,
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+        )
+        # Keep the class names and image size ultralytics stores in the metadata
+        source, quantized = onnx.load(str(fp32)), onnx.load(str(target))
+        del quantized.metadata_props[:]
+        quantized.metadata_props.extend(source.metadata_props)
+        onnx.save(quantized, str(target))
+        return target
+
+
+class OpenVINOBackend(Backend):
+    """OpenVINO; INT8 uses NNCF post-training quantization"""
+
+    name = "openvino"
+
+    def artifact(self, weights, int8=False):
+        return Path(self._stem(weights, int8) + "_openvino_model")
+
+    def export(self, weights, imgsz, int8=False, calibration=None):
+        from ultralytics import YOLO
+
+        fp32 = self.artifact(weights)
+        if not fp32.exists():
+            exported = YOLO(weights).export(format="openvino", imgsz=imgsz, dynamic=True)
+            if Path(exported) != fp32:
+                shutil.move(exported, fp32)
+        if not int8:
+            return fp32
+
+        import nncf
+        import openvino as ov
+
+        xml = next(fp32.glob("*.xml"))
+        model = ov.Core().read_model(str(xml))
+        tensors = list(calibration_tensors(calibration, imgsz))
+        quantized = nncf.quantize(
+            model,
+            nncf.Dataset(tensors),
+            preset=nncf.QuantizationPreset.MIXED,
+            subset_size=len(tensors),
+        )
+
+        target = self.artifact(weights, int8=True)
+        target.mkdir(exist_ok=True)
+        ov.save_model(quantized, str(target / xml.name))
+        # ultralytics reads class names and image size from metadata.yaml
+        shutil.copy(fp32 / "metadata.yaml", target / "metadata.yaml")
+        return target
+
+
+class StubBackend(Backend):
+    """Synthetic detections at a fixed cost, with no ML runtime or weights.
+
+    For benchmarking the service on any machine; see benchmarks/stub.py.
+    """
+
+    name = "stub"
+
+    def artifact(self, weights, int8=False):
+        return Path(weights)
+
+    def export(self, weights, imgsz, int8=False, calibration=None):
+        return self.artifact(weights, int8)
+
+    def load(self, weights, int8=False):
+        from benchmarks.stub import StubModel
+
+        return StubModel()
+
+
+BACKENDS = {backend.name: backend for backend in (PyTorchBackend(), OnnxBackend(), OpenVINOBackend(), StubBackend())}
+
+
+def get_backend(name=BACKEND):
+    try:
+        return BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Unknown backend: {name} (expected one of {', '.join(BACKENDS)})")
+
+
+def load_model(weights, backend=BACKEND, int8=INT8):
+    """Load weights with the configured backend into an ultralytics model"""
+    return get_backend(backend).load(weights, int8)
+
+
+def box_iou(a, b):
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+    intersection = max(0.0, x2 - x1) * max(0.0, y2 - y1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - intersection
+    return intersection / union if union > 0 else 0.0
+
+
+def match_detections(reference, candidate, iou_threshold):
+    """Greedily pair boxes of the same class, highest confidence first.
+
+    Returns (pairs, unmatched reference boxes, unmatched candidate boxes).
+    """
+    remaining = list(candidate)
+    pairs = []
+    unmatched = []
+    for detection in sorted(reference, key=lambda d: d["confidence"], reverse=True):
+        best, best_iou = None, iou_threshold
+        for other in remaining:
+            if other["class"] == detection["class"]:
+                iou = box_iou(detection["bbox"], other["bbox"])
+                if iou >= best_iou:
+                    best, best_iou = other, iou
+        if best is None:
+            unmatched.append(detection)
+        else:
+            remaining.remove(best)
+            pairs.append((detection, best, best_iou))
+    return pairs, unmatched, remaining
+
+
+def parity_check(weights, backend, int8, images, imgsz, iou_threshold=0.5, conf_tolerance=0.05):
+    """Compare a backend's detections with PyTorch on a folder of images.
+
+    Boxes must pair up by class with IoU >= iou_threshold and confidences
+    within conf_tolerance. Unpaired boxes only count as failures when they
+    are clearly above the confidence threshold, since borderline boxes can
+    legitimately flip between runtimes.
+    """
+    reference_model = load_model(weights, "pytorch")
+    candidate_model = load_model(weights, backend, int8)
+    paths = list_images(images)
+    if not paths:
+        raise ValueError(f"No images found in {images}")
+
+    failures = 0
+    boxes = 0
+    worst_conf = 0.0
+    worst_iou = 1.0
+    for path in paths:
+        image = cv2.imread(str(path))
+        if image is None:
+            continue
+        reference = extract_detections(reference_model(image, imgsz=imgsz, verbose=False)[0], reference_model.names)
+        candidate = extract_detections(candidate_model(image, imgsz=imgsz, verbose=False)[0], candidate_model.names)
+
+        pairs, missing, extra = match_detections(reference, candidate, iou_threshold)
+        borderline = CONF_THRESHOLD + conf_tolerance
+        missing = [d for d in missing if d["confidence"] >= borderline]
+        extra = [d for d in extra if d["confidence"] >= borderline]
+        conf_diffs = [abs(a["confidence"] - b["confidence"]) for a, b, _ in pairs]
+        boxes += len(reference)
+        if pairs:
+            worst_conf = max(worst_conf, max(conf_diffs))
+            worst_iou = min(worst_iou, min(iou for _, _, iou in pairs))
+
+        if missing or extra or any(diff > conf_tolerance for diff in conf_diffs):
+            failures += 1
+            print(f"{path}: {len(pairs)} matched, {len(missing)} missing, {len(extra)} extra, "
+                  f"max confidence difference {max(conf_diffs, default=0.0):.3f}")
+
+    print(f"{len(paths)} images, {boxes} reference boxes, {failures} mismatched images, "
+          f"max confidence difference {worst_conf:.3f}, min IoU {worst_iou:.3f}")
+    return failures == 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export and verify inference backends")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export = subparsers.add_parser("export", help="Convert the weights for a backend")
+    parity = subparsers.add_parser("parity", help="Check a backend's detections against PyTorch")
+    for sub in (export, parity):
+        sub.add_argument("--backend", choices=list(BACKENDS), default=BACKEND)
+        sub.add_argument("--weights", default="yolov8n.pt")
+        sub.add_argument("--imgsz", type=int, default=640)
+        sub.add_argument("--int8", action="store_true")
+    export.add_argument("--calibration", help="Folder of representative images for INT8 quantization")
+    parity.add_argument("--images", required=True)
+    parity.add_argument("--iou", type=float, default=0.5)
+    parity.add_argument("--conf-tolerance", type=float, default=0.05)
+
+    args = parser.parse_args()
+    if args.command == "export":
+        if args.int8 and not args.calibration:
+            parser.error("--int8 needs --calibration")
+        print(get_backend(args.backend).export(args.weights, args.imgsz, args.int8, args.calibration))
+    elif args.command == "parity":
+        ok = parity_check(args.weights, args.backend, args.int8, args.images, args.imgsz, args.iou, args.conf_tolerance)
+        sys.exit(0 if ok else 1)
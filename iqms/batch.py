@@ -0,0 +1,283 @@
+# batch.py
+"""Headless inspection of a directory of images.
+
+Usage:
+    python batch.py DIR [--chamber-pattern REGEX | --chamber NAME] [--commit-every N] [--model NAME]
+                        [--tiled | --no-tiled] [--tile-size N] [--tile-overlap N] [--tile-batch N]
+
+Images are read and decoded in parallel, run through the same batched
+inference as main2.py (crops only, for chambers with a region-of-interest
+profile, and overlapping tiles for large photos) and written to ml_app.db
+in large transactions.
+Files already recorded (by image path) are skipped, so an interrupted run
+can simply be started again. Each detection is timestamped with the
+file's modification time. Because those paths point into the archive
+rather than at content-addressed originals, main2.py reuses their
+detections but never their image_path.
+"""
+import argparse
+import asyncio
+import functools
+import os
+import re
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from sqlalchemy import select
+
+from database import engine, Detection, DetectionBox
+from inference import BatchInferenceEngine, MAX_BATCH_SIZE, MAX_WAIT_MS
+from workers import WorkerPool
+from model_registry import MODEL_VERSIONS, DEFAULT_MODEL
+from imaging import decode_image
+from result_cache import ResultCache
+from rollups import rollup_increments, apply_increments
+from video import pipelined
+from roi import ProfileStore, infer_rois, profile_params
+from tiling import tiling_for, infer_tiles, TILE_SIZE, TILE_OVERLAP, TILE_BATCH_SIZE
+
+BATCH_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp", ".webp", ".tif", ".tiff"}
+# First "_"-separated token of the file name, after an optional capture_ prefix
+CHAMBER_PATTERN = r"^(?:capture_)?([^_]+)"
+COMMIT_EVERY = 500
+DECODE_WORKERS = os.cpu_count() or 4
+REPORT_INTERVAL = 1.0
+
+
+def find_images(directory):
+    return sorted(p for p in directory.rglob("*") if p.suffix.lower() in BATCH_EXTENSIONS and p.is_file())
+
+
+def chamber_from_filename(path, pattern):
+    match = pattern.search(path.stem)
+    return match.group(1) if match else path.stem
+
+
+def recorded_paths(directory):
+    """Image paths under directory that already have a Detection row"""
+    prefix = str(directory) + os.sep
+    with engine.connect() as conn:
+        return set(conn.execute(
+            select(Detection.image_path)
+            .where(Detection.image_path >= prefix)
+            .where(Detection.image_path < prefix + "\U0010ffff")
+        ).scalars())
+
+
+def load_image(path, result_cache, params=None, tiling=None):
+    """Read, decode and hash one file; runs on the decode threads.
+
+    Without params, the tile settings are part of the key only when the
+    image is large enough to be tiled.
+    """
+    data = path.read_bytes()
+    timestamp = datetime.fromtimestamp(path.stat().st_mtime, timezone.utc).replace(tzinfo=None)
+    image = decode_image(data)
+    if params is None and tiling is not None and tiling.applies(image):
+        params = tiling.params()
+    return result_cache.key(data, params), image, timestamp
+
+
+def insert_detections(rows):
+    """Insert detections with their boxes and rollups in one transaction.
+
+    Detections go in as one multi-row statement that returns their ids in
+    parameter order, and boxes as a single executemany.
+    """
+    detections = Detection.__table__
+    boxes = DetectionBox.__table__
+    with engine.begin() as conn:
+        ids = conn.execute(
+            detections.insert().returning(detections.c.id, sort_by_parameter_order=True), rows
+        ).scalars().all()
+
+        box_rows = []
+        for detection_id, row in zip(ids, rows):
+            for detection in row["detections"]:
+                x1, y1, x2, y2 = detection["bbox"]
+                box_rows.append({
+                    "detection_id": detection_id,
+                    "chamber_number": row["chamber_number"],
+                    "timestamp": row["timestamp"],
+                    "class_name": detection["class"],
+                    "confidence": detection["confidence"],
+                    "x1": x1, "y1": y1, "x2": x2, "y2": y2,
+                })
+        if box_rows:
+            conn.execute(boxes.insert(), box_rows)
+
+        apply_increments(conn, rollup_increments(
+            (row["chamber_number"], row["timestamp"], row["detections"]) for row in rows
+        ))
+
+
+class Progress:
+    def __init__(self, total):
+        self.total = total
+        self.inspected = 0
+        self.failed = 0
+        self.started = time.perf_counter()
+        self._reported = self.started
+
+    def update(self, failed=False):
+        if failed:
+            self.failed += 1
+        else:
+            self.inspected += 1
+        now = time.perf_counter()
+        if now - self._reported >= REPORT_INTERVAL:
+            self._reported = now
+            self.report()
+
+    def report(self, end="\r"):
+        elapsed = time.perf_counter() - self.started
+        rate = self.inspected / elapsed if elapsed else 0.0
+        done = self.inspected + self.failed
+        print(f"{done}/{self.total} images  {rate:.1f} images/s  {self.failed} failed",
+              end=end, file=sys.stderr, flush=True)
+
+
+async def run_batch(directory, chamber_pattern=CHAMBER_PATTERN, chamber=None, commit_every=COMMIT_EVERY,
+                    model=DEFAULT_MODEL, decode_workers=DECODE_WORKERS, tiled=None, tile_size=TILE_SIZE,
+                    tile_overlap=TILE_OVERLAP, tile_batch=TILE_BATCH_SIZE):
+    directory = Path(directory).resolve()
+    pattern = re.compile(chamber_pattern)
+    tiling = tiling_for(tiled, size=tile_size, overlap=tile_overlap, batch_size=tile_batch)
+    paths = find_images(directory)
+    recorded = recorded_paths(directory)
+    todo = [path for path in paths if str(path) not in recorded]
+    print(f"{len(paths)} images found, {len(paths) - len(todo)} already recorded, {len(todo)} to inspect")
+    if not todo:
+        return 0
+
+    worker_pool = WorkerPool(io_workers=decode_workers)
+    # Load the model up front so the reported rate is inspection only
+    loading = time.perf_counter()
+    await worker_pool.warm_up(model)
+    print(f"Model {model} loaded in {time.perf_counter() - loading:.1f}s")
+    # One engine per input and batch size: full frames, crops of chambers
+    # with a profile and tiles
+    engines = {}
+
+    def get_engine(imgsz=None, max_batch_size=MAX_BATCH_SIZE):
+        if (imgsz, max_batch_size) not in engines:
+            engines[(imgsz, max_batch_size)] = BatchInferenceEngine(
+                functools.partial(worker_pool.predict, model=model, imgsz=imgsz),
+                max_batch_size=max_batch_size,
+                max_wait_ms=MAX_WAIT_MS,
+                max_concurrency=worker_pool.workers,
+            )
+        return engines[(imgsz, max_batch_size)]
+
+    profiles = ProfileStore()
+    # Same content hash as main2.py, so the web app can reuse these results
+    result_cache = ResultCache(worker_pool.model_params(model), max_entries=0)
+    # Enough images in flight to keep the decoders and full batches busy
+    depth = max(decode_workers, MAX_BATCH_SIZE * worker_pool.workers) * 2
+
+    async def source():
+        for path in todo:
+            yield path
+
+    async def load(path):
+        chamber_number = chamber or chamber_from_filename(path, pattern)
+        try:
+            profile = await worker_pool.run_io(profiles.get, chamber_number)
+            # Same cache key parameters as main2.py
+            params = profile_params(profile)
+            item_tiling = tiling if profile is None else None
+            return path, chamber_number, profile, await worker_pool.run_io(
+                load_image, path, result_cache, params, item_tiling
+            )
+        except Exception as e:
+            return path, chamber_number, None, e
+
+    async def infer(item):
+        path, chamber_number, profile, loaded = item
+        if isinstance(loaded, Exception):
+            return path, loaded
+        content_hash, image, timestamp = loaded
+        try:
+            if profile is not None:
+                detections = await infer_rois(get_engine(profile.imgsz), image, profile.rois)
+            elif tiling is not None and tiling.applies(image):
+                detections = await infer_tiles(get_engine(tiling.size, tiling.batch_size), image, tiling,
+                                               worker_pool.run_io)
+            else:
+                detections = await get_engine().infer(image)
+        except Exception as e:
+            return path, e
+        return path, {
+            "chamber_number": chamber_number,
+            "timestamp": timestamp,
+            "image_path": str(path),
+            "detections": detections,
+            "content_hash": content_hash,
+        }
+
+    progress = Progress(len(todo))
+    rows = []
+    flushing = None
+    try:
+        async for path, row in pipelined(source(), [load, infer], depth):
+            if isinstance(row, Exception):
+                print(f"\nSkipping {path}: {row}", file=sys.stderr)
+                progress.update(failed=True)
+                continue
+            rows.append(row)
+            progress.update()
+
+            if len(rows) >= commit_every:
+                # Write this transaction while the next rows are being inferred
+                if flushing is not None:
+                    await flushing
+                flushing = asyncio.ensure_future(worker_pool.run_io(insert_detections, rows))
+                rows = []
+
+        if flushing is not None:
+            await flushing
+        if rows:
+            await worker_pool.run_io(insert_detections, rows)
+    finally:
+        progress.report(end="\n")
+        for inference_engine in engines.values():
+            await inference_engine.stop()
+        worker_pool.shutdown()
+    return progress.inspected
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect a directory of images into ml_app.db")
+    parser.add_argument("directory")
+    parser.add_argument("--chamber-pattern", default=CHAMBER_PATTERN,
+                        help="Regex whose first group is the chamber number, searched in the file name")
+    parser.add_argument("--chamber", help="Use this chamber number for every image")
+    parser.add_argument("--commit-every", type=int, default=COMMIT_EVERY, help="Rows per transaction")
+    parser.add_argument("--decode-workers", type=int, default=DECODE_WORKERS)
+    parser.add_argument("--model", choices=list(MODEL_VERSIONS), default=DEFAULT_MODEL,
+                        help="Model version, see IQMS_MODELS")
+    parser.add_argument("--tiled", action=argparse.BooleanOptionalAction, default=None,
+                        help="Force tiled inference on or off (default: tile large images, see IQMS_TILE_MIN_SIDE)")
+    parser.add_argument("--tile-size", type=int, default=TILE_SIZE)
+    parser.add_argument("--tile-overlap", type=int, default=TILE_OVERLAP)
+    parser.add_argument("--tile-batch", type=int, default=TILE_BATCH_SIZE, help="Tiles per model call")
+
+    args = parser.parse_args()
+    if not os.path.isdir(args.directory):
+        parser.error(f"Not a directory: {args.directory}")
+    if not 0 <= args.tile_overlap < args.tile_size:
+        parser.error("--tile-overlap must be at least 0 and smaller than --tile-size")
+    asyncio.run(run_batch(
+        args.directory,
+        chamber_pattern=args.chamber_pattern,
+        chamber=args.chamber,
+        commit_every=max(1, args.commit_every),
+        model=args.model,
+        tiled=args.tiled,
+        tile_size=args.tile_size,
+        tile_overlap=args.tile_overlap,
+        tile_batch=args.tile_batch,
+        decode_workers=max(1, args.decode_workers),
+    ))
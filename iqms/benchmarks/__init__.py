@@ -0,0 +1,25 @@
+# benchmarks
+"""Reproducible benchmarks for the inspection service.
+
+Run from the iqms directory:
+
+    python -m benchmarks images DIR [--count N] [--size 1280x960]
+    python -m benchmarks micro [--save FILE] [--baseline FILE]
+    python -m benchmarks load [--endpoint upload|capture] [--concurrency N] [--requests N]
+                              [--url URL] [--save FILE] [--baseline FILE]
+    python -m benchmarks compare RESULTS BASELINE [--threshold 0.1]
+
+Images are generated synthetically from a fixed seed, and by default the
+model is replaced by the "stub" backend, which returns synthetic boxes at a
+fixed cost, so results are comparable across runs on any machine without
+weights or network access. Pass --real-model to benchmark the configured
+model instead.
+
+``micro`` times single pipeline steps (decode, detection extraction,
+rendering, database inserts) in-process. ``load`` starts main2.py with
+uvicorn against a scratch database, unless --url points at a running
+server, and drives /upload or /capture with concurrent clients.
+Both report throughput, p50/p95/p99 latency and memory as JSON; with
+--baseline the run is compared against an earlier --save and the exit
+status is 1 if anything regressed by more than --threshold.
+"""
@@ -0,0 +1,154 @@
+# benchmarks/__main__.py
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+from benchmarks import report
+from benchmarks.synthetic import parse_size, write_images, synthetic_jpegs, IMAGE_SIZE, SEED
+
+
+def _size(text):
+    try:
+        return parse_size(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Expected WIDTHxHEIGHT, got {text!r}")
+
+
+def finish(args, doc):
+    """Print, save and compare a run; returns the exit status"""
+    report.print_results(doc)
+    if args.save:
+        report.save(doc, args.save)
+        print(f"Saved {args.save}")
+    if not args.baseline:
+        return 0
+    baseline = report.load(args.baseline)
+    return compare(doc, baseline, args.threshold)
+
+
+def compare(doc, baseline, threshold):
+    print(f"\nCompared with {baseline.get('created', 'baseline')}:")
+    for difference in report.environment_differences(doc, baseline):
+        print(f"  environment differs, {difference}")
+    ok = report.print_comparison(report.compare(doc, baseline, threshold), threshold)
+    return 0 if ok else 1
+
+
+def run_micro(args):
+    # Database benchmarks write to a scratch database, set before database.py is imported
+    workdir = tempfile.TemporaryDirectory(prefix="iqms-bench-")
+    os.environ["IQMS_DATABASE_URL"] = f"sqlite:///{Path(workdir.name) / 'bench.db'}"
+    try:
+        from benchmarks.micro import run_micro as micro
+
+        if args.real_model:
+            import model_registry
+
+            model, model_name = model_registry.load(), model_registry.DEFAULT_MODEL
+        else:
+            from benchmarks.stub import StubModel
+
+            model, model_name = StubModel(), "stub"
+        results = micro(model, args.size, args.iterations, args.only)
+        rss, peak = report.process_memory()
+        doc = report.document("micro", results, {"process": {"rss_mb": rss, "peak_rss_mb": peak}}, {
+            "model": model_name,
+            "image_size": list(args.size),
+            "iterations": args.iterations,
+        })
+    finally:
+        workdir.cleanup()
+    return finish(args, doc)
+
+
+def run_load(args):
+    from benchmarks.load import Server, run_load as load
+
+    images = synthetic_jpegs(args.images, args.size)
+    server = None
+    url = args.url
+    if url is None:
+        server = Server(stub=not args.real_model).start()
+        url = server.url
+        print(f"Started {url} (pid {server.process.pid})")
+    server_pid = server.process.pid if server is not None else args.server_pid
+    try:
+        results = {}
+        offset = 0
+        for endpoint in args.endpoint:
+            results[endpoint] = asyncio.run(load(
+                url, endpoint, images, args.concurrency, args.requests, args.duration, args.warmup,
+                args.cache_hits, offset,
+            ))
+            offset += results[endpoint]["count"] + results[endpoint]["errors"] + args.warmup
+        memory = {}
+        if server_pid:
+            rss, peak = report.process_memory(server_pid)
+            memory["server"] = {"rss_mb": rss, "peak_rss_mb": peak}
+    finally:
+        if server is not None:
+            server.stop()
+    doc = report.document("load", results, memory, {
+        "model": "configured" if args.real_model or args.url else "stub",
+        "url": args.url,
+        "image_size": list(args.size),
+        "images": args.images,
+        "concurrency": args.concurrency,
+        "requests": args.requests,
+        "duration": args.duration,
+        "cache_hits": args.cache_hits,
+    })
+    return finish(args, doc)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Benchmark the inspection service")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    images = subparsers.add_parser("images", help="Write synthetic chamber photos to a directory")
+    images.add_argument("directory", type=Path)
+    images.add_argument("--count", type=int, default=100)
+    images.add_argument("--size", type=_size, default=IMAGE_SIZE, help="WIDTHxHEIGHT")
+    images.add_argument("--seed", type=int, default=SEED)
+
+    micro = subparsers.add_parser("micro", help="Time decode, extraction, rendering and database inserts")
+    micro.add_argument("--iterations", type=int, default=200)
+    micro.add_argument("--only", nargs="+", help="Run only these benchmarks")
+
+    load = subparsers.add_parser("load", help="Drive /upload and /capture with concurrent clients")
+    load.add_argument("--url", help="A running server to test instead of starting one (whose model is used)")
+    load.add_argument("--server-pid", type=int, help="Process id of the --url server, for its memory")
+    load.add_argument("--endpoint", nargs="+", choices=["upload", "capture"], default=["upload", "capture"])
+    load.add_argument("--concurrency", type=int, default=16)
+    load.add_argument("--requests", type=int, default=500, help="Requests per endpoint")
+    load.add_argument("--duration", type=float, help="Run each endpoint for this many seconds instead")
+    load.add_argument("--warmup", type=int, default=20, help="Untimed requests per endpoint")
+    load.add_argument("--images", type=int, default=16, help="Distinct synthetic photos to send")
+    load.add_argument("--cache-hits", action="store_true", help="Resend identical bytes so the result cache answers")
+
+    for sub in (micro, load):
+        sub.add_argument("--size", type=_size, default=IMAGE_SIZE, help="Photo size, WIDTHxHEIGHT")
+        sub.add_argument("--real-model", action="store_true", help="Use the configured model instead of the stub")
+        sub.add_argument("--save", help="Write the results to this JSON file")
+        sub.add_argument("--baseline", help="Compare with results saved earlier")
+        sub.add_argument("--threshold", type=float, default=report.REGRESSION_THRESHOLD,
+                         help="Relative change that counts as a regression")
+
+    comparison = subparsers.add_parser("compare", help="Compare two saved result files")
+    comparison.add_argument("results")
+    comparison.add_argument("baseline")
+    comparison.add_argument("--threshold", type=float, default=report.REGRESSION_THRESHOLD)
+
+    args = parser.parse_args()
+    if args.command == "images":
+        paths = write_images(args.directory, args.count, args.size, args.seed)
+        print(f"Wrote {len(paths)} images to {args.directory}")
+    elif args.command == "micro":
+        sys.exit(run_micro(args))
+    elif args.command == "load":
+        sys.exit(run_load(args))
+    elif args.command == "compare":
+        sys.exit(compare(report.load(args.results), report.load(args.baseline), args.threshold))
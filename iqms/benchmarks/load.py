@@ -0,0 +1,177 @@
+# benchmarks/load.py
+"""Async load generator for /upload and /capture.
+
+Each client sends requests back to back, so ``concurrency`` is the number
+of requests in flight. Every request carries different image bytes (see
+synthetic.unique_jpeg) unless cache hits are asked for, so the server's
+result cache doesn't turn the run into a cache benchmark.
+"""
+import asyncio
+import base64
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+
+import httpx
+
+from benchmarks.report import summarize
+from benchmarks.synthetic import unique_jpeg
+
+ENDPOINTS = ("upload", "capture")
+CONCURRENCY = 16
+REQUESTS = 500
+WARMUP_REQUESTS = 20
+CHAMBERS = 4
+REQUEST_TIMEOUT = 60.0
+# How long a started server may take to become ready
+SERVER_START_TIMEOUT = 120.0
+
+IQMS_DIR = Path(__file__).resolve().parent.parent
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class Server:
+    """main2.py under uvicorn in a subprocess, with a scratch database.
+
+    Originals are not saved, so the run only writes to the scratch
+    directory. With ``stub`` the model is the stub backend.
+    """
+
+    def __init__(self, stub=True, env=None):
+        self.port = _free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.stub = stub
+        self.env = env or {}
+        self.process = None
+        self._workdir = None
+
+    def start(self, timeout=SERVER_START_TIMEOUT):
+        self._workdir = tempfile.TemporaryDirectory(prefix="iqms-bench-")
+        env = {
+            **os.environ,
+            "IQMS_DATABASE_URL": f"sqlite:///{Path(self._workdir.name) / 'bench.db'}",
+            "IQMS_SAVE_ORIGINALS": "0",
+            "IQMS_PROFILES_DIR": str(Path(self._workdir.name) / "profiles"),
+            **self.env,
+        }
+        if self.stub:
+            env["IQMS_MODELS"] = "default=stub@stub"
+            env.pop("IQMS_DEFAULT_MODEL", None)
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main2:app", "--host", "127.0.0.1", "--port", str(self.port),
+             "--log-level", "warning"],
+            cwd=IQMS_DIR, env=env,
+        )
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"Server exited with status {self.process.returncode}")
+            try:
+                if httpx.get(f"{self.url}/readyz", timeout=2.0).status_code == 200:
+                    return self
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.2)
+        self.stop()
+        raise RuntimeError(f"Server was not ready after {timeout:.0f}s")
+
+    def stop(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        if self._workdir is not None:
+            self._workdir.cleanup()
+            self._workdir = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def build_request(endpoint, data, n, chambers=CHAMBERS):
+    """(path, httpx request kwargs) for the n-th request"""
+    chamber_number = f"C{n % chambers + 1}"
+    if endpoint == "upload":
+        return "/upload", {
+            "files": {"file": (f"bench_{n}.jpg", data, "image/jpeg")},
+            "data": {"chamber_number": chamber_number},
+        }
+    if endpoint == "capture":
+        image_data = "data:image/jpeg;base64," + base64.b64encode(data).decode()
+        return "/capture", {"data": {"image_data": image_data, "chamber_number": chamber_number}}
+    raise ValueError(f"Unknown endpoint: {endpoint} (expected one of {', '.join(ENDPOINTS)})")
+
+
+async def run_load(url, endpoint, images, concurrency=CONCURRENCY, requests=REQUESTS, duration=None,
+                   warmup=WARMUP_REQUESTS, cache_hits=False, offset=0):
+    """Drive one endpoint and return its summary.
+
+    Stops after ``requests`` requests, or after ``duration`` seconds if
+    that is given. ``offset`` keeps request bytes unique across runs
+    against the same server.
+    """
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=REQUEST_TIMEOUT) as client:
+        def request(n):
+            data = images[n % len(images)]
+            return build_request(endpoint, data if cache_hits else unique_jpeg(data, offset + n), n)
+
+        for n in range(warmup):
+            path, kwargs = request(n)
+            (await client.post(path, **kwargs)).raise_for_status()
+
+        latencies = []
+        statuses = Counter()
+        errors = 0
+        issued = warmup
+        total = warmup + requests
+        deadline = time.perf_counter() + duration if duration else None
+
+        async def client_loop():
+            nonlocal issued, errors
+            while True:
+                if deadline is not None:
+                    if time.perf_counter() >= deadline:
+                        return
+                elif issued >= total:
+                    return
+                n = issued
+                issued += 1
+                path, kwargs = request(n)
+                started = time.perf_counter()
+                try:
+                    response = await client.post(path, **kwargs)
+                except httpx.HTTPError as e:
+                    statuses[type(e).__name__] += 1
+                    errors += 1
+                    continue
+                statuses[str(response.status_code)] += 1
+                if response.status_code == 200:
+                    latencies.append(time.perf_counter() - started)
+                else:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client_loop() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    summary = summarize(latencies, elapsed, errors=errors)
+    summary["concurrency"] = concurrency
+    summary["statuses"] = dict(statuses)
+    return summary
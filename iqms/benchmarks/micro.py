@@ -0,0 +1,100 @@
+# benchmarks/micro.py
+"""In-process microbenchmarks of single pipeline steps.
+
+Each benchmark is timed call by call after a few warm-up calls, then run
+once more under tracemalloc for its peak Python allocation. Database
+benchmarks write to whatever IQMS_DATABASE_URL points at, so run them
+through ``python -m benchmarks micro``, which uses a scratch database.
+"""
+import time
+import tracemalloc
+from concurrent.futures import wait
+from datetime import datetime
+
+from benchmarks.report import summarize
+from benchmarks.synthetic import synthetic_jpegs, IMAGE_SIZE
+from database import new_detection
+from db_writer import GroupCommitWriter
+from imaging import decode_image
+from inference import extract_detections
+from rendering import render_detections
+from rollups import update_rollups
+from batch import insert_detections
+
+ITERATIONS = 200
+WARMUP = 5
+# Rows written per database benchmark call
+DB_ROWS = 100
+# Longest side of rendered thumbnails
+THUMBNAIL_SIZE = 320
+
+
+def measure(function, iterations=ITERATIONS, warmup=WARMUP, items=1):
+    """Time function() call by call; items is the work one call does, for throughput"""
+    for _ in range(warmup):
+        function()
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        call_started = time.perf_counter()
+        function()
+        latencies.append(time.perf_counter() - call_started)
+    summary = summarize(latencies, time.perf_counter() - started, items)
+
+    tracemalloc.start()
+    try:
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    summary["items"] = items
+    summary["alloc_peak_mb"] = peak / (1024 * 1024)
+    return summary
+
+
+def db_rows(detections, count=DB_ROWS):
+    timestamp = datetime.utcnow()
+    return [{
+        "chamber_number": f"C{i % 4 + 1}",
+        "timestamp": timestamp,
+        "detections": detections,
+        "image_path": None,
+    } for i in range(count)]
+
+
+def run_micro(model, size=IMAGE_SIZE, iterations=ITERATIONS, only=None):
+    """Run the microbenchmarks and return {name: summary}"""
+    data = synthetic_jpegs(1, size)[0]
+    image = decode_image(data)
+    result = model(image, verbose=False)[0]
+    detections = extract_detections(result, model.names)
+    writer = GroupCommitWriter(hooks=[update_rollups])
+
+    def group_commit():
+        futures = [writer.submit(new_detection(row["chamber_number"], row["detections"]))
+                   for row in db_rows(detections)]
+        wait(futures)
+        for future in futures:
+            future.result()
+
+    # name: (function, iterations, items per call)
+    benchmarks = {
+        "decode": (lambda: decode_image(data), iterations, 1),
+        "inference": (lambda: model(image, verbose=False), max(10, iterations // 10), 1),
+        "extract_detections": (lambda: extract_detections(result, model.names), iterations, 1),
+        "render_full": (lambda: render_detections(image, detections), iterations, 1),
+        "render_thumbnail": (lambda: render_detections(image, detections, size=THUMBNAIL_SIZE), iterations, 1),
+        "db_insert_bulk": (lambda: insert_detections(db_rows(detections)), max(10, iterations // 10), DB_ROWS),
+        "db_insert_group_commit": (group_commit, max(10, iterations // 10), DB_ROWS),
+    }
+
+    results = {}
+    try:
+        for name, (function, count, items) in benchmarks.items():
+            if only and name not in only:
+                continue
+            results[name] = measure(function, count, min(WARMUP, count), items)
+            print(f"{name}: {results[name]['throughput']:.1f}/s, p50 {results[name]['p50_ms']:.3f}ms")
+    finally:
+        writer.stop()
+    return results
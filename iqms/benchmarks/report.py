@@ -0,0 +1,163 @@
+# benchmarks/report.py
+"""Latency statistics, memory readings and baseline comparison"""
+import json
+import os
+import platform
+import sys
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+# A metric is a regression when it is this much worse than the baseline
+REGRESSION_THRESHOLD = 0.10
+
+# Metrics compared against a baseline; True when higher is better
+COMPARED_METRICS = {
+    "throughput": True,
+    "p50_ms": False,
+    "p95_ms": False,
+    "p99_ms": False,
+    "error_rate": False,
+    "alloc_peak_mb": False,
+    "rss_mb": False,
+    "peak_rss_mb": False,
+}
+
+
+def summarize(latencies, elapsed, items=1, errors=0):
+    """Throughput and latency percentiles for a list of per-operation seconds"""
+    count = len(latencies)
+    latencies_ms = np.asarray(latencies, dtype=np.float64) * 1000.0
+    summary = {
+        "count": count,
+        "errors": errors,
+        "error_rate": errors / (count + errors) if count + errors else 0.0,
+        "seconds": round(elapsed, 3),
+        "throughput": count * items / elapsed if elapsed > 0 else 0.0,
+    }
+    if count:
+        p50, p95, p99 = np.percentile(latencies_ms, [50, 95, 99])
+        summary.update({
+            "mean_ms": float(latencies_ms.mean()),
+            "p50_ms": float(p50),
+            "p95_ms": float(p95),
+            "p99_ms": float(p99),
+            "max_ms": float(latencies_ms.max()),
+        })
+    return summary
+
+
+def process_memory(pid="self"):
+    """(rss_mb, peak_rss_mb) of a process, or (None, None) if it can't be read"""
+    try:
+        status = Path(f"/proc/{pid}/status").read_text()
+    except OSError:
+        if pid != "self":
+            return None, None
+        import resource
+
+        # ru_maxrss is in kilobytes on Linux and bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return None, peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+    fields = dict(line.split(":", 1) for line in status.splitlines() if ":" in line)
+
+    def megabytes(name):
+        value = fields.get(name)
+        return int(value.split()[0]) / 1024 if value else None
+    return megabytes("VmRSS"), megabytes("VmHWM")
+
+
+def environment(**settings):
+    """Where and how a run happened, stored with its results"""
+    import cv2
+
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        **settings,
+    }
+
+
+def document(benchmark, results, memory, settings):
+    """A run's results; memory is {process: {"rss_mb": ..., "peak_rss_mb": ...}}"""
+    return {
+        "benchmark": benchmark,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "environment": environment(**settings),
+        "results": results,
+        "memory": memory,
+    }
+
+
+def save(doc, path):
+    Path(path).write_text(json.dumps(doc, indent=2, sort_keys=True) + "\n")
+
+
+def load(path):
+    return json.loads(Path(path).read_text())
+
+
+def compare(current, baseline, threshold=REGRESSION_THRESHOLD):
+    """Rows of (benchmark, metric, baseline, current, change, regressed).
+
+    change is the relative difference, positive when current is worse.
+    Only benchmarks and metrics present in both runs are compared.
+    """
+    rows = []
+    entries = {**current["results"], **current.get("memory", {})}
+    base_entries = {**baseline["results"], **baseline.get("memory", {})}
+    for name, result in entries.items():
+        base = base_entries.get(name)
+        if base is None:
+            continue
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            old, new = base.get(metric), result.get(metric)
+            if old is None or new is None:
+                continue
+            if old == 0:
+                change = 0.0 if new == 0 else float("inf")
+            else:
+                change = (new - old) / abs(old)
+            if higher_is_better:
+                change = -change
+            rows.append((name, metric, old, new, change, change > threshold))
+    return rows
+
+
+def environment_differences(current, baseline):
+    """Environment fields that differ between two runs, as "field: old -> new" strings"""
+    old, new = baseline.get("environment", {}), current.get("environment", {})
+    return [f"{key}: {old.get(key)} -> {new.get(key)}" for key in sorted(set(old) | set(new))
+            if old.get(key) != new.get(key)]
+
+
+def _format_number(value):
+    return f"{value:.4g}" if isinstance(value, float) else str(value)
+
+
+def print_results(doc):
+    print(f"{'benchmark':<28} {'throughput/s':>12} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for name, result in doc["results"].items():
+        print(f"{name:<28} {result['throughput']:>12.1f} {result.get('p50_ms', 0):>9.3f} "
+              f"{result.get('p95_ms', 0):>9.3f} {result.get('p99_ms', 0):>9.3f} {result.get('errors', 0):>7}")
+    for process, memory in doc.get("memory", {}).items():
+        readings = ", ".join(f"{key} {_format_number(value)}" for key, value in memory.items() if value is not None)
+        print(f"{process} memory: {readings or 'unavailable'}")
+
+
+def print_comparison(rows, threshold=REGRESSION_THRESHOLD):
+    """Print the comparison and return True if nothing regressed"""
+    regressions = 0
+    print(f"{'benchmark':<28} {'metric':<20} {'baseline':>10}    {'current':<10} {'worse by':>8}")
+    for name, metric, old, new, change, regressed in rows:
+        regressions += regressed
+        flag = "REGRESSED" if regressed else ("improved" if change < -threshold else "")
+        print(f"{name:<28} {metric:<20} {_format_number(old):>10} -> {_format_number(new):<10} "
+              f"{change * 100:+7.1f}% {flag}")
+    print(f"{len(rows)} metrics compared, {regressions} regressed by more than {threshold * 100:.0f}%")
+    return regressions == 0
@@ -0,0 +1,68 @@
+# benchmarks/stub.py
+"""A stand-in for the ultralytics model, used by the "stub" backend.
+
+It returns Results-like objects with synthetic boxes and sleeps for a
+fixed time per call and per image, like a model that releases the GIL
+while it runs. The boxes are derived from the pixels, so the same image
+always gives the same detections.
+"""
+import os
+import time
+import zlib
+
+import cv2
+import numpy as np
+
+from rollups import GOOD_CLASS, MISSING_CLASS
+
+# Simulated model cost (can be overridden through the environment)
+STUB_CALL_MS = float(os.environ.get("IQMS_STUB_CALL_MS", "10"))
+STUB_IMAGE_MS = float(os.environ.get("IQMS_STUB_IMAGE_MS", "5"))
+STUB_BOXES = int(os.environ.get("IQMS_STUB_BOXES", "12"))
+
+
+class StubBox:
+    """One box with the attributes extract_detections reads"""
+
+    __slots__ = ("cls", "conf", "xyxy")
+
+    def __init__(self, cls, conf, xyxy):
+        self.cls = np.float32(cls)
+        self.conf = np.float32(conf)
+        self.xyxy = np.array([xyxy], dtype=np.float32)
+
+
+class StubResult:
+    def __init__(self, boxes, names, orig_shape):
+        self.boxes = boxes
+        self.names = names
+        self.orig_shape = orig_shape
+
+
+class StubModel:
+    names = {0: MISSING_CLASS, 1: GOOD_CLASS}
+
+    def __init__(self, call_ms=STUB_CALL_MS, image_ms=STUB_IMAGE_MS, boxes=STUB_BOXES):
+        self.call_ms = call_ms
+        self.image_ms = image_ms
+        self.boxes = boxes
+
+    def __call__(self, source, imgsz=640, verbose=True, **kwargs):
+        sources = source if isinstance(source, (list, tuple)) else [source]
+        images = [cv2.imread(str(s)) if isinstance(s, (str, os.PathLike)) else s for s in sources]
+        time.sleep((self.call_ms + self.image_ms * len(images)) / 1000.0)
+        return [self._result(image) for image in images]
+
+    predict = __call__
+
+    def _result(self, image):
+        height, width = image.shape[:2]
+        rng = np.random.default_rng(zlib.crc32(np.ascontiguousarray(image[::16, ::16]).data))
+        side = max(2.0, min(width, height) * 0.06)
+        boxes = []
+        for _ in range(self.boxes):
+            x = rng.uniform(0, max(1.0, width - side))
+            y = rng.uniform(0, max(1.0, height - side))
+            cls = 0 if rng.random() < 0.2 else 1
+            boxes.append(StubBox(cls, rng.uniform(0.3, 0.99), [x, y, x + side, y + side]))
+        return StubResult(boxes, self.names, (height, width))
@@ -0,0 +1,79 @@
+# benchmarks/synthetic.py
+"""Synthetic chamber photos: a brushed metal plate with a grid of screw
+holes, some of them empty. The same seed always gives the same images."""
+import cv2
+import numpy as np
+
+SEED = 1234
+IMAGE_SIZE = (1280, 960)
+SCREW_ROWS = 3
+SCREW_COLUMNS = 4
+MISSING_RATE = 0.2
+
+
+def parse_size(text):
+    """Parse "WIDTHxHEIGHT" into (width, height)"""
+    width, _, height = text.lower().partition("x")
+    return int(width), int(height or width)
+
+
+def synthetic_image(size=IMAGE_SIZE, seed=SEED, rows=SCREW_ROWS, columns=SCREW_COLUMNS, missing_rate=MISSING_RATE):
+    """One BGR chamber photo"""
+    width, height = size
+    rng = np.random.default_rng(seed)
+
+    # Plate: grey gradient with horizontal brushing and sensor noise
+    gradient = np.linspace(150, 110, width, dtype=np.float32)[None, :]
+    brushing = rng.normal(0, 6, (height, 1)).astype(np.float32)
+    plate = np.clip(gradient + brushing + rng.normal(0, 4, (height, width)).astype(np.float32), 0, 255)
+    image = cv2.cvtColor(plate.astype(np.uint8), cv2.COLOR_GRAY2BGR)
+
+    radius = max(4, min(width // (columns * 5), height // (rows * 5)))
+    for row in range(rows):
+        for column in range(columns):
+            x = int((column + 0.5) * width / columns + rng.integers(-radius, radius + 1) // 2)
+            y = int((row + 0.5) * height / rows + rng.integers(-radius, radius + 1) // 2)
+            # Hole
+            cv2.circle(image, (x, y), radius, (40, 40, 40), -1, cv2.LINE_AA)
+            if rng.random() < missing_rate:
+                continue
+            # Screw head with a cross slot
+            cv2.circle(image, (x, y), radius - 2, (185, 185, 190), -1, cv2.LINE_AA)
+            cv2.circle(image, (x, y), radius - 2, (90, 90, 95), 2, cv2.LINE_AA)
+            angle = rng.uniform(0, np.pi / 2)
+            dx, dy = int(np.cos(angle) * radius * 0.6), int(np.sin(angle) * radius * 0.6)
+            cv2.line(image, (x - dx, y - dy), (x + dx, y + dy), (60, 60, 60), 3, cv2.LINE_AA)
+            cv2.line(image, (x + dy, y - dx), (x - dy, y + dx), (60, 60, 60), 3, cv2.LINE_AA)
+    return image
+
+
+def synthetic_jpegs(count, size=IMAGE_SIZE, seed=SEED, quality=90):
+    """count distinct JPEG-encoded photos"""
+    encoded = []
+    for i in range(count):
+        ok, buffer = cv2.imencode(".jpg", synthetic_image(size, seed + i), [cv2.IMWRITE_JPEG_QUALITY, quality])
+        if not ok:
+            raise ValueError("Could not encode synthetic image")
+        encoded.append(buffer.tobytes())
+    return encoded
+
+
+def unique_jpeg(data, n):
+    """The same JPEG with a comment segment holding n.
+
+    The decoded image is unchanged but the bytes differ, so repeated
+    requests don't hit the server's result cache.
+    """
+    comment = f"iqms-benchmark {n}".encode()
+    return data[:2] + b"\xff\xfe" + (len(comment) + 2).to_bytes(2, "big") + comment + data[2:]
+
+
+def write_images(directory, count, size=IMAGE_SIZE, seed=SEED, chambers=4):
+    """Write count photos named like batch.py expects (CHAMBER_N.jpg)"""
+    directory.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for i, data in enumerate(synthetic_jpegs(count, size, seed)):
+        path = directory / f"C{i % chambers + 1}_{i:05d}.jpg"
+        path.write_bytes(data)
+        paths.append(path)
+    return paths
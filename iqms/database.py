@@ -1,12 +1,43 @@
 # database.py
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, JSON
+from sqlalchemy import (
+    create_engine, event, inspect, text, Column, Integer, String, Float, DateTime, JSON,
+    ForeignKey, Index, UniqueConstraint,
+)
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.pool import QueuePool
 from datetime import datetime
+from pathlib import Path
+import os
 
-# Create database engine
-SQLALCHEMY_DATABASE_URL = "sqlite:///./ml_app.db"
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+# Create database engine (the URL can be overridden through the environment).
+# ml_app.db lives next to this file, so the server, batch.py and the GUIs
+# share it whatever directory they are started from
+DATABASE_PATH = Path(__file__).resolve().parent / "ml_app.db"
+SQLALCHEMY_DATABASE_URL = os.environ.get("IQMS_DATABASE_URL", f"sqlite:///{DATABASE_PATH}")
+# check_same_thread is disabled because sessions are used from worker threads.
+# The pool class is explicit: SQLAlchemy 1.4 defaults file databases to
+# NullPool, which doesn't accept pool_size/max_overflow
+engine = create_engine(
+    SQLALCHEMY_DATABASE_URL,
+    connect_args={"check_same_thread": False},
+    poolclass=QueuePool,
+    pool_size=8,
+    max_overflow=8,
+    pool_pre_ping=True,
+)
+
+@event.listens_for(engine, "connect")
+def configure_sqlite(dbapi_connection, connection_record):
+    # WAL lets readers run alongside the writer. FULL sync fsyncs the WAL on
+    # every commit, so an acknowledged commit survives a power loss; the
+    # group commit writer spreads that one fsync over a whole batch
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=FULL")
+    cursor.execute("PRAGMA busy_timeout=5000")
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.close()
 
 # Create SessionLocal class
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
@@ -23,9 +54,122 @@ class Detection(Base):
     image_path = Column(String)
     result_image_path = Column(String)
     detections = Column(JSON)  # Stores detection results as JSON
+    content_hash = Column(String, index=True)  # Hash of image bytes + model identity
+
+    boxes = relationship("DetectionBox", back_populates="detection", cascade="all, delete-orphan")
+
+    __table_args__ = (
+        # Keyset pagination and time filters, with and without a chamber
+        Index("ix_detections_chamber_timestamp", "chamber_number", "timestamp"),
+        Index("ix_detections_timestamp", "timestamp"),
+    )
+
+class DetectionBox(Base):
+    """One row per detected box, so analytics can run as indexed SQL.
+
+    chamber_number and timestamp are copied from the parent detection so
+    the composite indexes can answer per-class queries without a join.
+    """
+    __tablename__ = "detection_boxes"
+
+    id = Column(Integer, primary_key=True)
+    detection_id = Column(Integer, ForeignKey("detections.id", ondelete="CASCADE"), nullable=False, index=True)
+    chamber_number = Column(String)
+    timestamp = Column(DateTime)
+    class_name = Column(String, nullable=False)
+    confidence = Column(Float)
+    x1 = Column(Float)
+    y1 = Column(Float)
+    x2 = Column(Float)
+    y2 = Column(Float)
+
+    detection = relationship("Detection", back_populates="boxes")
+
+    __table_args__ = (
+        Index("ix_detection_boxes_class_timestamp", "class_name", "timestamp"),
+        Index("ix_detection_boxes_chamber_class", "chamber_number", "class_name"),
+    )
+
+class QualityRollup(Base):
+    """Per-chamber inspection totals for one hour or day bucket.
+
+    Rows are updated incrementally as detections are written, so quality
+    statistics never have to scan the detections table.
+    """
+    __tablename__ = "quality_rollups"
+
+    id = Column(Integer, primary_key=True)
+    bucket = Column(String, nullable=False)  # "hour" or "day"
+    bucket_start = Column(DateTime, nullable=False)
+    chamber_number = Column(String, nullable=False)
+    inspections = Column(Integer, nullable=False, default=0)
+    defective = Column(Integer, nullable=False, default=0)  # Inspections with a missing screw
+    good_count = Column(Integer, nullable=False, default=0)
+    missing_count = Column(Integer, nullable=False, default=0)
+    other_count = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        UniqueConstraint("bucket", "chamber_number", "bucket_start", name="uq_quality_rollups_bucket"),
+        Index("ix_quality_rollups_bucket_start", "bucket", "bucket_start"),
+    )
+
+class ChamberProfile(Base):
+    """Regions of interest for one chamber type.
+
+    rois is a list of [x1, y1, x2, y2] boxes given as fractions (0-1) of the
+    image width and height, so a profile holds at any capture resolution.
+    Only these crops are sent to the model, at imgsz instead of full size.
+    """
+    __tablename__ = "chamber_profiles"
+
+    chamber_number = Column(String, primary_key=True)
+    rois = Column(JSON, nullable=False)
+    imgsz = Column(Integer)  # Model input size for the crops; NULL uses ROI_IMGSZ
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+def make_boxes(chamber_number, timestamp, detections):
+    """Build DetectionBox rows from a detections JSON list"""
+    boxes = []
+    for detection in detections or []:
+        x1, y1, x2, y2 = detection["bbox"]
+        boxes.append(DetectionBox(
+            chamber_number=chamber_number,
+            timestamp=timestamp,
+            class_name=detection["class"],
+            confidence=detection["confidence"],
+            x1=x1, y1=y1, x2=x2, y2=y2,
+        ))
+    return boxes
+
+def new_detection(chamber_number, detections, **fields):
+    """Create a Detection together with its per-box rows.
+
+    The boxes hang off the relationship, so they are inserted in the same
+    transaction as the detection itself.
+    """
+    timestamp = fields.pop("timestamp", None) or datetime.utcnow()
+    return Detection(
+        chamber_number=chamber_number,
+        timestamp=timestamp,
+        detections=detections,
+        boxes=make_boxes(chamber_number, timestamp, detections),
+        **fields
+    )
+
+def add_missing_columns(table):
+    """Add columns and indexes that were introduced after a table was created"""
+    existing = {column["name"] for column in inspect(engine).get_columns(table.name)}
+    with engine.begin() as conn:
+        for column in table.columns:
+            if column.name not in existing:
+                column_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+    for index in table.indexes:
+        index.create(bind=engine, checkfirst=True)
 
 # Create tables
 Base.metadata.create_all(bind=engine)
+add_missing_columns(Detection.__table__)
 
 # Dependency to get DB session
 def get_db():
@@ -0,0 +1,152 @@
+# db_writer.py
+import asyncio
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from database import SessionLocal
+from metrics import DB_COMMIT_LATENCY, DB_COMMIT_ROWS, DB_WRITE_FAILURES, QUEUE_DEPTH
+
+# Group commit limits (can be overridden through the environment)
+WRITER_MAX_BATCH = int(os.environ.get("IQMS_WRITER_MAX_BATCH", "64"))
+WRITER_MAX_DELAY_MS = float(os.environ.get("IQMS_WRITER_MAX_DELAY_MS", "5"))
+
+
+class GroupCommitWriter:
+    """Background thread that inserts ORM rows in group commits.
+
+    Rows submitted from any thread are collected until ``max_batch`` rows
+    are waiting or the oldest has waited ``max_delay_ms``, then written in a
+    single transaction. Each submitter gets a Future that resolves to its
+    row only after the transaction has committed, so the acknowledgement
+    means the row is durable. If a group fails, its rows are retried one
+    per transaction so a single bad row does not fail the others.
+
+    ``hooks`` are called as hook(session, rows) just before each commit, so
+    derived data (e.g. rollups) is written in the same transaction.
+    """
+
+    def __init__(self, session_factory=SessionLocal, max_batch=WRITER_MAX_BATCH, max_delay_ms=WRITER_MAX_DELAY_MS,
+                 hooks=()):
+        self.session_factory = session_factory
+        self.hooks = list(hooks)
+        self.max_batch = max(1, int(max_batch))
+        self.max_delay_ms = max(0.0, float(max_delay_ms))
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+        # Stats
+        self._commits = 0
+        self._rows = 0
+        self._failed = 0
+        self._commit_total_ms = 0.0
+        QUEUE_DEPTH.labels("db_writer").set_function(self._queue.qsize)
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="iqms-db-writer", daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        """Flush everything that was submitted, then stop the thread"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join()
+
+    def submit(self, row):
+        """Queue a row for insertion and return a Future for the committed row"""
+        self.start()
+        future = Future()
+        self._queue.put((row, future))
+        return future
+
+    async def write(self, row):
+        """Async wrapper around submit for use from request handlers"""
+        return await asyncio.wrap_future(self.submit(row))
+
+    def _collect(self):
+        item = self._queue.get()
+        if item is None:
+            return None, True
+        batch = [item]
+        deadline = time.perf_counter() + self.max_delay_ms / 1000.0
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch, stopping = self._collect()
+            if batch:
+                self._commit(batch)
+
+    def _commit(self, batch):
+        started = time.perf_counter()
+        try:
+            self._insert([row for row, _ in batch])
+        except Exception:
+            # Retry rows individually so only the bad ones fail
+            for row, future in batch:
+                try:
+                    self._insert([row])
+                except Exception as e:
+                    self._failed += 1
+                    DB_WRITE_FAILURES.inc()
+                    future.set_exception(e)
+                else:
+                    self._record(1, started)
+                    future.set_result(row)
+            return
+
+        self._record(len(batch), started)
+        for row, future in batch:
+            future.set_result(row)
+
+    def _insert(self, rows):
+        session = self.session_factory(expire_on_commit=False)
+        try:
+            session.add_all(rows)
+            session.flush()
+            for hook in self.hooks:
+                hook(session, rows)
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            # Committed rows stay readable (id, defaults) after the session closes
+            session.close()
+
+    def _record(self, rows, started):
+        elapsed = time.perf_counter() - started
+        self._commits += 1
+        self._rows += rows
+        self._commit_total_ms += elapsed * 1000.0
+        DB_COMMIT_LATENCY.observe(elapsed)
+        DB_COMMIT_ROWS.observe(rows)
+
+    def stats(self):
+        return {
+            "max_batch": self.max_batch,
+            "max_delay_ms": self.max_delay_ms,
+            "queue_depth": self._queue.qsize(),
+            "commits": self._commits,
+            "rows": self._rows,
+            "failed": self._failed,
+            "avg_rows_per_commit": self._rows / self._commits if self._commits else 0.0,
+            "avg_commit_ms": self._commit_total_ms / self._commits if self._commits else 0.0,
+        }
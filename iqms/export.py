@@ -0,0 +1,35 @@
+# export.py
+import csv
+import io
+import json
+
+# Rows fetched and encoded per chunk
+EXPORT_CHUNK_ROWS = 1000
+
+
+def iter_chunks(cursor, chunk_size=EXPORT_CHUNK_ROWS):
+    """Yield lists of rows from a DB-API cursor using fetchmany"""
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        yield rows
+
+
+def csv_chunks(header, row_chunks):
+    """Encode chunks of rows as CSV text, one string per chunk"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    yield buffer.getvalue()
+    for rows in row_chunks:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(rows)
+        yield buffer.getvalue()
+
+
+def ndjson_chunks(fields, row_chunks):
+    """Encode chunks of rows as newline-delimited JSON objects"""
+    for rows in row_chunks:
+        yield "".join(json.dumps(dict(zip(fields, row)), default=str) + "\n" for row in rows)
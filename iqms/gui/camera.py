@@ -0,0 +1,90 @@
+# camera.py
+import collections
+import threading
+import time
+
+import cv2
+from PIL import Image
+
+CAMERA_INDEX = 0
+# Number of recent frames kept in memory
+RING_SIZE = 4
+# Live preview refresh interval (~15 fps)
+PREVIEW_INTERVAL_MS = 66
+# How long a capture waits for a just-opened camera to deliver its first frame
+FIRST_FRAME_TIMEOUT = 2.0
+
+
+class CameraService:
+    """Keeps the camera open and grabs frames on a background thread.
+
+    The device is opened once, so a capture is a read of the newest frame
+    from a small ring buffer instead of a device open plus auto-exposure
+    settle on every click.
+    """
+
+    def __init__(self, index=CAMERA_INDEX, ring_size=RING_SIZE):
+        self.index = index
+        self.frame_count = 0
+        self._frames = collections.deque(maxlen=ring_size)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._first_frame = threading.Event()
+        self._cap = None
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self):
+        """Open the camera and start grabbing; returns False if it can't be opened"""
+        if self.running:
+            return True
+        cap = cv2.VideoCapture(self.index)
+        if not cap.isOpened():
+            cap.release()
+            return False
+        self._cap = cap
+        self._stop.clear()
+        self._first_frame.clear()
+        self._thread = threading.Thread(target=self._run, name="camera-grabber", daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self):
+        if not self.running:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self._cap.release()
+        self._cap = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            ret, frame = self._cap.read()
+            if not ret:
+                time.sleep(0.01)
+                continue
+            with self._lock:
+                self._frames.append(frame)
+                self.frame_count += 1
+            self._first_frame.set()
+
+    def latest(self):
+        """Newest BGR frame, or None if nothing has been grabbed yet"""
+        with self._lock:
+            return self._frames[-1] if self._frames else None
+
+    def wait_for_frame(self, timeout=FIRST_FRAME_TIMEOUT):
+        """Newest frame, waiting up to timeout seconds for the first one after start()"""
+        if not self._first_frame.wait(timeout):
+            return None
+        return self.latest()
+
+
+def preview_frame(frame, size):
+    """Downscale a BGR frame and convert it to a PIL image for display"""
+    frame = cv2.resize(frame, size, interpolation=cv2.INTER_LINEAR)
+    return Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
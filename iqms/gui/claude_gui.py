@@ -4,10 +4,112 @@ import cv2
 from PIL import Image, ImageTk
 import sqlite3
 from tkinter import filedialog
-from ultralytics import YOLO
 import os
+import sys
+import queue
+import threading
 from datetime import datetime
 
+from camera import CameraService, preview_frame, PREVIEW_INTERVAL_MS
+
+# Shared modules live one directory up
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from video import FrameSampler, VideoDecoder, VIDEO_EXTENSIONS
+from model_registry import get_model, warm_up
+from roi import ProfileStore, detect_rois
+from rendering import draw_detections
+
+# Size of the blank frame used to warm up the model
+WARMUP_IMGSZ = 640
+# How often the Tk thread checks for finished inference jobs
+RESULT_POLL_MS = 50
+# Size of the image shown before and after inference
+DISPLAY_SIZE = (400, 300)
+# Video frames sent to the model per call
+VIDEO_BATCH_SIZE = 8
+
+
+class InferenceJob:
+    def __init__(self, fn, args):
+        self.fn = fn
+        self.args = args
+        self.cancelled = threading.Event()
+        # Status text set by long jobs, shown by the Tk thread
+        self.progress = None
+
+
+class InferenceWorker:
+    """Background thread that owns the YOLO model.
+
+    The model is loaded and warmed up on a blank frame when the worker
+    starts, so the first real inspection doesn't pay the lazy setup cost.
+    Jobs then run one at a time as fn(model, job, *args) and their results
+    go on a queue that the Tk thread polls with after().
+    """
+
+    def __init__(self, model_name=None, imgsz=WARMUP_IMGSZ):
+        self.model_name = model_name
+        self.imgsz = imgsz
+        self.model = None
+        self.ready = False
+        self._jobs = queue.Queue()
+        self.results = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="inference-worker", daemon=True)
+        self._thread.start()
+
+    def submit(self, fn, *args):
+        job = InferenceJob(fn, args)
+        self._jobs.put(job)
+        return job
+
+    def _run(self):
+        try:
+            # A named version from IQMS_MODELS, the default one if no name is given
+            self.model = get_model(self.model_name)
+            warm_up(self.model, self.imgsz)
+        except Exception as e:
+            self.results.put(('load', None, e))
+            return
+        self.ready = True
+        self.results.put(('ready', None, None))
+
+        while True:
+            job = self._jobs.get()
+            if job.cancelled.is_set():
+                continue
+            try:
+                self.results.put((job, job.fn(self.model, job, *job.args), None))
+            except Exception as e:
+                self.results.put((job, None, e))
+
+
+def count_classes(results):
+    """Return (missing, good) box counts for class 0 and class 1"""
+    class_counts = {0: 0, 1: 0}  # Initialize counters for both classes
+
+    for r in results:
+        boxes = r.boxes
+        for box in boxes:
+            cls = int(box.cls[0])
+            if cls in class_counts:
+                class_counts[cls] += 1
+
+    return class_counts[0], class_counts[1]
+
+
+def count_detections(detections, names):
+    """Return (missing, good) counts from a detections list, classes as in count_classes"""
+    missing = sum(1 for d in detections if d["class"] == names[0])
+    good = sum(1 for d in detections if d["class"] == names[1])
+    return missing, good
+
+
+def save_annotated(path, image, detections):
+    annotated = image.copy()
+    draw_detections(annotated, detections)
+    cv2.imwrite(path, annotated)
+
+
 class ScrewDetectionGUI:
     def __init__(self, root):
         self.root = root
@@ -18,7 +120,18 @@ class ScrewDetectionGUI:
         self.chamber_number = tk.StringVar()
         self.image_path = None
         self.captured_image = None
-        
+        self.current_job = None
+
+        # Region-of-interest profiles from the shared ml_app.db (see database.py)
+        self.profiles = ProfileStore()
+
+        # Camera stays open between captures
+        self.camera = CameraService()
+        self.preview_label = None
+        self.preview_count = -1
+        self.preview_id = None
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+
         # Create database and table
         self.create_database()
         
@@ -26,19 +139,14 @@ class ScrewDetectionGUI:
         self.main_frame = ttk.Frame(self.root, padding="10")
         self.main_frame.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
         
-        # Initialize loading label
-        self.loading_label = ttk.Label(self.main_frame, text="Loading YOLOv8n model...")
-        self.loading_label.grid(row=0, column=0, columnspan=2)
-        self.root.update()
+        # Model status shown below the main frame
+        self.status_label = ttk.Label(self.root, text="Loading YOLOv8n model...")
+        self.status_label.grid(row=1, column=0, sticky=tk.W, padx=10)
 
-        try:
-            # Initialize YOLO model (will download if not present)
-            self.model = YOLO('yolov8n.pt')
-            self.loading_label.destroy()
-            self.setup_initial_screen()
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to load model: {str(e)}")
-            self.loading_label.config(text="Error loading model")
+        # Load and warm up the YOLO model in the background (will download if not present)
+        self.worker = InferenceWorker()
+        self.setup_initial_screen()
+        self.poll_results()
 
     def create_database(self):
         conn = sqlite3.connect('screw_detection.db')
@@ -54,7 +162,33 @@ class ScrewDetectionGUI:
         conn.commit()
         conn.close()
 
+    def poll_results(self):
+        while True:
+            try:
+                job, result, error = self.worker.results.get_nowait()
+            except queue.Empty:
+                break
+            if job == 'ready':
+                self.status_label.config(text="Model ready")
+            elif job == 'load':
+                messagebox.showerror("Error", f"Failed to load model: {str(error)}")
+                self.status_label.config(text="Error loading model")
+            elif job is self.current_job and not job.cancelled.is_set():
+                self.current_job = None
+                if error is not None:
+                    self.hide_progress()
+                    messagebox.showerror("Error", f"An error occurred during inference: {str(error)}")
+                else:
+                    self.show_results(*result)
+        if self.current_job is not None and self.current_job.progress:
+            self.progress_label.config(text=self.current_job.progress)
+        self.root.after(RESULT_POLL_MS, self.poll_results)
+
     def setup_initial_screen(self):
+        # Clear previous widgets
+        for widget in self.main_frame.winfo_children():
+            widget.destroy()
+
         # Chamber number entry
         ttk.Label(self.main_frame, text="Enter Chamber Number:").grid(row=0, column=0, pady=10)
         chamber_entry = ttk.Entry(self.main_frame, textvariable=self.chamber_number)
@@ -74,34 +208,74 @@ class ScrewDetectionGUI:
         # Show image acquisition options
         ttk.Button(self.main_frame, text="Upload Image", command=self.upload_image).grid(row=0, column=0, pady=10, padx=5)
         ttk.Button(self.main_frame, text="Take Image", command=self.take_image).grid(row=0, column=1, pady=10, padx=5)
+        ttk.Button(self.main_frame, text="Inspect Video", command=self.upload_video).grid(row=0, column=2, pady=10, padx=5)
+
+        # Live camera preview
+        if self.camera.start():
+            if self.preview_id is not None:
+                self.root.after_cancel(self.preview_id)
+            self.preview_label = ttk.Label(self.main_frame)
+            self.preview_label.grid(row=1, column=0, columnspan=3, pady=10)
+            self.preview_count = -1
+            self.update_preview()
+
+    def update_preview(self):
+        # Stops once the preview label has been destroyed
+        if self.preview_label is None or not self.preview_label.winfo_exists():
+            self.preview_label = None
+            self.preview_id = None
+            return
+        # Only redraw when the grabber has a new frame
+        if self.camera.frame_count != self.preview_count:
+            frame = self.camera.latest()
+            if frame is not None:
+                self.preview_count = self.camera.frame_count
+                photo = ImageTk.PhotoImage(preview_frame(frame, DISPLAY_SIZE))
+                self.preview_label.config(image=photo)
+                self.preview_label.image = photo
+        self.preview_id = self.root.after(PREVIEW_INTERVAL_MS, self.update_preview)
 
     def upload_image(self):
         self.image_path = filedialog.askopenfilename(
             filetypes=[("Image files", "*.jpg *.jpeg *.png *.bmp *.gif *.tiff")]
         )
         if self.image_path:
+            self.captured_image = None
             self.show_inference_button()
 
+    def upload_video(self):
+        video_path = filedialog.askopenfilename(
+            filetypes=[("Video files", " ".join("*" + ext for ext in VIDEO_EXTENSIONS))]
+        )
+        if not video_path:
+            return
+
+        # Clear previous widgets
+        for widget in self.main_frame.winfo_children():
+            widget.destroy()
+
+        ttk.Label(self.main_frame, text=f"Video: {os.path.basename(video_path)}").grid(row=0, column=0, columnspan=2, pady=10)
+        self.inference_button = ttk.Button(self.main_frame, text="Run Video Inspection",
+                                           command=lambda: self.start_job(self.inspect_video, video_path))
+        self.inference_button.grid(row=1, column=0, columnspan=2, pady=10)
+
     def take_image(self):
-        cap = cv2.VideoCapture(0)
-        if not cap.isOpened():
+        # Newest frame from the camera's ring buffer, waiting briefly if it has just opened
+        frame = self.camera.wait_for_frame() if self.camera.start() else None
+        if frame is None:
             messagebox.showerror("Error", "Cannot access camera")
             return
-            
-        ret, frame = cap.read()
-        if ret:
-            self.captured_image = frame
-            # Save captured image temporarily
-            cv2.imwrite("temp_capture.jpg", frame)
-            self.image_path = "temp_capture.jpg"
-            self.show_inference_button()
-        
-        cap.release()
+
+        self.captured_image = frame
+        self.image_path = None
+        self.show_inference_button()
 
     def show_inference_button(self):
         # Display selected/captured image
-        img = Image.open(self.image_path)
-        img = img.resize((400, 300))
+        if self.captured_image is not None:
+            img = preview_frame(self.captured_image, DISPLAY_SIZE)
+        else:
+            img = Image.open(self.image_path).resize(DISPLAY_SIZE)
         photo = ImageTk.PhotoImage(img)
         
         # Clear previous widgets
@@ -114,47 +288,130 @@ class ScrewDetectionGUI:
         image_label.grid(row=0, column=0, columnspan=2, pady=10)
         
         # Add inference button
-        ttk.Button(self.main_frame, text="Run Inference", command=self.run_inference).grid(row=1, column=0, columnspan=2, pady=10)
+        self.inference_button = ttk.Button(self.main_frame, text="Run Inference", command=self.run_inference)
+        self.inference_button.grid(row=1, column=0, columnspan=2, pady=10)
 
     def run_inference(self):
+        # Captured frames go to the model as arrays, uploads as paths
+        image = self.captured_image if self.captured_image is not None else self.image_path
+        self.start_job(self.inspect, image)
+
+    def start_job(self, fn, source):
+        if self.current_job is not None:
+            return
+
+        # Show progress while the worker runs the model
+        self.inference_button.state(['disabled'])
+        self.progress_frame = ttk.Frame(self.main_frame)
+        self.progress_frame.grid(row=2, column=0, columnspan=2)
+        text = "Running inference..." if self.worker.ready else "Waiting for model to load..."
+        self.progress_label = ttk.Label(self.progress_frame, text=text)
+        self.progress_label.grid(row=0, column=0, columnspan=2)
+        progress = ttk.Progressbar(self.progress_frame, mode='indeterminate', length=200)
+        progress.grid(row=1, column=0, padx=5)
+        progress.start(10)
+        ttk.Button(self.progress_frame, text="Cancel", command=self.cancel_inference).grid(row=1, column=1, padx=5)
+
+        self.current_job = self.worker.submit(fn, self.chamber_number.get(), source)
+
+    def cancel_inference(self):
+        # A running model call can't be interrupted; its result is discarded instead
+        if self.current_job is not None:
+            self.current_job.cancelled.set()
+            self.current_job = None
+        self.hide_progress()
+
+    def hide_progress(self):
+        self.progress_frame.destroy()
+        self.inference_button.state(['!disabled'])
+
+    def inspect(self, model, job, chamber_number, image):
+        """Runs on the inference worker thread"""
+        profile = self.profiles.get(chamber_number)
+        if profile is not None:
+            # Only the chamber's regions of interest, at the profile's smaller size
+            if isinstance(image, str):
+                image = cv2.imread(image)
+                if image is None:
+                    raise ValueError("Could not read image")
+            [detections] = detect_rois(model, [image], profile)
+            missing_count, good_count = count_detections(detections, model.names)
+            if job.cancelled.is_set():
+                return None
+            self.save_results(chamber_number, missing_count, good_count, image)
+            save_annotated(f"results/{chamber_number}.jpg", image, detections)
+            return missing_count, good_count
+
+        # Run YOLO inference
+        results = model(image)
+        missing_count, good_count = count_classes(results)
+
+        # Don't record inspections the user cancelled
+        if job.cancelled.is_set():
+            return None
+
+        # Save results
+        self.save_results(chamber_number, missing_count, good_count, image)
+        results[0].save(f"results/{chamber_number}.jpg")
+        return missing_count, good_count
+
+    def inspect_video(self, model, job, chamber_number, video_path):
+        """Runs on the inference worker thread.
+
+        Frames are decoded on a separate thread while earlier batches are
+        being inferred. The chamber is recorded with its worst frame, the one
+        with the most missing screws.
+        """
+        sampler = FrameSampler()
+        decoder = VideoDecoder(video_path, sampler)
+        profile = self.profiles.get(chamber_number)
+        worst = None
+        inspected = 0
+
+        def run_batch(batch):
+            nonlocal worst, inspected
+            frames = [frame for _, _, frame in batch]
+            if profile is not None:
+                for frame, detections in zip(frames, detect_rois(model, frames, profile)):
+                    missing_count, good_count = count_detections(detections, model.names)
+                    if worst is None or missing_count > worst[0]:
+                        worst = (missing_count, good_count, frame, detections)
+            else:
+                for frame, result in zip(frames, model(frames, verbose=False)):
+                    missing_count, good_count = count_classes([result])
+                    if worst is None or missing_count > worst[0]:
+                        worst = (missing_count, good_count, frame, result)
+            inspected += len(batch)
+            job.progress = f"Inspected {inspected} frames ({sampler.duplicates} duplicates skipped)..."
+
+        batch = []
         try:
-            # Show loading message
-            loading_label = ttk.Label(self.main_frame, text="Running inference...")
-            loading_label.grid(row=2, column=0, columnspan=2)
-            self.root.update()
+            for item in decoder:
+                if job.cancelled.is_set():
+                    return None
+                batch.append(item)
+                if len(batch) == VIDEO_BATCH_SIZE:
+                    run_batch(batch)
+                    batch = []
+        finally:
+            decoder.stop()
+        if batch:
+            run_batch(batch)
 
-            # Run YOLO inference
-            results = self.model(self.image_path)
-            
-            # Process results based on class count
-            class_counts = {0: 0, 1: 0}  # Initialize counters for both classes
-            
-            for r in results:
-                boxes = r.boxes
-                for box in boxes:
-                    cls = int(box.cls[0])
-                    if cls in class_counts:
-                        class_counts[cls] += 1
-
-            missing_count = class_counts[0]  # Class 0 count
-            good_count = class_counts[1]     # Class 1 count
-            
-            # Save results
-            self.save_results(missing_count, good_count)
-            
-            # Show results
-            results[0].save(f"results/{self.chamber_number.get()}.jpg")
-            
-            # Remove loading label
-            loading_label.destroy()
-            
-            # Display results
-            self.show_results(missing_count, good_count)
-            
-        except Exception as e:
-            messagebox.showerror("Error", f"An error occurred during inference: {str(e)}")
+        if worst is None:
+            raise ValueError("No frames could be read from the video")
+        if job.cancelled.is_set():
+            return None
+
+        missing_count, good_count, frame, result = worst
+        self.save_results(chamber_number, missing_count, good_count, frame)
+        if profile is not None:
+            save_annotated(f"results/{chamber_number}.jpg", frame, result)
+        else:
+            result.save(f"results/{chamber_number}.jpg")
+        return missing_count, good_count
 
-    def save_results(self, missing_count, good_count):
+    def save_results(self, chamber_number, missing_count, good_count, image):
         # Save to database
         conn = sqlite3.connect('screw_detection.db')
         cursor = conn.cursor()
@@ -162,7 +419,7 @@ class ScrewDetectionGUI:
             INSERT OR REPLACE INTO detections 
             (chamber_number, missing_screw_count, good_screw_count, timestamp)
             VALUES (?, ?, ?, ?)
-        ''', (self.chamber_number.get(), missing_count, good_count, datetime.now()))
+        ''', (chamber_number, missing_count, good_count, datetime.now()))
         conn.commit()
         conn.close()
         
@@ -170,9 +427,11 @@ class ScrewDetectionGUI:
         os.makedirs("results", exist_ok=True)
         
         # Save original image with chamber number as filename
-        if self.image_path:
-            img = Image.open(self.image_path)
-            img.save(f"results/{self.chamber_number.get()}_original.jpg")
+        if isinstance(image, str):
+            img = Image.open(image)
+            img.save(f"results/{chamber_number}_original.jpg")
+        elif image is not None:
+            cv2.imwrite(f"results/{chamber_number}_original.jpg", image)
 
     def show_results(self, missing_count, good_count):
         # Clear previous widgets
@@ -186,7 +445,7 @@ class ScrewDetectionGUI:
         
         # Show annotated image
         result_img = Image.open(f"results/{self.chamber_number.get()}.jpg")
-        result_img = result_img.resize((400, 300))
+        result_img = result_img.resize(DISPLAY_SIZE)
         photo = ImageTk.PhotoImage(result_img)
         
         result_label = ttk.Label(self.main_frame, image=photo)
@@ -196,6 +455,10 @@ class ScrewDetectionGUI:
         # Add new session button
         ttk.Button(self.main_frame, text="New Session", command=self.setup_initial_screen).grid(row=4, column=0, columnspan=2, pady=10)
 
+    def on_close(self):
+        self.camera.stop()
+        self.root.destroy()
+
 if __name__ == "__main__":
     root = tk.Tk()
     app = ScrewDetectionGUI(root)
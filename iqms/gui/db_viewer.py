@@ -1,26 +1,164 @@
 import tkinter as tk
-from tkinter import ttk
+from tkinter import ttk, messagebox
 import sqlite3
-from datetime import datetime
+import os
+import sys
+import queue
+import threading
+
+# Shared modules live one directory up
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from export import iter_chunks, csv_chunks
+
+DB_PATH = 'screw_detection.db'
+# Rows fetched per page while scrolling
+PAGE_SIZE = 200
+# Load the next page once the view is scrolled past this fraction
+SCROLL_THRESHOLD = 0.9
+# Wait this long after the last keystroke before searching
+SEARCH_DEBOUNCE_MS = 300
+# How often the Tk thread checks for finished queries
+RESULT_POLL_MS = 30
+
+ROW_QUERY = '''
+    SELECT chamber_number, missing_screw_count, good_screw_count,
+           strftime('%Y-%m-%d %H:%M:%S', timestamp), timestamp
+    FROM detections
+'''
+
+
+def ensure_indexes(conn):
+    # chamber_number is the primary key, so prefix search already has an index;
+    # paging and incremental refresh walk the table by timestamp
+    try:
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_detections_timestamp ON detections (timestamp, chamber_number)')
+        conn.commit()
+    except sqlite3.OperationalError:
+        # Table is created by the inspection GUI on first run
+        pass
+
+
+def prefix_filter(term):
+    """Range condition matching chamber numbers that start with term.
+
+    Unlike LIKE '%term%' this can use the primary key index.
+    """
+    return 'chamber_number >= ? AND chamber_number < ?', [term, term + '\U0010ffff']
+
+
+class QueryWorker:
+    """Background thread that owns the viewer's SQLite connection.
+
+    Jobs run in submission order. Submitting a job under a tag that is
+    already queued or running supersedes it: the queued job is skipped, a
+    running one is interrupted, and its result is dropped. Results are
+    handed back to the Tk thread, which polls for them with after().
+    """
+
+    def __init__(self, root, db_path=DB_PATH, poll_ms=RESULT_POLL_MS):
+        self.root = root
+        self.poll_ms = poll_ms
+        self._jobs = queue.Queue()
+        self._results = queue.Queue()
+        self._generations = {}
+        self._running = None
+        self._lock = threading.Lock()
+        self._conn = None
+        self._thread = threading.Thread(target=self._run, args=(db_path,), name="db-viewer-worker", daemon=True)
+        self._thread.start()
+        self._poll_id = self.root.after(self.poll_ms, self._poll)
+
+    def submit(self, tag, fn, callback=None):
+        """Run fn(conn) on the worker thread and call callback(result) on the Tk thread"""
+        generation = self.cancel(tag)
+        self._jobs.put((tag, generation, fn, callback))
+
+    def cancel(self, tag):
+        """Supersede any queued or running job with this tag"""
+        with self._lock:
+            generation = self._generations.get(tag, 0) + 1
+            self._generations[tag] = generation
+            if self._running == tag:
+                # Safe to call from another thread; the query raises OperationalError
+                self._conn.interrupt()
+        return generation
+
+    def stop(self):
+        self.root.after_cancel(self._poll_id)
+        self._jobs.put(None)
+
+    def _current(self, tag, generation):
+        with self._lock:
+            return self._generations.get(tag) == generation
+
+    def _run(self, db_path):
+        self._conn = sqlite3.connect(db_path)
+        ensure_indexes(self._conn)
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                break
+            tag, generation, fn, callback = job
+            with self._lock:
+                if self._generations.get(tag) != generation:
+                    continue
+                self._running = tag
+            try:
+                result, error = fn(self._conn), None
+            except Exception as e:
+                result, error = None, e
+            finally:
+                with self._lock:
+                    self._running = None
+            self._results.put((tag, generation, callback, result, error))
+        self._conn.close()
+
+    def _poll(self):
+        while True:
+            try:
+                tag, generation, callback, result, error = self._results.get_nowait()
+            except queue.Empty:
+                break
+            # Drop results of superseded jobs
+            if not self._current(tag, generation):
+                continue
+            if error is not None:
+                messagebox.showerror("Database Error", str(error))
+            elif callback is not None:
+                callback(result)
+        self._poll_id = self.root.after(self.poll_ms, self._poll)
+
 
 class DatabaseViewer:
     def __init__(self, root):
         self.root = root
         self.root.title("Screw Detection Database Viewer")
         self.root.geometry("800x600")
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+
+        # All database access happens on this worker
+        self.worker = QueryWorker(self.root)
 
         # Create main frame
         self.main_frame = ttk.Frame(self.root, padding="10")
         self.main_frame.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
 
+        # Paging state
+        self.search_term = ''
+        self.last_key = None
+        self.newest_timestamp = None
+        self.all_loaded = False
+        self.page_pending = False
+        self.search_after_id = None
+
         # Create Treeview
         self.create_treeview()
-        
+
         # Create control buttons
         self.create_controls()
-        
-        # Load initial data
-        self.refresh_data()
+
+        # Load the first page
+        self.reload()
 
     def create_treeview(self):
         # Create Treeview widget
@@ -40,12 +178,12 @@ class DatabaseViewer:
         self.tree.column('timestamp', width=200)
 
         # Add scrollbar
-        scrollbar = ttk.Scrollbar(self.main_frame, orient=tk.VERTICAL, command=self.tree.yview)
-        self.tree.configure(yscrollcommand=scrollbar.set)
+        self.scrollbar = ttk.Scrollbar(self.main_frame, orient=tk.VERTICAL, command=self.tree.yview)
+        self.tree.configure(yscrollcommand=self.on_tree_scroll)
 
         # Grid layout
         self.tree.grid(row=0, column=0, columnspan=4, sticky='nsew')
-        scrollbar.grid(row=0, column=4, sticky='ns')
+        self.scrollbar.grid(row=0, column=4, sticky='ns')
 
     def create_controls(self):
         # Control buttons frame
@@ -63,29 +201,85 @@ class DatabaseViewer:
 
         ttk.Label(search_frame, text="Search Chamber:").grid(row=0, column=0, padx=5)
         self.search_var = tk.StringVar()
+        self.search_var.trace_add('write', self.on_search_changed)
         search_entry = ttk.Entry(search_frame, textvariable=self.search_var)
         search_entry.grid(row=0, column=1, padx=5)
         ttk.Button(search_frame, text="Search", command=self.search_records).grid(row=0, column=2, padx=5)
         ttk.Button(search_frame, text="Clear Search", command=self.clear_search).grid(row=0, column=3, padx=5)
 
-    def refresh_data(self):
-        # Clear existing items
-        for item in self.tree.get_children():
-            self.tree.delete(item)
+    def _filter(self):
+        # Search filter applied to every page and refresh
+        if self.search_term:
+            clause, params = prefix_filter(self.search_term)
+            return [clause], params
+        return [], []
+
+    def reload(self):
+        # Clear existing items and start paging from the newest row
+        self.tree.delete(*self.tree.get_children())
+        self.last_key = None
+        self.newest_timestamp = None
+        self.all_loaded = False
+        self.page_pending = False
+        # Rows from an older refresh no longer apply
+        self.worker.cancel('refresh')
+        self.load_next_page()
+
+    def load_next_page(self):
+        if self.all_loaded or self.page_pending:
+            return
+        self.page_pending = True
+
+        clauses, params = self._filter()
+        if self.last_key is not None:
+            # Keyset paging: continue after the last loaded row
+            clauses.append('(timestamp < ? OR (timestamp = ? AND chamber_number < ?))')
+            params += [self.last_key[0], self.last_key[0], self.last_key[1]]
+        where = ' WHERE ' + ' AND '.join(clauses) if clauses else ''
+        sql = ROW_QUERY + where + ' ORDER BY timestamp DESC, chamber_number DESC LIMIT ?'
+        params.append(PAGE_SIZE)
 
-        # Connect to database and fetch all records
-        conn = sqlite3.connect('screw_detection.db')
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM detections ORDER BY timestamp DESC')
-        rows = cursor.fetchall()
+        self.worker.submit('page', lambda conn: conn.execute(sql, params).fetchall(), self.show_page)
 
-        # Insert data into treeview
+    def show_page(self, rows):
+        self.page_pending = False
         for row in rows:
-            # Convert timestamp string to datetime object and format it
-            timestamp = datetime.strptime(row[3], '%Y-%m-%d %H:%M:%S.%f').strftime('%Y-%m-%d %H:%M:%S')
-            self.tree.insert('', tk.END, values=(row[0], row[1], row[2], timestamp))
+            if not self.tree.exists(row[0]):
+                self.tree.insert('', tk.END, iid=row[0], values=row[:4])
+        if rows:
+            self.last_key = (rows[-1][4], rows[-1][0])
+            if self.newest_timestamp is None:
+                self.newest_timestamp = rows[0][4]
+        if len(rows) < PAGE_SIZE:
+            self.all_loaded = True
+
+    def on_tree_scroll(self, first, last):
+        self.scrollbar.set(first, last)
+        # Fetch the next page once the view gets close to the bottom
+        if float(last) >= SCROLL_THRESHOLD:
+            self.load_next_page()
+
+    def refresh_data(self):
+        if self.newest_timestamp is None:
+            self.reload()
+            return
+
+        # Only fetch rows newer than the last one seen
+        clauses, params = self._filter()
+        clauses.append('timestamp > ?')
+        params.append(self.newest_timestamp)
+        sql = ROW_QUERY + ' WHERE ' + ' AND '.join(clauses) + ' ORDER BY timestamp ASC, chamber_number ASC'
+
+        self.worker.submit('refresh', lambda conn: conn.execute(sql, params).fetchall(), self.show_new_rows)
 
-        conn.close()
+    def show_new_rows(self, rows):
+        for row in rows:
+            # Chambers are replaced on re-inspection, so move their row to the top
+            if self.tree.exists(row[0]):
+                self.tree.delete(row[0])
+            self.tree.insert('', 0, iid=row[0], values=row[:4])
+        if rows:
+            self.newest_timestamp = rows[-1][4]
 
     def delete_selected(self):
         # Get selected item
@@ -94,71 +288,73 @@ class DatabaseViewer:
             return
 
         # Get chamber number of selected item
-        chamber_number = self.tree.item(selected_item)['values'][0]
+        chamber_number = selected_item[0]
 
-        # Connect to database and delete record
-        conn = sqlite3.connect('screw_detection.db')
-        cursor = conn.cursor()
-        cursor.execute('DELETE FROM detections WHERE chamber_number = ?', (chamber_number,))
-        conn.commit()
-        conn.close()
+        def delete(conn):
+            conn.execute('DELETE FROM detections WHERE chamber_number = ?', (chamber_number,))
+            conn.commit()
+            return chamber_number
 
-        # Refresh the display
-        self.refresh_data()
+        # Remove just that row from the display once the delete commits
+        self.worker.submit('delete:' + chamber_number, delete, self.remove_row)
 
-    def search_records(self):
-        search_term = self.search_var.get()
-        
-        # Clear existing items
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-
-        # Connect to database and fetch matching records
-        conn = sqlite3.connect('screw_detection.db')
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM detections WHERE chamber_number LIKE ? ORDER BY timestamp DESC', 
-                      ('%' + search_term + '%',))
-        rows = cursor.fetchall()
-
-        # Insert matching data into treeview
-        for row in rows:
-            timestamp = datetime.strptime(row[3], '%Y-%m-%d %H:%M:%S.%f').strftime('%Y-%m-%d %H:%M:%S')
-            self.tree.insert('', tk.END, values=(row[0], row[1], row[2], timestamp))
+    def remove_row(self, chamber_number):
+        if self.tree.exists(chamber_number):
+            self.tree.delete(chamber_number)
+
+    def on_search_changed(self, *args):
+        # Debounce search-as-you-type
+        if self.search_after_id is not None:
+            self.root.after_cancel(self.search_after_id)
+        self.search_after_id = self.root.after(SEARCH_DEBOUNCE_MS, self.search_records)
 
-        conn.close()
+    def search_records(self):
+        if self.search_after_id is not None:
+            self.root.after_cancel(self.search_after_id)
+            self.search_after_id = None
+        search_term = self.search_var.get().strip()
+        if search_term == self.search_term and self.tree.get_children():
+            return
+        self.search_term = search_term
+        self.reload()
 
     def clear_search(self):
         self.search_var.set('')
-        self.refresh_data()
+        self.search_records()
 
     def export_to_csv(self):
-        import csv
         from tkinter import filedialog
-        
+
         # Ask user for save location
         file_path = filedialog.asksaveasfilename(
             defaultextension='.csv',
             filetypes=[("CSV files", "*.csv"), ("All files", "*.*")]
         )
-        
+
         if file_path:
-            conn = sqlite3.connect('screw_detection.db')
-            cursor = conn.cursor()
-            cursor.execute('SELECT * FROM detections ORDER BY timestamp DESC')
-            rows = cursor.fetchall()
-            
-            with open(file_path, 'w', newline='') as csv_file:
-                csv_writer = csv.writer(csv_file)
-                # Write header
-                csv_writer.writerow(['Chamber Number', 'Missing Screws', 'Good Screws', 'Timestamp'])
-                # Write data
-                for row in rows:
-                    timestamp = datetime.strptime(row[3], '%Y-%m-%d %H:%M:%S.%f').strftime('%Y-%m-%d %H:%M:%S')
-                    csv_writer.writerow([row[0], row[1], row[2], timestamp])
-            
-            conn.close()
+            def export(conn):
+                cursor = conn.cursor()
+                # Format timestamps in SQL and stream the rows in chunks
+                cursor.execute('''
+                    SELECT chamber_number, missing_screw_count, good_screw_count,
+                           strftime('%Y-%m-%d %H:%M:%S', timestamp)
+                    FROM detections ORDER BY timestamp DESC
+                ''')
+
+                with open(file_path, 'w', newline='') as csv_file:
+                    header = ['Chamber Number', 'Missing Screws', 'Good Screws', 'Timestamp']
+                    for chunk in csv_chunks(header, iter_chunks(cursor)):
+                        csv_file.write(chunk)
+                return file_path
+
+            self.worker.submit('export', export,
+                               lambda path: messagebox.showinfo("Export", f"Exported to {path}"))
+
+    def on_close(self):
+        self.worker.stop()
+        self.root.destroy()
 
 if __name__ == "__main__":
     root = tk.Tk()
     app = DatabaseViewer(root)
-    root.mainloop()
\ No newline at end of file
+    root.mainloop()
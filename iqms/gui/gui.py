@@ -6,17 +6,57 @@ from PIL import Image, ImageTk
 
 import cv2
 
-import torch
+import sqlite3
 
-from ultralytics import YOLO
+import os
 
-import sqlite3
+import sys
+
+import threading
+
+from camera import CameraService, preview_frame, PREVIEW_INTERVAL_MS
+
+# Shared modules live one directory up
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backends import load_model
+
+from inference import extract_detections
+
+from model_registry import warm_up
+
+
+
+# YOLOv8 model, loaded in the background so the window opens at once
+
+model = None
+
+model_error = None
+
+
+
+def load_in_background():
+
+    global model, model_error
+
+    try:
 
+        loaded = load_model("yolov8s.yaml")
 
+        warm_up(loaded)
 
-# Load YOLOv8 model
+    except Exception as e:
 
-model = YOLO("yolov8s.yaml")
+        model_error = e
+
+        return
+
+    model = loaded
+
+
+
+threading.Thread(target=load_in_background, name="model-loader", daemon=True).start()
 
 
 
@@ -38,61 +78,97 @@ conn.commit()
 
 
 
-def upload_image():
+# Camera stays open and grabs frames in the background
 
-    path = filedialog.askopenfilename(filetypes=[("Image Files", ".jpg.jpeg.png.bmp")])
+camera = CameraService()
 
-    if path:
+# Image to run inference on (BGR array)
 
-        img = cv2.imread(path)
+current_image = None
 
-        cv2.imwrite("temp.jpg", img)
+preview_count = -1
 
-        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
 
-        img = Image.fromarray(img)
 
-        img.thumbnail((400, 400))
+def show_image(img):
 
-        img = ImageTk.PhotoImage(img)
+    global current_image
 
-        label.config(image=img)
+    current_image = img
 
-        label.image = img
+    img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
 
-        entry.config(state="normal")
+    img = Image.fromarray(img)
 
-        run_button.config(state="normal")
+    img.thumbnail((400, 400))
 
+    img = ImageTk.PhotoImage(img)
+
+    label.config(image=img)
+
+    label.image = img
+
+    entry.config(state="normal")
+
+    run_button.config(state="normal")
 
 
-def capture_image():
 
-    cap = cv2.VideoCapture(0)
+def update_preview():
 
-    ret, frame = cap.read()
+    global preview_count
 
-    cap.release()
+    # Only redraw when the grabber has a new frame
 
-    if ret:
+    if camera.frame_count != preview_count:
 
-        cv2.imwrite("temp.jpg", frame)
+        frame = camera.latest()
 
-        img = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        if frame is not None:
 
-        img = Image.fromarray(img)
+            preview_count = camera.frame_count
 
-        img.thumbnail((400, 400))
+            img = ImageTk.PhotoImage(preview_frame(frame, (320, 240)))
 
-        img = ImageTk.PhotoImage(img)
+            preview_label.config(image=img)
 
-        label.config(image=img)
+            preview_label.image = img
 
-        label.image = img
+    root.after(PREVIEW_INTERVAL_MS, update_preview)
 
-        entry.config(state="normal")
 
-        run_button.config(state="normal")
+
+def on_close():
+
+    camera.stop()
+
+    root.destroy()
+
+
+
+def upload_image():
+
+    path = filedialog.askopenfilename(filetypes=[("Image Files", ".jpg.jpeg.png.bmp")])
+
+    if path:
+
+        img = cv2.imread(path)
+
+        if img is not None:
+
+            show_image(img)
+
+
+
+def capture_image():
+
+    # Newest frame from the camera's ring buffer, no device open or temp file
+
+    frame = camera.wait_for_frame() if camera.start() else None
+
+    if frame is not None:
+
+        show_image(frame)
 
 
 
@@ -100,25 +176,33 @@ def run_inference():
 
     chamber_number = entry.get()
 
-    if chamber_number:
+    if model is None:
 
-        img = cv2.imread("temp.jpg")
+        result_text.delete(1.0, tk.END)
 
-        results = model(img)
+        if model_error is not None:
 
-        missing_screws = 0
+            result_text.insert(tk.END, f"Model failed to load: {model_error}")
 
-        good_screws = 0
+        else:
 
-        for result in results.xyxy[0]:
+            result_text.insert(tk.END, "Model is still loading, try again in a moment")
 
-            if result[5] == 0:
+        return
 
-                missing_screws += 1
+    if chamber_number and current_image is not None:
 
-            elif result[5] == 1:
+        img = current_image
+
+        results = model(img)
 
-                good_screws += 1
+        # Same detections structure as the API; class 0 is missing, class 1 is good
+
+        detections = extract_detections(results[0], model.names)
+
+        missing_screws = sum(1 for d in detections if d["class"] == model.names[0])
+
+        good_screws = sum(1 for d in detections if d["class"] == model.names[1])
 
         cv2.imwrite(f"{chamber_number}.jpg", img)
 
@@ -138,6 +222,8 @@ root = tk.Tk()
 
 root.title("Screw Classification")
 
+root.protocol("WM_DELETE_WINDOW", on_close)
+
 
 
 upload_button = tk.Button(root, text="Upload Image", command=upload_image)
@@ -152,6 +238,12 @@ capture_button.pack()
 
 
 
+preview_label = tk.Label(root)
+
+preview_label.pack()
+
+
+
 label = tk.Label(root)
 
 label.pack()
@@ -184,4 +276,12 @@ result_text.pack()
 
 
 
+# Live camera preview
+
+if camera.start():
+
+    update_preview()
+
+
+
 root.mainloop()
\ No newline at end of file
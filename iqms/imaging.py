@@ -0,0 +1,258 @@
+# imaging.py
+import base64
+import binascii
+import hashlib
+import io
+import os
+import re
+
+import cv2
+import numpy as np
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+from PIL import Image
+
+from metrics import stage
+
+# Largest accepted image upload in bytes (can be overridden through the environment)
+MAX_UPLOAD_BYTES = int(float(os.environ.get("IQMS_MAX_UPLOAD_MB", "20")) * 1024 * 1024)
+UPLOAD_CHUNK_SIZE = 256 * 1024
+# Room for the other form fields and multipart headers around an image
+FORM_OVERHEAD_BYTES = 64 * 1024
+
+# Image types accepted as a raw request body, with the extension used when saving
+IMAGE_EXTENSIONS = {
+    "image/jpeg": ".jpg",
+    "image/webp": ".webp",
+    "image/png": ".png",
+}
+
+# Leading bytes of the formats an original can be stored as, with its suffix
+IMAGE_SIGNATURES = [
+    (b"\xff\xd8\xff", ".jpg"),
+    (b"\x89PNG\r\n\x1a\n", ".png"),
+    (b"BM", ".bmp"),
+    (b"II*\x00", ".tif"),
+    (b"MM\x00*", ".tif"),
+]
+
+# Keep a copy of every original image on disk (written after the response)
+SAVE_ORIGINALS = os.environ.get("IQMS_SAVE_ORIGINALS", "1") not in ("0", "false", "no")
+
+
+class BodySizeLimitMiddleware:
+    """ASGI middleware capping request bodies per path before they are parsed.
+
+    Starlette spools a whole multipart form before the endpoint runs, so a
+    check in the endpoint only happens after an oversized upload has been
+    received. Here a Content-Length over the limit is answered with 413 at
+    once, and a body without one fails with 413 as soon as it passes it.
+    ``limits`` maps request paths to their maximum body size in bytes.
+    """
+
+    def __init__(self, app, limits):
+        self.app = app
+        self.limits = limits
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limits.get(scope["path"]) if scope["type"] == "http" else None
+        if limit is None:
+            return await self.app(scope, receive, send)
+
+        detail = f"Request body larger than {limit} bytes"
+        for name, value in scope.get("headers", ()):
+            if name == b"content-length" and value.isdigit() and int(value) > limit:
+                return await JSONResponse({"detail": detail}, status_code=413)(scope, receive, send)
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    # FastAPI passes HTTPExceptions raised while parsing through as-is
+                    raise HTTPException(status_code=413, detail=detail)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+def form_limit(max_bytes=MAX_UPLOAD_BYTES, base64=False):
+    """Body limit for a form carrying one image of up to max_bytes"""
+    return (max_bytes * 4 // 3 if base64 else max_bytes) + FORM_OVERHEAD_BYTES
+
+
+async def read_upload(file, max_bytes=MAX_UPLOAD_BYTES):
+    """Read an UploadFile in chunks, rejecting anything larger than max_bytes.
+
+    This checks the image itself after the form has been received; the
+    request as a whole is capped before parsing by BodySizeLimitMiddleware.
+    """
+    if file.size is not None and file.size > max_bytes:
+        raise HTTPException(status_code=413, detail=f"Image larger than {max_bytes} bytes")
+
+    data = bytearray()
+    while True:
+        chunk = await file.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        data += chunk
+        if len(data) > max_bytes:
+            raise HTTPException(status_code=413, detail=f"Image larger than {max_bytes} bytes")
+    return data
+
+
+async def read_body(request, max_bytes=MAX_UPLOAD_BYTES):
+    """Stream a raw request body, rejecting anything larger than max_bytes"""
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > max_bytes:
+        raise HTTPException(status_code=413, detail=f"Image larger than {max_bytes} bytes")
+
+    data = bytearray()
+    async for chunk in request.stream():
+        data += chunk
+        if len(data) > max_bytes:
+            raise HTTPException(status_code=413, detail=f"Image larger than {max_bytes} bytes")
+    return data
+
+
+def save_upload(source, path, max_bytes=MAX_UPLOAD_BYTES):
+    """Copy an upload's file object to disk in chunks, rejecting anything larger than max_bytes"""
+    written = 0
+    try:
+        with open(path, "wb") as f:
+            while True:
+                chunk = source.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                written += len(chunk)
+                if written > max_bytes:
+                    raise HTTPException(status_code=413, detail=f"File larger than {max_bytes} bytes")
+                f.write(chunk)
+    except Exception:
+        os.remove(path)
+        raise
+    return written
+
+
+def decode_base64_image(image_data):
+    """Turn a data URL (or bare base64 string) into the raw image bytes"""
+    if "," in image_data:
+        image_data = image_data.split(",", 1)[1]
+    try:
+        return base64.b64decode(image_data, validate=True)
+    except (binascii.Error, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid base64 image data")
+
+
+def decode_image(data):
+    """Decode encoded image bytes straight into a BGR NumPy array.
+
+    The bytes are wrapped with np.frombuffer over a memoryview, so no copy
+    is made before OpenCV decodes them.
+    """
+    if not data:
+        raise HTTPException(status_code=400, detail="Empty image data")
+    buffer = np.frombuffer(memoryview(data), dtype=np.uint8)
+    try:
+        image = cv2.imdecode(buffer, cv2.IMREAD_COLOR)
+    except cv2.error:
+        image = None
+    if image is None:
+        raise HTTPException(status_code=400, detail="Could not decode image")
+    return image
+
+
+def image_size(data):
+    """(width, height) of encoded image bytes from the header alone, or None if unreadable"""
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            return image.size
+    except Exception:
+        return None
+
+
+def encode_jpeg(image, quality=95):
+    """Encode a BGR array as JPEG bytes"""
+    ok, encoded = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise ValueError("Could not encode image")
+    return encoded.tobytes()
+
+
+def image_suffix(data):
+    """File suffix for encoded image bytes, from their leading bytes"""
+    header = bytes(data[:12])
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return ".webp"
+    for signature, suffix in IMAGE_SIGNATURES:
+        if header.startswith(signature):
+            return suffix
+    return ".img"
+
+
+def original_filename(data):
+    """Content-addressed file name for an original image.
+
+    Identical bytes always map to the same file, so a stored original never
+    changes and can be shared by every row (and cache entry) for that image.
+    The client's file name is never used.
+    """
+    return hashlib.sha256(memoryview(data)).hexdigest() + image_suffix(data)
+
+
+# File names produced by original_filename
+_ORIGINAL_NAME = re.compile(r"^[0-9a-f]{64}\.[a-z]+$")
+
+
+def is_content_addressed(path):
+    """True if path names a file written under original_filename"""
+    return path is not None and _ORIGINAL_NAME.match(os.path.basename(path)) is not None
+
+
+def write_file(path, data):
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def write_once(path, data):
+    """Write a content-addressed file unless it exists; readers never see it half-written"""
+    if os.path.exists(path):
+        return
+    temp_path = f"{path}.{os.getpid()}.{id(data)}.tmp"
+    try:
+        write_file(temp_path, data)
+        os.replace(temp_path, path)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+# Originals handed to a write-behind task but not yet on disk, by path
+_pending_writes = {}
+
+
+def queue_write(path, data):
+    """Register bytes that are about to be written by write_behind"""
+    _pending_writes[str(path)] = data
+
+
+def write_behind(path, data):
+    """Write a queued original, then drop it from the pending registry"""
+    try:
+        with stage("write_original"):
+            write_once(path, data)
+    finally:
+        _pending_writes.pop(str(path), None)
+
+
+def read_file(path):
+    """Read an original, including one whose write-behind has not finished"""
+    data = _pending_writes.get(str(path))
+    if data is not None:
+        return data
+    with open(path, "rb") as f:
+        return f.read()
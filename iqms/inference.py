@@ -0,0 +1,200 @@
+# inference.py
+import asyncio
+import os
+import time
+from collections import Counter
+
+from metrics import BATCH_SIZE, BATCH_LATENCY, QUEUE_WAIT, QUEUE_DEPTH
+
+# Batching limits (can be overridden through the environment)
+MAX_BATCH_SIZE = int(os.environ.get("IQMS_MAX_BATCH_SIZE", "8"))
+MAX_WAIT_MS = float(os.environ.get("IQMS_MAX_WAIT_MS", "10"))
+
+
+def extract_detections(result, names):
+    """Convert a single YOLO result into the list of detection dicts"""
+    detections = []
+    for box in result.boxes:
+        detection = {
+            "class": names[int(box.cls)],
+            "confidence": float(box.conf),
+            "bbox": box.xyxy[0].tolist()
+        }
+        detections.append(detection)
+    return detections
+
+
+class BatchInferenceEngine:
+    """Collects concurrent inference requests into small batches.
+
+    Requests are queued and a single background task drains the queue,
+    handing one batch at a time to ``predict`` (an async callable that takes
+    a list of sources and returns one output per source). A batch is
+    dispatched as soon as it holds ``max_batch_size`` images or the oldest
+    request has waited ``max_wait_ms`` milliseconds, whichever comes first.
+    Up to ``max_concurrency`` batches may be in flight at once. ``name``
+    labels the engine's metrics.
+    """
+
+    def __init__(self, predict, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS, max_concurrency=1, name=""):
+        self.predict = predict
+        self.name = name
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait_ms = max(0.0, float(max_wait_ms))
+        self.max_concurrency = max(1, int(max_concurrency))
+        self._queue = None
+        self._task = None
+        self._slots = None
+        self._in_flight = set()
+
+        # Stats
+        self._batches = 0
+        self._images = 0
+        self._batch_sizes = Counter()
+        self._wait_total_ms = 0.0
+        self._wait_max_ms = 0.0
+        self._inference_total_ms = 0.0
+        self._batch_size_metric = BATCH_SIZE.labels(name)
+        self._batch_latency_metric = BATCH_LATENCY.labels(name)
+        self._queue_wait_metric = QUEUE_WAIT.labels(name)
+        QUEUE_DEPTH.labels(f"inference:{name}").set_function(
+            lambda: self._queue.qsize() if self._queue is not None else 0
+        )
+
+    async def start(self):
+        if self._task is None:
+            self._queue = asyncio.Queue()
+            self._slots = asyncio.Semaphore(self.max_concurrency)
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for task in list(self._in_flight):
+            task.cancel()
+
+    async def infer(self, source):
+        """Queue one image and wait for its result.
+
+        Returns the output of ``predict`` for that image only.
+        """
+        await self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((source, future, time.perf_counter()))
+        return await future
+
+    async def _collect_batch(self):
+        # Block until at least one request is available
+        batch = [await self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait_ms / 1000.0
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+
+        # Drain anything that is already waiting without blocking
+        while len(batch) < self.max_batch_size and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect_batch()
+            # Skip requests whose caller has gone away
+            batch = [item for item in batch if not item[1].done()]
+            if not batch:
+                continue
+
+            # Wait for a free slot, then let the batch run in the background
+            await self._slots.acquire()
+            task = asyncio.create_task(self._dispatch(batch))
+            self._in_flight.add(task)
+            task.add_done_callback(self._in_flight.discard)
+
+    async def _dispatch(self, batch):
+        try:
+            dispatched = time.perf_counter()
+            sources = [source for source, _, _ in batch]
+            try:
+                outputs = await self.predict(sources)
+            except Exception as e:
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                return
+            finished = time.perf_counter()
+
+            self._record(batch, dispatched, finished)
+            for (_, future, _), output in zip(batch, outputs):
+                if not future.done():
+                    future.set_result(output)
+        finally:
+            self._slots.release()
+
+    def _record(self, batch, dispatched, finished):
+        self._batches += 1
+        self._images += len(batch)
+        self._batch_sizes[len(batch)] += 1
+        self._inference_total_ms += (finished - dispatched) * 1000.0
+        self._batch_size_metric.observe(len(batch))
+        self._batch_latency_metric.observe(finished - dispatched)
+        for _, _, queued in batch:
+            wait_ms = (dispatched - queued) * 1000.0
+            self._wait_total_ms += wait_ms
+            self._wait_max_ms = max(self._wait_max_ms, wait_ms)
+            self._queue_wait_metric.observe(wait_ms / 1000.0)
+
+    def stats(self):
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait_ms,
+            "max_concurrency": self.max_concurrency,
+            "batches_in_flight": len(self._in_flight),
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "batches": self._batches,
+            "images": self._images,
+            "avg_batch_size": self._images / self._batches if self._batches else 0.0,
+            "batch_size_histogram": {str(size): count for size, count in sorted(self._batch_sizes.items())},
+            "avg_queue_wait_ms": self._wait_total_ms / self._images if self._images else 0.0,
+            "max_queue_wait_ms": self._wait_max_ms,
+            "avg_batch_inference_ms": self._inference_total_ms / self._batches if self._batches else 0.0,
+        }
+
+
+class LatestFrameSlot:
+    """Single-slot mailbox for live streams where only the newest frame matters.
+
+    Putting a frame replaces any frame that has not been taken yet, so a
+    slow consumer always works on the most recent frame instead of falling
+    further behind a queue of stale ones.
+    """
+
+    def __init__(self):
+        self._frame = None
+        self._event = asyncio.Event()
+        self.received = 0
+        self.dropped = 0
+
+    def put(self, frame_id, data):
+        self.received += 1
+        if self._frame is not None:
+            self.dropped += 1
+        self._frame = (frame_id, data)
+        self._event.set()
+
+    async def take(self):
+        """Wait for a frame and return it as (frame_id, data)"""
+        await self._event.wait()
+        self._event.clear()
+        frame, self._frame = self._frame, None
+        return frame
@@ -1,19 +1,35 @@
 # main.py
-from fastapi import FastAPI, File, UploadFile, Form
+from fastapi import FastAPI, File, UploadFile, Form, BackgroundTasks
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse, FileResponse
+from fastapi.responses import HTMLResponse, FileResponse, JSONResponse, Response
 import uvicorn
-from ultralytics import YOLO
 import cv2
 import numpy as np
 from PIL import Image
 import io
 import os
 import base64
+import asyncio
+import logging
 from pathlib import Path
 
+from workers import WorkerPool
+from imaging import (
+    read_upload, decode_image, decode_base64_image, original_filename, write_file, write_once, SAVE_ORIGINALS,
+    BodySizeLimitMiddleware, form_limit,
+)
+from rendering import render_detections
+import metrics
+from metrics import stage, MetricsMiddleware
+
 app = FastAPI()
 
+# Reject oversized uploads before the form is received and parsed
+app.add_middleware(BodySizeLimitMiddleware, limits={"/upload": form_limit(), "/capture": form_limit(base64=True)})
+
+# Request counters, latency histograms and slow-request logging (see /metrics)
+app.add_middleware(MetricsMiddleware)
+
 # Mount the static files directory
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
@@ -23,8 +39,58 @@ RESULT_DIR = Path("results")
 UPLOAD_DIR.mkdir(exist_ok=True)
 RESULT_DIR.mkdir(exist_ok=True)
 
-# Load the YOLOv8n model
-model = YOLO('yolov8n.pt')
+# Worker pool for inference and blocking file work; the default model
+# version (see model_registry.py) is loaded by each worker on first use
+worker_pool = WorkerPool()
+
+logger = logging.getLogger("uvicorn.error")
+
+# Seconds clients are asked to wait while the model is still loading
+RETRY_AFTER_SECONDS = 5
+
+# Model warm-up state for /readyz: "loading", "ready" or "failed"
+app.state.model = {"state": "loading", "error": None}
+
+def warm_up_done(task):
+    if task.cancelled():
+        return
+    error = task.exception()
+    if error is not None:
+        logger.error("Model warm-up failed: %s", error, exc_info=error)
+        app.state.model = {"state": "failed", "error": str(error)}
+    else:
+        app.state.model = {"state": "ready", "error": None}
+
+@app.on_event("startup")
+async def warm_up_workers():
+    # Load the model in the background so the server accepts requests at once
+    app.state.warm_up = asyncio.create_task(worker_pool.warm_up())
+    app.state.warm_up.add_done_callback(warm_up_done)
+
+@app.on_event("shutdown")
+async def stop_workers():
+    app.state.warm_up.cancel()
+    worker_pool.shutdown()
+
+@app.get("/healthz")
+async def healthz():
+    """Liveness: the process is up and serving requests"""
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness: 200 once the model has been warmed up, 503 while loading or after a failure"""
+    if app.state.model["state"] == "ready":
+        return app.state.model
+    return JSONResponse(app.state.model, status_code=503, headers={"Retry-After": str(RETRY_AFTER_SECONDS)})
+
+def write_result(path, image, detections):
+    # Draw the boxes onto the decoded image and save it
+    fmt = {".png": "png", ".webp": "webp"}.get(path.suffix.lower(), "jpeg")
+    with stage("render"):
+        content = render_detections(image, detections, fmt=fmt, quality=95)
+    with stage("write_result"):
+        write_file(path, content)
 
 @app.get("/", response_class=HTMLResponse)
 async def read_root():
@@ -32,30 +98,25 @@ async def read_root():
         return f.read()
 
 @app.post("/upload")
-async def upload_file(file: UploadFile, chamber_number: str = Form(...)):
-    # Save the uploaded file
-    file_path = UPLOAD_DIR / file.filename
-    with open(file_path, "wb") as f:
-        f.write(await file.read())
+async def upload_file(background_tasks: BackgroundTasks, file: UploadFile, chamber_number: str = Form(...)):
+    # Decode the upload in memory
+    data = await read_upload(file)
+    with stage("decode"):
+        image = await worker_pool.run_io(decode_image, data)
+    
+    # Save the original after the response has been sent, named by its
+    # content rather than the client's file name
+    filename = await worker_pool.run_io(original_filename, data)
+    if SAVE_ORIGINALS:
+        background_tasks.add_task(write_once, UPLOAD_DIR / filename, data)
     
     # Run inference
-    results = model(str(file_path))
+    with stage("inference"):
+        [detections] = await worker_pool.predict([image])
     
     # Save the result image with bounding boxes
-    result_path = RESULT_DIR / f"result_{file.filename}"
-    result_img = results[0].plot()
-    cv2.imwrite(str(result_path), result_img)
-    
-    # Get detection results
-    detections = []
-    for r in results:
-        for box in r.boxes:
-            detection = {
-                "class": model.names[int(box.cls)],
-                "confidence": float(box.conf),
-                "bbox": box.xyxy[0].tolist()
-            }
-            detections.append(detection)
+    result_path = RESULT_DIR / f"result_{filename}"
+    await worker_pool.run_io(write_result, result_path, image, detections)
     
     return {
         "chamber_number": chamber_number,
@@ -64,34 +125,24 @@ async def upload_file(file: UploadFile, chamber_number: str = Form(...)):
     }
 
 @app.post("/capture")
-async def capture_image(image_data: str = Form(...), chamber_number: str = Form(...)):
-    # Convert base64 image to file
-    image_data = image_data.split(",")[1]
-    image_bytes = io.BytesIO(base64.b64decode(image_data))
-    image = Image.open(image_bytes)
+async def capture_image(background_tasks: BackgroundTasks, image_data: str = Form(...), chamber_number: str = Form(...)):
+    # Decode the base64 JPEG in memory
+    data = decode_base64_image(image_data)
+    with stage("decode"):
+        image = await worker_pool.run_io(decode_image, data)
     
-    # Save captured image
-    file_path = UPLOAD_DIR / f"capture_{chamber_number}.jpg"
-    image.save(file_path)
+    # Save the captured image as-is after the response has been sent
+    filename = await worker_pool.run_io(original_filename, data)
+    if SAVE_ORIGINALS:
+        background_tasks.add_task(write_once, UPLOAD_DIR / filename, data)
     
     # Run inference
-    results = model(str(file_path))
+    with stage("inference"):
+        [detections] = await worker_pool.predict([image])
     
     # Save result image
-    result_path = RESULT_DIR / f"result_capture_{chamber_number}.jpg"
-    result_img = results[0].plot()
-    cv2.imwrite(str(result_path), result_img)
-    
-    # Get detection results
-    detections = []
-    for r in results:
-        for box in r.boxes:
-            detection = {
-                "class": model.names[int(box.cls)],
-                "confidence": float(box.conf),
-                "bbox": box.xyxy[0].tolist()
-            }
-            detections.append(detection)
+    result_path = RESULT_DIR / f"result_{filename}"
+    await worker_pool.run_io(write_result, result_path, image, detections)
     
     return {
         "chamber_number": chamber_number,
@@ -99,5 +150,10 @@ async def capture_image(image_data: str = Form(...), chamber_number: str = Form(
         "detections": detections
     }
 
+@app.get("/metrics")
+async def get_metrics():
+    """Request and pipeline stage metrics in the Prometheus text format"""
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
+
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
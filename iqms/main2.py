@@ -1,22 +1,64 @@
 # main.py
-from fastapi import FastAPI, File, UploadFile, Form, Depends
+import time
+
+# Reference point for the reported startup times
+STARTED = time.perf_counter()
+
+from fastapi import (
+    FastAPI, File, UploadFile, Form, Depends, BackgroundTasks, Request, HTTPException,
+    WebSocket, WebSocketDisconnect, Header,
+)
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse, FileResponse, JSONResponse
+from fastapi.responses import HTMLResponse, FileResponse, JSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.background import BackgroundTask
 import uvicorn
-from ultralytics import YOLO
 import cv2
 import numpy as np
 from PIL import Image
 import io
 import os
 import base64
+import json
+import hashlib
+import secrets
+import asyncio
+import logging
+from collections import OrderedDict
 from pathlib import Path
 from datetime import datetime
-from typing import List
+from typing import List, Optional
+from pydantic import BaseModel
+from sqlalchemy import func, text
 from sqlalchemy.orm import Session
 
-from database import Detection, get_db
+from database import Detection, DetectionBox, SessionLocal, get_db, new_detection
+from db_writer import GroupCommitWriter
+from inference import LatestFrameSlot, MAX_BATCH_SIZE
+from workers import WorkerPool
+from model_registry import ModelRegistry, UnknownModel, ModelNotReady
+from roi import ProfileStore, infer_rois, profile_params
+from tiling import tiling_for, infer_tiles
+import metrics
+from metrics import stage, MetricsMiddleware
+from profiling import SavedProfiles, ProfilingMiddleware, token_ok
+from imaging import (
+    read_upload, read_body, save_upload, decode_image, decode_base64_image, encode_jpeg,
+    queue_write, write_behind, read_file, original_filename, is_content_addressed, image_size, IMAGE_EXTENSIONS, SAVE_ORIGINALS,
+    BodySizeLimitMiddleware, form_limit, MAX_UPLOAD_BYTES,
+)
+from rendering import render_detections, RenderCache, RENDER_FORMATS
+from result_cache import ResultCache
+from rollups import update_rollups, query_stats, BUCKETS
+from export import csv_chunks, ndjson_chunks, EXPORT_CHUNK_ROWS
+from video import (
+    FrameSampler, VideoDecoder, probe_video, pipelined,
+    VIDEO_FRAME_STEP, VIDEO_DEDUP_THRESHOLD, VIDEO_MAX_FRAMES, VIDEO_EXTENSIONS, MAX_VIDEO_BYTES,
+)
+from queries import (
+    filter_detections, parse_fields, encode_cursor, after_cursor,
+    DETECTION_FIELDS, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE,
+)
 
 app = FastAPI()
 
@@ -29,147 +71,723 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Reject oversized uploads before the form is received and parsed
+app.add_middleware(BodySizeLimitMiddleware, limits={
+    "/upload": form_limit(),
+    "/capture": form_limit(base64=True),
+    "/capture/binary": MAX_UPLOAD_BYTES,
+    "/inspect/video": form_limit(MAX_VIDEO_BYTES),
+})
+
+# Request counters, latency histograms and slow-request logging (see /metrics)
+app.add_middleware(MetricsMiddleware)
+
+# Opt-in, rate-limited profiling of single requests (see profiling.py)
+saved_profiles = SavedProfiles()
+app.add_middleware(ProfilingMiddleware, store=saved_profiles)
+
 # Mount the static files directory
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
 # Create directories if they don't exist
 UPLOAD_DIR = Path("uploads")
-RESULT_DIR = Path("results")
 UPLOAD_DIR.mkdir(exist_ok=True)
-RESULT_DIR.mkdir(exist_ok=True)
 
-# Load the YOLOv8n model
-model = YOLO('yolov8n.pt')
+# Seconds clients are asked to wait while a model is still loading
+RETRY_AFTER_SECONDS = 5
+
+# Uvicorn's logger, so startup messages show up next to its own
+logger = logging.getLogger("uvicorn.error")
+
+# Worker pool for inference and blocking file/DB work
+worker_pool = WorkerPool()
+
+def log_model_loaded(name, state):
+    if state["state"] == "ready":
+        logger.info("Model %s loaded in %.2fs (%.2fs after start)",
+                    name, state["load_seconds"], time.perf_counter() - STARTED)
+    else:
+        logger.error("Model %s failed to load: %s", name, state["error"])
+
+# The model versions (see model_registry.py), each with a shared engine that
+# groups concurrent requests into batched model calls. Models load in the
+# background after startup, so the server accepts connections at once.
+model_registry = ModelRegistry(worker_pool, started=STARTED, on_loaded=log_model_loaded)
+
+# Seconds from process start until the app accepted requests
+app_ready_seconds = None
+
+@app.on_event("startup")
+async def start_engine():
+    global app_ready_seconds
+    await model_registry.start()
+    detection_writer.start()
+    app_ready_seconds = round(time.perf_counter() - STARTED, 3)
+    logger.info("Application started in %.2fs, loading models in the background", app_ready_seconds)
+
+@app.on_event("shutdown")
+async def stop_engine():
+    await model_registry.stop()
+    detection_writer.stop()
+    worker_pool.shutdown()
+
+def get_engine(model=None, imgsz=None, max_batch_size=None):
+    """Inference engine of a model version, or an HTTP error if it can't serve yet"""
+    try:
+        return model_registry.engine(model, imgsz, max_batch_size)
+    except UnknownModel as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ModelNotReady as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(RETRY_AFTER_SECONDS)})
+
+# Background writer that inserts Detection rows in group commits,
+# updating the quality rollups in the same transaction
+detection_writer = GroupCommitWriter(hooks=[update_rollups])
 
 @app.get("/", response_class=HTMLResponse)
 async def read_root():
     with open("static/index.html") as f:
         return f.read()
 
-@app.post("/upload")
-async def upload_file(
-    file: UploadFile, 
-    chamber_number: str = Form(...),
-    db: Session = Depends(get_db)
-):
-    # Save the uploaded file
-    file_path = UPLOAD_DIR / file.filename
-    with open(file_path, "wb") as f:
-        f.write(await file.read())
-    
-    # Run inference
-    results = model(str(file_path))
+# Results of previously seen images, keyed by image bytes and model identity
+result_caches = {name: ResultCache(worker_pool.model_params(name)) for name in model_registry.versions}
+
+def get_result_cache(model=None):
+    try:
+        return result_caches[model or model_registry.default]
+    except KeyError:
+        raise HTTPException(status_code=400, detail=f"Unknown model: {model}")
+
+def find_cached_detection(content_hash):
+    # Short-lived session so no connection is held while the request waits
+    with SessionLocal() as db:
+        return (
+            db.query(Detection)
+            .filter(Detection.content_hash == content_hash)
+            .order_by(Detection.id.desc())
+            .first()
+        )
+
+# Region-of-interest profiles by chamber number (see roi.py)
+chamber_profiles = ProfileStore()
+
+async def detect(image, model=None, profile=None, tiling=None):
+    """Run inference on the chamber profile's regions of interest if there is
+    one, else on overlapping tiles for a large image, else on the whole image"""
+    with stage("inference"):
+        if profile is not None:
+            return await infer_rois(get_engine(model, profile.imgsz), image, profile.rois)
+        if tiling is not None and tiling.applies(image):
+            return await infer_tiles(get_engine(model, tiling.size, tiling.batch_size), image, tiling,
+                                     worker_pool.run_io)
+        return await get_engine(model).infer(image)
+
+def inference_params(profile=None, tiling=None):
+    """Parameters besides the model that change an image's detections, for the result cache key"""
+    if profile is not None:
+        return profile_params(profile)
+    if tiling is not None:
+        return tiling.params()
+    return None
+
+async def lookup_result(data, result_cache, params=None):
+    """Return (content_hash, cached entry or None) for encoded image bytes"""
+    content_hash = await worker_pool.run_io(result_cache.key, data, params)
+    cached = result_cache.get(content_hash)
+    if cached is None:
+        # Fall back to the detections table, e.g. after a restart
+        row = await worker_pool.run_io(find_cached_detection, content_hash)
+        if row is not None:
+            # Rows from batch.py point at the archived file, which may move;
+            # only content-addressed originals are shared
+            image_path = row.image_path if is_content_addressed(row.image_path) else None
+            result_cache.record_db_hit()
+            result_cache.put(content_hash, row.detections, image_path)
+            cached = {"detections": row.detections, "image_path": image_path}
+        else:
+            result_cache.record_miss()
+    return content_hash, cached
+
+async def inspect_image(data, chamber_number, background_tasks, model=None, tiled=None):
+    """Run the decoded-in-memory inspection pipeline for one encoded image.
+
+    ``tiled`` forces tiled inference on or off; by default large images
+    are tiled (see tiling.py). Chambers with a profile are never tiled.
+    """
+    # Identical images are answered from the result cache, even while the
+    # model is still loading; they share the original's content-addressed file
+    result_cache = get_result_cache(model)
+    profile = await worker_pool.run_io(chamber_profiles.get, chamber_number)
+    tiling = tiling_for(tiled) if profile is None else None
+    if tiling is not None and not tiling.always:
+        # Only images that will be tiled get the tile settings in their cache
+        # key, so full-frame keys stay the same as without tiling
+        size = await worker_pool.run_io(image_size, data)
+        if size is not None and not tiling.applies_to_size(*size):
+            tiling = None
+    with stage("cache_lookup"):
+        content_hash, cached = await lookup_result(data, result_cache, inference_params(profile, tiling))
+    if cached is not None:
+        return await store_inspection(
+            data, cached["detections"], chamber_number, background_tasks,
+            content_hash=content_hash, image_path=cached["image_path"], cached=True, model=model
+        )
     
-    # Save the result image with bounding boxes
-    result_path = RESULT_DIR / f"result_{file.filename}"
-    result_img = results[0].plot()
-    cv2.imwrite(str(result_path), result_img)
+    # Fail fast while the model is loading
+    get_engine(model)
+    with stage("decode"):
+        image = await worker_pool.run_io(decode_image, data)
     
-    # Get detection results
-    detections = []
-    for r in results:
-        for box in r.boxes:
-            detection = {
-                "class": model.names[int(box.cls)],
-                "confidence": float(box.conf),
-                "bbox": box.xyxy[0].tolist()
-            }
-            detections.append(detection)
+    # Run inference (batched with other concurrent requests)
+    detections = await detect(image, model, profile, tiling)
     
-    # Save to database
-    db_detection = Detection(
-        chamber_number=chamber_number,
-        image_path=str(file_path),
-        result_image_path=str(result_path),
-        detections=detections
+    return await store_inspection(
+        data, detections, chamber_number, background_tasks, content_hash=content_hash, model=model
     )
-    db.add(db_detection)
-    db.commit()
-    db.refresh(db_detection)
+
+async def store_inspection(data, detections, chamber_number, background_tasks=None,
+                           content_hash=None, image_path=None, cached=False, model=None):
+    """Save the original image and the Detection row for an inspected image.
+
+    The annotated image is not rendered here; it is drawn from the stored
+    boxes when someone requests /detection/{id}/image. Originals are
+    stored under the SHA-256 of their bytes (see imaging.original_filename),
+    so identical images share one file that never changes; an
+    ``image_path`` from a cache hit that is already that file is reused.
+    """
+    # Save the original, after the response has been sent when possible
+    if SAVE_ORIGINALS and data is not None:
+        file_path = UPLOAD_DIR / await worker_pool.run_io(original_filename, data)
+        if image_path != str(file_path):
+            image_path = str(file_path)
+            queue_write(file_path, data)
+            if background_tasks is not None:
+                background_tasks.add_task(write_behind, file_path, data)
+            else:
+                await worker_pool.run_io(write_behind, file_path, data)
+    
+    # Save to database (acknowledged once the group commit is durable)
+    with stage("db_write"):
+        db_detection = await detection_writer.write(new_detection(
+            chamber_number=chamber_number,
+            image_path=image_path,
+            detections=detections,
+            content_hash=content_hash
+        ))
+    if content_hash is not None:
+        get_result_cache(model).put(content_hash, detections, image_path)
     
     return {
         "id": db_detection.id,
         "chamber_number": chamber_number,
-        "result_image": str(result_path),
+        "result_image": f"/detection/{db_detection.id}/image" if image_path else None,
         "detections": detections,
+        "cached": cached,
         "timestamp": db_detection.timestamp
     }
 
+@app.get("/model/info")
+async def get_model_info():
+    """Get the model input size so clients can downscale frames before uploading"""
+    spec = model_registry.versions[model_registry.default]
+    return {
+        "weights": spec.weights,
+        "backend": spec.backend,
+        "int8": spec.int8,
+        "imgsz": worker_pool.imgsz,
+        "capture_formats": list(IMAGE_EXTENSIONS),
+        "models": model_registry.status()["models"],
+    }
+
+@app.get("/healthz")
+async def healthz():
+    """Liveness: the process is up and serving requests"""
+    return {"status": "ok"}
+
+def check_database():
+    with SessionLocal() as db:
+        db.execute(text("SELECT 1"))
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness: 200 once the default model is loaded and the database answers, 503 until then"""
+    try:
+        await worker_pool.run_io(check_database)
+        database = "ok"
+    except Exception as e:
+        database = str(e)
+    ready = model_registry.is_ready() and database == "ok"
+    body = {
+        "ready": ready,
+        "database": database,
+        "app_ready_seconds": app_ready_seconds,
+        "model_ready_seconds": model_registry.ready_seconds,
+        **model_registry.status(),
+    }
+    if ready:
+        return body
+    return JSONResponse(body, status_code=503, headers={"Retry-After": str(RETRY_AFTER_SECONDS)})
+
+@app.post("/upload")
+async def upload_file(
+    background_tasks: BackgroundTasks,
+    file: UploadFile, 
+    chamber_number: str = Form(...),
+    model: str = Form(None),
+    tiled: Optional[bool] = Form(None)
+):
+    data = await read_upload(file)
+    return await inspect_image(data, chamber_number, background_tasks, model, tiled)
+
 @app.post("/capture")
 async def capture_image(
+    background_tasks: BackgroundTasks,
     image_data: str = Form(...), 
     chamber_number: str = Form(...),
-    db: Session = Depends(get_db)
+    model: str = Form(None),
+    tiled: Optional[bool] = Form(None)
 ):
-    # Convert base64 image to file
-    image_data = image_data.split(",")[1]
-    image_bytes = io.BytesIO(base64.b64decode(image_data))
-    image = Image.open(image_bytes)
-    
-    # Generate filename with timestamp
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"capture_{chamber_number}_{timestamp}.jpg"
-    
-    # Save captured image
-    file_path = UPLOAD_DIR / filename
-    image.save(file_path)
-    
-    # Run inference
-    results = model(str(file_path))
-    
-    # Save result image
-    result_path = RESULT_DIR / f"result_{filename}"
-    result_img = results[0].plot()
-    cv2.imwrite(str(result_path), result_img)
-    
-    # Get detection results
-    detections = []
-    for r in results:
-        for box in r.boxes:
-            detection = {
-                "class": model.names[int(box.cls)],
-                "confidence": float(box.conf),
-                "bbox": box.xyxy[0].tolist()
-            }
-            detections.append(detection)
-    
-    # Save to database
-    db_detection = Detection(
-        chamber_number=chamber_number,
-        image_path=str(file_path),
-        result_image_path=str(result_path),
-        detections=detections
-    )
-    db.add(db_detection)
-    db.commit()
-    db.refresh(db_detection)
-    
-    return {
-        "id": db_detection.id,
-        "chamber_number": chamber_number,
-        "result_image": str(result_path),
-        "detections": detections,
-        "timestamp": db_detection.timestamp
-    }
+    """Legacy capture with the frame sent as a base64 data URL form field"""
+    data = decode_base64_image(image_data)
+    return await inspect_image(data, chamber_number, background_tasks, model, tiled)
+
+@app.post("/capture/binary")
+async def capture_binary(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    chamber_number: str,
+    model: str = None,
+    tiled: Optional[bool] = None
+):
+    """Capture with the frame sent as the raw JPEG/WebP/PNG request body"""
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    if content_type not in IMAGE_EXTENSIONS:
+        raise HTTPException(status_code=415, detail=f"Unsupported image type: {content_type or 'none'}")
+    data = await read_body(request)
+    if not data:
+        raise HTTPException(status_code=400, detail="Empty request body")
+    return await inspect_image(data, chamber_number, background_tasks, model, tiled)
+
+# Number of recently processed live frames kept so one can be committed
+LIVE_RECENT_FRAMES = 5
+
+@app.websocket("/ws/inspect")
+async def live_inspection(websocket: WebSocket, chamber_number: str, model: str = None):
+    """Continuous inspection of a camera stream.
+
+    Binary messages are encoded frames; each processed frame is answered
+    with {"frame_id", "detections", "dropped"}. Frames that arrive while
+    the previous one is still being inferred replace each other, so only
+    the newest is processed. A text message {"action": "commit",
+    "frame_id": n} stores that frame as a Detection row.
+    """
+    await websocket.accept()
+    slot = LatestFrameSlot()
+    recent = OrderedDict()
+    profile = await worker_pool.run_io(chamber_profiles.get, chamber_number)
+
+    async def process_frames():
+        while True:
+            frame_id, data = await slot.take()
+            try:
+                with stage("decode"):
+                    image = await worker_pool.run_io(decode_image, data)
+                detections = await detect(image, model, profile)
+            except HTTPException as e:
+                await websocket.send_json({"frame_id": frame_id, "error": e.detail})
+                continue
+            except Exception as e:
+                await websocket.send_json({"frame_id": frame_id, "error": str(e)})
+                continue
+
+            recent[frame_id] = (data, detections)
+            while len(recent) > LIVE_RECENT_FRAMES:
+                recent.popitem(last=False)
+
+            await websocket.send_json({
+                "frame_id": frame_id,
+                "detections": detections,
+                "dropped": slot.dropped,
+            })
+
+    async def commit_frame(frame_id):
+        if frame_id not in recent:
+            await websocket.send_json({"action": "commit", "frame_id": frame_id, "error": "Frame no longer available"})
+            return
+        data, detections = recent[frame_id]
+        stored = await store_inspection(data, detections, chamber_number, model=model)
+        stored["timestamp"] = stored["timestamp"].isoformat()
+        await websocket.send_json({"action": "commit", "frame_id": frame_id, **stored})
+
+    processor = asyncio.create_task(process_frames())
+    frame_counter = 0
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            if message.get("bytes") is not None:
+                frame_counter += 1
+                slot.put(frame_counter, message["bytes"])
+            elif message.get("text"):
+                try:
+                    command = json.loads(message["text"])
+                except ValueError:
+                    continue
+                if command.get("action") == "commit":
+                    await commit_frame(command.get("frame_id"))
+    except WebSocketDisconnect:
+        pass
+    finally:
+        processor.cancel()
+
+# Frames in flight per video pipeline stage; enough for full inference batches
+VIDEO_PIPELINE_DEPTH = MAX_BATCH_SIZE * worker_pool.workers
+
+@app.post("/inspect/video")
+async def inspect_video(
+    file: UploadFile,
+    chamber_number: str = Form(...),
+    frame_step: int = Form(VIDEO_FRAME_STEP),
+    dedup_threshold: float = Form(VIDEO_DEDUP_THRESHOLD),
+    max_frames: int = Form(VIDEO_MAX_FRAMES),
+    model: str = Form(None),
+):
+    """Inspect a video file and stream the results as NDJSON.
+
+    A decode thread samples every ``frame_step``-th frame, optionally
+    skipping near-duplicates, and the kept frames go through batched
+    inference and are stored as Detection rows. Decoding, inference and
+    storage overlap. One line is sent per stored frame, then a summary line
+    with "done": true.
+    """
+    suffix = Path(file.filename or "").suffix.lower()
+    if suffix not in VIDEO_EXTENSIONS:
+        raise HTTPException(status_code=415, detail=f"Unsupported video type: {suffix or 'none'}")
+    profile = await worker_pool.run_io(chamber_profiles.get, chamber_number)
+    get_engine(model)
+
+    # Named by time and a random token, never by client input
+    stamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    video_path = UPLOAD_DIR / f"video_{stamp}_{secrets.token_hex(4)}{suffix}"
+    await worker_pool.run_io(save_upload, file.file, video_path, MAX_VIDEO_BYTES)
+    try:
+        info = await worker_pool.run_io(probe_video, video_path)
+    except ValueError as e:
+        await worker_pool.run_io(os.remove, video_path)
+        raise HTTPException(status_code=400, detail=str(e))
+
+    sampler = FrameSampler(frame_step, dedup_threshold)
+    decoder = VideoDecoder(video_path, sampler, max_frames)
+
+    def cleanup():
+        decoder.stop()
+        try:
+            os.remove(video_path)
+        except FileNotFoundError:
+            pass
+
+    async def infer_frame(item):
+        index, position_ms, frame = item
+        return index, position_ms, frame, await detect(frame, model, profile)
+
+    async def store_frame(item):
+        index, position_ms, frame, detections = item
+        with stage("encode"):
+            data = await worker_pool.run_io(encode_jpeg, frame) if SAVE_ORIGINALS else None
+        stored = await store_inspection(data, detections, chamber_number, model=model)
+        return {"frame_index": index, "position_ms": position_ms, **stored}
+
+    async def stream():
+        frames = 0
+        try:
+            async for result in pipelined(decoder.frames(), [infer_frame, store_frame], VIDEO_PIPELINE_DEPTH):
+                frames += 1
+                yield json.dumps(result, default=str) + "\n"
+            summary = {"done": True}
+        except Exception as e:
+            summary = {"done": False, "error": str(e)}
+        finally:
+            # Also runs when the client disconnects mid-stream
+            cleanup()
+        yield json.dumps({
+            **summary,
+            "frames": frames,
+            "decoded": sampler.decoded,
+            "duplicates": sampler.duplicates,
+            "video": info,
+        }) + "\n"
+
+    # The background task removes the file even if the stream never starts,
+    # e.g. when the client disconnects before the response begins
+    return StreamingResponse(stream(), media_type="application/x-ndjson", background=BackgroundTask(cleanup))
+
+class ChamberProfileIn(BaseModel):
+    rois: List[List[float]]  # [x1, y1, x2, y2] as fractions of the image size
+    imgsz: Optional[int] = None
+
+@app.get("/chambers/{chamber_number}/profile")
+def get_chamber_profile(chamber_number: str):
+    """Get the regions of interest inspected for a chamber"""
+    profile = chamber_profiles.get(chamber_number)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Chamber has no profile, the whole frame is inspected")
+    return profile._asdict()
+
+@app.put("/chambers/{chamber_number}/profile")
+def put_chamber_profile(chamber_number: str, profile: ChamberProfileIn):
+    """Only inspect these regions of a chamber's images, at imgsz (default ROI_IMGSZ)"""
+    try:
+        return chamber_profiles.save(chamber_number, profile.rois, profile.imgsz)._asdict()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.delete("/chambers/{chamber_number}/profile")
+def delete_chamber_profile(chamber_number: str):
+    """Go back to full-frame inspection for a chamber"""
+    if not chamber_profiles.delete(chamber_number):
+        raise HTTPException(status_code=404, detail="Chamber has no profile")
+    return {"message": "Profile deleted"}
 
 @app.get("/detections")
-async def get_detections(
+def get_detections(
     chamber_number: str = None,
+    since: datetime = None,
+    until: datetime = None,
+    cursor: str = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+    fields: str = None,
     db: Session = Depends(get_db)
-) -> List[Detection]:
-    """Get all detections, optionally filtered by chamber number"""
-    query = db.query(Detection)
+):
+    """Get one page of detections, newest first.
+
+    Pages are keyset-paginated on (timestamp, id): pass the returned
+    ``next_cursor`` to get the following page. ``fields`` is a
+    comma-separated projection, e.g. fields=chamber_number,detections.
+    """
+    names = parse_fields(fields)
+    limit = min(max(limit, 1), MAX_PAGE_SIZE)
+
+    query = db.query(*(DETECTION_FIELDS[name] for name in names))
+    query = filter_detections(query, chamber_number, since, until)
+    if cursor:
+        query = after_cursor(query, cursor)
+    rows = query.order_by(Detection.timestamp.desc(), Detection.id.desc()).limit(limit + 1).all()
+
+    items = [dict(zip(names, row)) for row in rows[:limit]]
+    next_cursor = None
+    if len(rows) > limit:
+        last = items[-1]
+        next_cursor = encode_cursor(last["timestamp"], last["id"])
+    return {"items": items, "next_cursor": next_cursor}
+
+# Columns written by /detections/export
+EXPORT_FIELDS = ["id", "chamber_number", "timestamp", "image_path", "detections"]
+
+def export_rows(chamber_number, since, until, as_text):
+    """Yield chunks of export rows straight from a streaming cursor.
+
+    The session is owned by the generator so it stays open while the
+    response is being streamed.
+    """
+    with SessionLocal() as db:
+        query = db.query(*(DETECTION_FIELDS[name] for name in EXPORT_FIELDS))
+        query = filter_detections(query, chamber_number, since, until)
+        statement = query.order_by(Detection.timestamp, Detection.id).statement
+        result = db.execute(statement.execution_options(stream_results=True, yield_per=EXPORT_CHUNK_ROWS))
+        for rows in result.partitions():
+            yield [
+                (
+                    row.id,
+                    row.chamber_number,
+                    row.timestamp.isoformat(),
+                    row.image_path,
+                    json.dumps(row.detections) if as_text else row.detections,
+                )
+                for row in rows
+            ]
+
+@app.get("/detections/export")
+def export_detections(
+    format: str = "csv",
+    chamber_number: str = None,
+    since: datetime = None,
+    until: datetime = None
+):
+    """Stream detections as CSV or NDJSON, oldest first, in constant memory"""
+    if format == "csv":
+        body = csv_chunks(EXPORT_FIELDS, export_rows(chamber_number, since, until, as_text=True))
+        media_type = "text/csv"
+    elif format == "ndjson":
+        body = ndjson_chunks(EXPORT_FIELDS, export_rows(chamber_number, since, until, as_text=False))
+        media_type = "application/x-ndjson"
+    else:
+        raise HTTPException(status_code=400, detail="format must be csv or ndjson")
+
+    filename = f"detections.{format}"
+    return StreamingResponse(body, media_type=media_type,
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+@app.get("/analytics/class-counts")
+def get_class_counts(
+    chamber_number: str = None,
+    since: datetime = None,
+    until: datetime = None,
+    db: Session = Depends(get_db)
+):
+    """Count detected boxes per class, optionally per chamber and time range"""
+    query = db.query(
+        DetectionBox.class_name,
+        func.count(DetectionBox.id),
+        func.avg(DetectionBox.confidence),
+    )
     if chamber_number:
-        query = query.filter(Detection.chamber_number == chamber_number)
-    return query.all()
+        query = query.filter(DetectionBox.chamber_number == chamber_number)
+    if since:
+        query = query.filter(DetectionBox.timestamp >= since)
+    if until:
+        query = query.filter(DetectionBox.timestamp < until)
+    rows = query.group_by(DetectionBox.class_name).all()
+    return [
+        {"class": class_name, "count": count, "avg_confidence": avg_confidence}
+        for class_name, count, avg_confidence in rows
+    ]
+
+@app.get("/stats")
+def get_stats(
+    chamber_number: str = None,
+    bucket: str = "hour",
+    since: datetime = None,
+    until: datetime = None,
+    db: Session = Depends(get_db)
+):
+    """Get good/missing screw counts and defect rates per hour or day bucket"""
+    if bucket not in BUCKETS:
+        raise HTTPException(status_code=400, detail=f"bucket must be one of: {', '.join(BUCKETS)}")
+    return query_stats(db, bucket, chamber_number, since, until)
+
+@app.get("/inference/stats")
+async def get_inference_stats():
+    """Get batch size and queue wait statistics of each model's inference engine"""
+    return model_registry.stats()
 
 @app.get("/detection/{detection_id}")
-async def get_detection(
+def get_detection(
     detection_id: int,
     db: Session = Depends(get_db)
-) -> Detection:
+):
     """Get a specific detection by ID"""
-    return db.query(Detection).filter(Detection.id == detection_id).first()
+    names = list(DETECTION_FIELDS)
+    row = (
+        db.query(*(DETECTION_FIELDS[name] for name in names))
+        .filter(Detection.id == detection_id)
+        .first()
+    )
+    if row is None:
+        raise HTTPException(status_code=404, detail="Detection not found")
+    return dict(zip(names, row))
+
+# Rendered annotated images, shared by all requests
+render_cache = RenderCache()
+
+@app.get("/detection/{detection_id}/image")
+def get_detection_image(
+    detection_id: int,
+    request: Request,
+    size: int = None,
+    format: str = "jpeg",
+    quality: int = 85,
+    db: Session = Depends(get_db)
+):
+    """Render the annotated image of a detection from its stored boxes.
+
+    ``size`` limits the longest side (e.g. size=200&format=webp for a
+    thumbnail). Renders are cached and marked immutable, since a stored
+    detection never changes.
+    """
+    if format not in RENDER_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported format: {format}")
+    if size is not None:
+        size = min(max(size, 16), 4096)
+    quality = min(max(quality, 1), 100)
+
+    detection = db.query(Detection).filter(Detection.id == detection_id).first()
+    if detection is None:
+        raise HTTPException(status_code=404, detail="Detection not found")
+    if not detection.image_path:
+        raise HTTPException(status_code=404, detail="Original image was not stored")
+
+    media_type = RENDER_FORMATS[format][0]
+    key = (detection.id, detection.timestamp.isoformat(), detection.image_path, size, format, quality)
+    etag = '"' + hashlib.sha1(repr(key).encode()).hexdigest() + '"'
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=31536000, immutable"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    content = render_cache.get(key)
+    if content is None:
+        try:
+            with stage("decode"):
+                image = decode_image(read_file(detection.image_path))
+        except FileNotFoundError:
+            raise HTTPException(status_code=404, detail="Original image not found")
+        with stage("render"):
+            content = render_detections(image, detection.detections or [], size, format, quality)
+        render_cache.put(key, content)
+    return Response(content=content, media_type=media_type, headers=headers)
+
+@app.get("/cache/stats")
+async def get_cache_stats():
+    """Get hit/miss counters of each model's content-hash result cache"""
+    return {name: cache.stats() for name, cache in result_caches.items()}
+
+@app.get("/writer/stats")
+async def get_writer_stats():
+    """Get group commit statistics of the Detection writer"""
+    return detection_writer.stats()
+
+MODEL_READY = metrics.Gauge("iqms_model_ready", "1 once a model version has loaded", ["model"])
+CACHE_LOOKUPS = metrics.Gauge("iqms_result_cache_lookups", "Result cache lookups since startup", ["model", "result"])
+
+@metrics.on_collect
+def collect_app_metrics():
+    for name in model_registry.versions:
+        MODEL_READY.labels(name).set(1 if model_registry.is_ready(name) else 0)
+    for name, cache in result_caches.items():
+        stats = cache.stats()
+        for result in ("hits", "db_hits", "misses"):
+            CACHE_LOOKUPS.labels(name, result).set(stats[result])
+
+@app.get("/metrics")
+async def get_metrics():
+    """Request, pipeline stage, batching, queue and database metrics in the Prometheus text format"""
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+def check_profile_token(token):
+    if not token_ok(token):
+        raise HTTPException(status_code=403,
+                            detail="Profiling needs IQMS_PROFILE_TOKEN (sent as X-Profile-Token) or IQMS_PROFILING=1")
+
+@app.get("/profiles")
+async def list_profiles(x_profile_token: str = Header(None)):
+    """List saved request profiles, newest first"""
+    check_profile_token(x_profile_token)
+    return await worker_pool.run_io(saved_profiles.list)
+
+@app.get("/profiles/{name}")
+async def download_profile(name: str, x_profile_token: str = Header(None)):
+    """Download a saved profile (.collapsed stacks or .prof pstats)"""
+    check_profile_token(x_profile_token)
+    path = saved_profiles.path(name)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    media_type = "text/plain" if path.suffix == ".collapsed" else "application/octet-stream"
+    return FileResponse(path, media_type=media_type, filename=name)
+
+@app.get("/render/stats")
+async def get_render_stats():
+    """Get hit/miss statistics of the rendered image cache"""
+    return render_cache.stats()
 
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
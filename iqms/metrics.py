@@ -0,0 +1,263 @@
+# metrics.py
+"""Lightweight in-process metrics in the Prometheus text format.
+
+Counters, gauges and histograms are plain Python objects guarded by a lock,
+cheap enough to leave on in production. ``stage(name)`` times one step of
+the inspection pipeline into a histogram and into the current request's
+breakdown, which MetricsMiddleware logs when a request is slow.
+"""
+import bisect
+import contextvars
+import logging
+import os
+import threading
+import time
+
+# Requests slower than this are logged with their per-stage timings; 0 disables
+SLOW_REQUEST_MS = float(os.environ.get("IQMS_SLOW_REQUEST_MS", "1000"))
+
+# Latency buckets in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+logger = logging.getLogger("uvicorn.error")
+
+_metrics = []
+_collectors = []
+# Stage timings of the request being handled, {stage: seconds}
+_request_stages = contextvars.ContextVar("request_stages", default=None)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, v in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def labels(self, *values):
+        values = tuple(str(v) for v in values)
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for values, child in sorted(self._children.items()):
+            lines.extend(self._render_child(values, child))
+        return lines
+
+
+class _Value:
+    def __init__(self):
+        self.value = 0.0
+        self.function = None
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    def set(self, value):
+        self.value = value
+
+    def set_function(self, function):
+        """Read the value from function() whenever metrics are collected"""
+        self.function = function
+
+    def get(self):
+        return self.function() if self.function is not None else self.value
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def _render_child(self, values, child):
+        yield f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.get())}"
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def set(self, value):
+        self.labels().set(value)
+
+
+class _Buckets:
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _Buckets(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def _render_child(self, values, child):
+        with child._lock:
+            counts, total = list(child.counts), child.sum
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += count
+            labels = _format_labels(self.labelnames, values, [("le", _format_value(float(bound)))])
+            yield f"{self.name}_bucket{labels} {cumulative}"
+        labels = _format_labels(self.labelnames, values)
+        yield f"{self.name}_sum{labels} {_format_value(total)}"
+        yield f"{self.name}_count{labels} {cumulative}"
+
+
+def on_collect(function):
+    """Call function() before every /metrics render, e.g. to refresh gauges"""
+    _collectors.append(function)
+    return function
+
+
+def render():
+    for collect in _collectors:
+        collect()
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+HTTP_REQUESTS = Counter("iqms_http_requests_total", "HTTP requests by route and status", ["method", "route", "status"])
+HTTP_ERRORS = Counter("iqms_http_request_errors_total", "HTTP requests that failed with a 5xx or an exception",
+                      ["method", "route"])
+HTTP_LATENCY = Histogram("iqms_http_request_duration_seconds", "HTTP request latency until the response is sent",
+                         ["method", "route"])
+HTTP_IN_PROGRESS = Gauge("iqms_http_requests_in_progress", "HTTP requests being handled")
+STAGE_LATENCY = Histogram("iqms_stage_duration_seconds", "Time spent in each inspection pipeline stage", ["stage"])
+
+BATCH_SIZE = Histogram("iqms_inference_batch_size", "Images per model call", ["engine"], buckets=SIZE_BUCKETS)
+BATCH_LATENCY = Histogram("iqms_inference_batch_duration_seconds", "Duration of one batched model call", ["engine"])
+QUEUE_WAIT = Histogram("iqms_inference_queue_wait_seconds", "Time an image waited to be batched", ["engine"])
+QUEUE_DEPTH = Gauge("iqms_queue_depth", "Items waiting in a queue", ["queue"])
+
+DB_COMMIT_LATENCY = Histogram("iqms_db_commit_duration_seconds", "Duration of one group commit")
+DB_COMMIT_ROWS = Histogram("iqms_db_commit_rows", "Rows written per group commit", buckets=SIZE_BUCKETS)
+DB_WRITE_FAILURES = Counter("iqms_db_write_failures_total", "Rows that could not be written")
+
+
+class stage:
+    """Context manager timing one pipeline stage, usable around awaits"""
+
+    __slots__ = ("name", "started")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.started
+        STAGE_LATENCY.labels(self.name).observe(elapsed)
+        stages = _request_stages.get()
+        if stages is not None:
+            stages[self.name] = stages.get(self.name, 0.0) + elapsed
+        return False
+
+
+class MetricsMiddleware:
+    """ASGI middleware counting and timing every HTTP request.
+
+    Requests are labelled by their route template (e.g. /detection/{detection_id})
+    so the number of series stays bounded.
+    """
+
+    def __init__(self, app, slow_request_ms=SLOW_REQUEST_MS):
+        self.app = app
+        self.slow_request_ms = slow_request_ms
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        started = time.perf_counter()
+        finished = None
+        status = 500
+        stages = {}
+        token = _request_stages.set(stages)
+
+        async def send_wrapper(message):
+            nonlocal status, finished
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                # Background tasks run after this and don't count towards latency
+                finished = time.perf_counter()
+
+        HTTP_IN_PROGRESS.labels().inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception:
+            status = 500
+            raise
+        finally:
+            _request_stages.reset(token)
+            HTTP_IN_PROGRESS.labels().dec()
+            elapsed = (finished or time.perf_counter()) - started
+            method = scope["method"]
+            route = getattr(scope.get("route"), "path", "unmatched")
+            HTTP_REQUESTS.labels(method, route, status).inc()
+            HTTP_LATENCY.labels(method, route).observe(elapsed)
+            if status >= 500:
+                HTTP_ERRORS.labels(method, route).inc()
+            if self.slow_request_ms and elapsed * 1000.0 >= self.slow_request_ms:
+                breakdown = ", ".join(f"{name} {seconds * 1000.0:.1f}ms" for name, seconds in stages.items())
+                logger.warning("Slow request %s %s: %.1fms, status %s (%s)", method, scope["path"],
+                               elapsed * 1000.0, status, breakdown or "no stages recorded")
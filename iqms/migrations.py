@@ -0,0 +1,101 @@
+# migrations.py
+"""One-off data migrations for ml_app.db.
+
+Usage:
+    python migrations.py backfill-boxes [--chunk-size N]
+    python migrations.py rebuild-rollups [--chunk-size N]
+"""
+import argparse
+
+from sqlalchemy import select, exists
+
+from database import engine, SessionLocal, Detection, DetectionBox, QualityRollup
+from rollups import rollup_increments, apply_increments
+
+
+def backfill_boxes(chunk_size=1000):
+    """Create detection_boxes rows for detections stored before the table existed.
+
+    Detections are walked in id order, one chunk per transaction, so the
+    migration can be interrupted and re-run safely.
+    """
+    detections = Detection.__table__
+    boxes = DetectionBox.__table__
+    last_id = 0
+    total_detections = 0
+    total_boxes = 0
+
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(
+                select(detections.c.id, detections.c.chamber_number, detections.c.timestamp, detections.c.detections)
+                .where(detections.c.id > last_id)
+                .where(~exists().where(boxes.c.detection_id == detections.c.id))
+                .order_by(detections.c.id)
+                .limit(chunk_size)
+            ).all()
+            if not rows:
+                break
+
+            box_rows = []
+            for row in rows:
+                for detection in row.detections or []:
+                    x1, y1, x2, y2 = detection["bbox"]
+                    box_rows.append({
+                        "detection_id": row.id,
+                        "chamber_number": row.chamber_number,
+                        "timestamp": row.timestamp,
+                        "class_name": detection["class"],
+                        "confidence": detection["confidence"],
+                        "x1": x1, "y1": y1, "x2": x2, "y2": y2,
+                    })
+            if box_rows:
+                conn.execute(boxes.insert(), box_rows)
+
+        last_id = rows[-1].id
+        total_detections += len(rows)
+        total_boxes += len(box_rows)
+        print(f"Backfilled {total_boxes} boxes from {total_detections} detections (up to id {last_id})")
+
+    return total_detections, total_boxes
+
+
+def rebuild_rollups(chunk_size=1000):
+    """Recompute quality_rollups from scratch out of the detections table.
+
+    Runs in a single transaction so readers never see a half-built table;
+    the app's writes wait on SQLite's lock until it finishes.
+    """
+    detections = Detection.__table__
+    with SessionLocal() as session:
+        session.query(QualityRollup).delete()
+
+        total = 0
+        result = session.execute(
+            select(detections.c.chamber_number, detections.c.timestamp, detections.c.detections)
+            .execution_options(yield_per=chunk_size)
+        )
+        for chunk in result.partitions():
+            apply_increments(session, rollup_increments(chunk))
+            total += len(chunk)
+            print(f"Rolled up {total} detections")
+
+        session.commit()
+    return total
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Data migrations for ml_app.db")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    backfill = subparsers.add_parser("backfill-boxes", help="Fill detection_boxes from the detections JSON column")
+    backfill.add_argument("--chunk-size", type=int, default=1000)
+
+    rebuild = subparsers.add_parser("rebuild-rollups", help="Recompute quality_rollups from the detections table")
+    rebuild.add_argument("--chunk-size", type=int, default=1000)
+
+    args = parser.parse_args()
+    if args.command == "backfill-boxes":
+        backfill_boxes(args.chunk_size)
+    elif args.command == "rebuild-rollups":
+        rebuild_rollups(args.chunk_size)
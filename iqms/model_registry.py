@@ -0,0 +1,207 @@
+# model_registry.py
+"""Named model versions, loaded lazily.
+
+Nothing heavy (ultralytics, torch, ONNX Runtime, OpenVINO) is imported
+until a model is first loaded, so importing this module is cheap.
+
+Versions come from IQMS_MODELS as comma-separated name=weights pairs, each
+optionally followed by @backend, e.g. "default=yolov8n.pt,v2=yolov8s.pt@openvino".
+"""
+import asyncio
+import functools
+import os
+import threading
+import time
+from collections import namedtuple
+
+from backends import load_model, BACKEND, INT8
+from inference import BatchInferenceEngine, MAX_BATCH_SIZE, MAX_WAIT_MS
+
+ModelSpec = namedtuple("ModelSpec", ["name", "weights", "backend", "int8"])
+
+
+class UnknownModel(ValueError):
+    pass
+
+
+class ModelNotReady(RuntimeError):
+    pass
+
+
+def parse_versions(text, backend=BACKEND, int8=INT8):
+    versions = {}
+    for item in text.split(","):
+        if not item.strip():
+            continue
+        name, _, weights = item.partition("=")
+        if not name.strip() or not weights.strip():
+            raise ValueError(f"Invalid model version {item.strip()!r}, expected name=weights[@backend]")
+        weights, _, item_backend = weights.partition("@")
+        versions[name.strip()] = ModelSpec(name.strip(), weights.strip(), item_backend.strip() or backend, int8)
+    return versions
+
+
+# Model versions (can be overridden through the environment)
+MODEL_VERSIONS = parse_versions(os.environ.get("IQMS_MODELS", "default=yolov8n.pt"))
+DEFAULT_MODEL = os.environ.get("IQMS_DEFAULT_MODEL") or next(iter(MODEL_VERSIONS))
+
+# Models loaded by the current thread; ultralytics models are not thread-safe
+_local = threading.local()
+
+
+def register_model(name, weights, backend=BACKEND, int8=INT8):
+    spec = MODEL_VERSIONS[name] = ModelSpec(name, weights, backend, int8)
+    return spec
+
+
+def get_spec(name=None):
+    name = name or DEFAULT_MODEL
+    try:
+        return MODEL_VERSIONS[name]
+    except KeyError:
+        raise UnknownModel(f"Unknown model: {name}")
+
+
+def load(name=None):
+    """Load a new instance of a model version"""
+    spec = get_spec(name)
+    return load_model(spec.weights, spec.backend, spec.int8)
+
+
+def get_model(name=None):
+    """Return the calling thread's instance of a model version, loading it on first use"""
+    spec = get_spec(name)
+    models = getattr(_local, "models", None)
+    if models is None:
+        models = _local.models = {}
+    if spec.name not in models:
+        models[spec.name] = load(spec.name)
+    return models[spec.name]
+
+
+def warm_up(model, imgsz=640):
+    """Run a blank frame so the first real image doesn't pay the lazy setup cost"""
+    import numpy as np
+
+    model(np.zeros((imgsz, imgsz, 3), dtype=np.uint8), imgsz=imgsz, verbose=False)
+
+
+class ModelRegistry:
+    """Serves the named model versions from one WorkerPool.
+
+    Every version gets its own BatchInferenceEngine, since one model call
+    can't mix models. After start() the versions load in the background,
+    default first, by warming up the pool's workers; infer() raises
+    ModelNotReady until the requested version has loaded.
+    """
+
+    def __init__(self, worker_pool, versions=None, default=None, max_batch_size=MAX_BATCH_SIZE,
+                 max_wait_ms=MAX_WAIT_MS, started=None, on_loaded=None):
+        self.worker_pool = worker_pool
+        self.versions = dict(versions if versions is not None else MODEL_VERSIONS)
+        self.default = default or DEFAULT_MODEL
+        if self.default not in self.versions:
+            raise UnknownModel(f"Unknown model: {self.default}")
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.engines = {name: self._new_engine(name) for name in self.versions}
+        # Engines for other input or batch sizes (region-of-interest crops,
+        # tiles), created on demand
+        self.sized_engines = {}
+        self.state = {name: {"state": "pending", "load_seconds": None, "error": None} for name in self.versions}
+        # Reference point for the reported time to readiness
+        self.started = started if started is not None else time.perf_counter()
+        self.ready_seconds = None
+        # Called with (name, state) after each version loads or fails
+        self.on_loaded = on_loaded
+        self._loader = None
+
+    def _engine_name(self, name, imgsz=None, max_batch_size=None):
+        label = name if imgsz is None else f"{name}@{imgsz}"
+        if max_batch_size and max_batch_size != self.max_batch_size:
+            label += f"x{max_batch_size}"
+        return label
+
+    def _new_engine(self, name, imgsz=None, max_batch_size=None):
+        return BatchInferenceEngine(
+            functools.partial(self.worker_pool.predict, model=name, imgsz=imgsz),
+            max_batch_size=max_batch_size or self.max_batch_size,
+            max_wait_ms=self.max_wait_ms,
+            max_concurrency=self.worker_pool.workers,
+            name=self._engine_name(name, imgsz, max_batch_size),
+        )
+
+    async def start(self):
+        for engine in self.engines.values():
+            await engine.start()
+        if self._loader is None:
+            self._loader = asyncio.create_task(self._load_all())
+
+    async def stop(self):
+        if self._loader is not None:
+            self._loader.cancel()
+            try:
+                await self._loader
+            except asyncio.CancelledError:
+                pass
+            self._loader = None
+        for engine in [*self.engines.values(), *self.sized_engines.values()]:
+            await engine.stop()
+
+    async def _load_all(self):
+        names = [self.default] + [name for name in self.versions if name != self.default]
+        for name in names:
+            state = self.state[name]
+            state["state"] = "loading"
+            loading = time.perf_counter()
+            try:
+                await self.worker_pool.warm_up(name)
+            except Exception as e:
+                state.update(state="failed", error=str(e))
+            else:
+                state.update(state="ready", load_seconds=round(time.perf_counter() - loading, 3))
+                if name == self.default:
+                    self.ready_seconds = round(time.perf_counter() - self.started, 3)
+            if self.on_loaded is not None:
+                self.on_loaded(name, state)
+
+    def engine(self, name=None, imgsz=None, max_batch_size=None):
+        """Batching engine of a model version, at the pool's input and batch
+        sizes unless imgsz or max_batch_size are given"""
+        name = name or self.default
+        if name not in self.engines:
+            raise UnknownModel(f"Unknown model: {name}")
+        state = self.state[name]["state"]
+        if state != "ready":
+            raise ModelNotReady(f"Model {name} is {state}")
+        imgsz = imgsz or self.worker_pool.imgsz
+        max_batch_size = max_batch_size or self.max_batch_size
+        if imgsz == self.worker_pool.imgsz and max_batch_size == self.max_batch_size:
+            return self.engines[name]
+        key = (name, imgsz, max_batch_size)
+        engine = self.sized_engines.get(key)
+        if engine is None:
+            engine = self.sized_engines[key] = self._new_engine(name, imgsz, max_batch_size)
+        return engine
+
+    async def infer(self, source, model=None, imgsz=None):
+        return await self.engine(model, imgsz).infer(source)
+
+    def is_ready(self, name=None):
+        return self.state[name or self.default]["state"] == "ready"
+
+    def status(self):
+        return {
+            "default": self.default,
+            "ready_seconds": self.ready_seconds,
+            "models": {
+                name: {"weights": spec.weights, "backend": spec.backend, "int8": spec.int8, **self.state[name]}
+                for name, spec in self.versions.items()
+            },
+        }
+
+    def stats(self):
+        stats = {name: engine.stats() for name, engine in self.engines.items()}
+        for engine in self.sized_engines.values():
+            stats[engine.name] = engine.stats()
+        return stats
@@ -0,0 +1,258 @@
+# profiling.py
+"""Opt-in profiling of single requests.
+
+A request is profiled when it carries an ``X-Profile`` header or a
+``profile`` query parameter, at most once per PROFILE_MIN_INTERVAL seconds:
+
+    curl -F file=@img.jpg -F chamber_number=1 -H "X-Profile: 1" .../upload
+
+The default "sample" mode records the stacks of every thread in the process
+every PROFILE_SAMPLE_MS milliseconds while the request runs, so inference
+and decoding on the worker threads (ultralytics, torch) show up too. It
+writes the collapsed-stack format read by flamegraph.pl and speedscope.
+"cprofile" runs cProfile on the event loop thread instead and writes a
+pstats file (e.g. for snakeviz). With IQMS_WORKER_MODE=process the
+inference workers are separate processes and aren't sampled.
+
+The flag's value picks the mode ("cprofile", anything else samples).
+Profiles are kept in PROFILES_DIR, newest PROFILES_MAX_FILES only. The
+response carries the profile's file name in ``X-Profile-Id``.
+
+Profiles expose source paths and internals, so profiling and the
+/profiles endpoints are off unless IQMS_PROFILE_TOKEN is set (requests
+then need it in an ``X-Profile-Token`` header) or IQMS_PROFILING=1
+explicitly allows them without a token.
+"""
+import asyncio
+import cProfile
+import hmac
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from urllib.parse import parse_qs
+
+# Profiling settings (can be overridden through the environment)
+PROFILES_DIR = Path(os.environ.get("IQMS_PROFILES_DIR", "profiles"))
+PROFILES_MAX_FILES = int(os.environ.get("IQMS_PROFILES_MAX_FILES", "50"))
+PROFILE_MIN_INTERVAL = float(os.environ.get("IQMS_PROFILE_MIN_INTERVAL", "10"))
+PROFILE_SAMPLE_MS = float(os.environ.get("IQMS_PROFILE_SAMPLE_MS", "5"))
+# When set, profiling and the /profiles endpoints need this in an X-Profile-Token header
+PROFILE_TOKEN = os.environ.get("IQMS_PROFILE_TOKEN", "")
+# Without a token, profiling is only available when explicitly enabled
+PROFILING_ENABLED = os.environ.get("IQMS_PROFILING", "0") in ("1", "true", "yes")
+
+PROFILE_MODES = {"sample": ".collapsed", "cprofile": ".prof"}
+PROFILE_NAME = re.compile(r"^[\w.-]+\.(collapsed|prof)$")
+
+
+def token_ok(token, expected=PROFILE_TOKEN, enabled=PROFILING_ENABLED):
+    """Whether a request may profile or read profiles: the token when one is
+    configured, otherwise only if profiling is explicitly enabled"""
+    if expected:
+        return hmac.compare_digest((token or "").encode(), expected.encode())
+    return enabled
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    path = Path(code.co_filename)
+    return f"{code.co_name} ({path.parent.name}/{path.name}:{frame.f_lineno})"
+
+
+class StackSampler:
+    """Background thread counting the stacks of all other threads"""
+
+    def __init__(self, interval_ms=PROFILE_SAMPLE_MS):
+        self.interval = max(0.001, interval_ms / 1000.0)
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="iqms-profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def join(self):
+        self._thread.join()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                stack.append(names.get(ident, f"thread-{ident}"))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def write(self, path):
+        with open(path, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class Profiler:
+    """Profiles one request in the given mode and saves the result"""
+
+    def __init__(self, mode, path):
+        self.mode = mode
+        self.path = path
+        self._sampler = StackSampler() if mode == "sample" else None
+        self._profile = cProfile.Profile() if mode == "cprofile" else None
+
+    def start(self):
+        if self._sampler is not None:
+            self._sampler.start()
+        else:
+            self._profile.enable()
+
+    def stop(self):
+        """Stop collecting; cheap, and must run on the thread that started"""
+        if self._sampler is not None:
+            self._sampler.stop()
+        else:
+            self._profile.disable()
+
+    def save(self):
+        """Write the profile; blocking, so run it off the event loop"""
+        if self._sampler is not None:
+            self._sampler.join()
+            self._sampler.write(self.path)
+        else:
+            self._profile.dump_stats(str(self.path))
+
+
+class SavedProfiles:
+    """The bounded directory of saved profiles"""
+
+    def __init__(self, directory=PROFILES_DIR, max_files=PROFILES_MAX_FILES):
+        self.directory = Path(directory)
+        self.max_files = max(1, int(max_files))
+
+    def new_path(self, method, path, mode):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        slug = re.sub(r"[^\w]+", "-", path).strip("-") or "root"
+        return self.directory / f"{stamp}_{method.lower()}_{slug[:60]}{PROFILE_MODES[mode]}"
+
+    def list(self):
+        """Saved profiles, newest first"""
+        if not self.directory.is_dir():
+            return []
+        profiles = []
+        for path in self.directory.iterdir():
+            if PROFILE_NAME.match(path.name):
+                stat = path.stat()
+                profiles.append({
+                    "name": path.name,
+                    "bytes": stat.st_size,
+                    "created": datetime.fromtimestamp(stat.st_mtime).isoformat(),
+                })
+        profiles.sort(key=lambda p: p["name"], reverse=True)
+        return profiles
+
+    def path(self, name):
+        """Path of a saved profile, or None for an unknown or unsafe name"""
+        if not PROFILE_NAME.match(name):
+            return None
+        path = self.directory / name
+        return path if path.is_file() else None
+
+    def prune(self):
+        for profile in self.list()[self.max_files:]:
+            try:
+                os.remove(self.directory / profile["name"])
+            except FileNotFoundError:
+                pass
+
+
+class ProfilingMiddleware:
+    """ASGI middleware profiling the requests that ask for it.
+
+    Only one request is profiled at a time, and at most one per
+    ``min_interval`` seconds; other requests that ask are served normally
+    with an ``X-Profile-Skipped`` header.
+    """
+
+    def __init__(self, app, store=None, min_interval=PROFILE_MIN_INTERVAL, token=PROFILE_TOKEN,
+                 enabled=PROFILING_ENABLED):
+        self.app = app
+        self.store = store or SavedProfiles()
+        self.min_interval = min_interval
+        self.token = token
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._last = None
+
+    def _requested_mode(self, scope):
+        """The profiling mode a request asks for, or None"""
+        value = token = None
+        for name, header in scope.get("headers", ()):
+            if name == b"x-profile":
+                value = header.decode("latin-1")
+            elif name == b"x-profile-token":
+                token = header.decode("latin-1")
+        if value is None and b"profile" in scope.get("query_string", b""):
+            query = parse_qs(scope["query_string"].decode("latin-1"))
+            value = query.get("profile", [None])[0]
+        if value is None or value.lower() in ("", "0", "false", "no"):
+            return None
+        if not token_ok(token, self.token, self.enabled):
+            return None
+        return value if value in PROFILE_MODES else "sample"
+
+    def _acquire(self):
+        if not self._lock.acquire(blocking=False):
+            return False
+        now = time.monotonic()
+        if self._last is not None and now - self._last < self.min_interval:
+            self._lock.release()
+            return False
+        self._last = now
+        return True
+
+    async def __call__(self, scope, receive, send):
+        mode = self._requested_mode(scope) if scope["type"] == "http" else None
+        if mode is None:
+            return await self.app(scope, receive, send)
+        if not self._acquire():
+            async def send_skipped(message):
+                if message["type"] == "http.response.start":
+                    message["headers"] = [*message.get("headers", ()), (b"x-profile-skipped", b"rate limited")]
+                await send(message)
+            return await self.app(scope, receive, send_skipped)
+
+        path = self.store.new_path(scope["method"], scope["path"], mode)
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", ()), (b"x-profile-id", path.name.encode())]
+            await send(message)
+
+        profiler = Profiler(mode, path)
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            try:
+                profiler.stop()
+                await asyncio.get_running_loop().run_in_executor(None, self._save, profiler)
+            finally:
+                self._lock.release()
+
+    def _save(self, profiler):
+        profiler.save()
+        self.store.prune()
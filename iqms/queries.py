@@ -0,0 +1,74 @@
+# queries.py
+import base64
+import binascii
+from datetime import datetime
+
+from fastapi import HTTPException
+from sqlalchemy import and_, or_
+
+from database import Detection
+
+# Page size limits for list endpoints
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+# Detection fields that list endpoints can project
+DETECTION_FIELDS = {
+    "id": Detection.id,
+    "chamber_number": Detection.chamber_number,
+    "timestamp": Detection.timestamp,
+    "image_path": Detection.image_path,
+    "detections": Detection.detections,
+}
+
+
+def filter_detections(query, chamber_number=None, since=None, until=None):
+    """Apply the common chamber and [since, until) time filters"""
+    if chamber_number:
+        query = query.filter(Detection.chamber_number == chamber_number)
+    if since:
+        query = query.filter(Detection.timestamp >= since)
+    if until:
+        query = query.filter(Detection.timestamp < until)
+    return query
+
+
+def parse_fields(fields):
+    """Turn a comma-separated field list into the columns to select.
+
+    id and timestamp are always included because the cursor needs them.
+    """
+    if not fields:
+        names = list(DETECTION_FIELDS)
+    else:
+        names = [name.strip() for name in fields.split(",") if name.strip()]
+        unknown = [name for name in names if name not in DETECTION_FIELDS]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+        for name in ("timestamp", "id"):
+            if name not in names:
+                names.insert(0, name)
+    return names
+
+
+def encode_cursor(timestamp, detection_id):
+    raw = f"{timestamp.isoformat()},{detection_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        timestamp, detection_id = raw.rsplit(",", 1)
+        return datetime.fromisoformat(timestamp), int(detection_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def after_cursor(query, cursor):
+    """Keep rows that come after the cursor in (timestamp, id) DESC order"""
+    timestamp, detection_id = decode_cursor(cursor)
+    return query.filter(or_(
+        Detection.timestamp < timestamp,
+        and_(Detection.timestamp == timestamp, Detection.id < detection_id),
+    ))
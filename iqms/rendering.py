@@ -0,0 +1,122 @@
+# rendering.py
+import os
+import threading
+from collections import OrderedDict
+
+import cv2
+
+# Bounded cache for rendered images (can be overridden through the environment)
+RENDER_CACHE_BYTES = int(float(os.environ.get("IQMS_RENDER_CACHE_MB", "64")) * 1024 * 1024)
+
+# Output formats for rendered images: (media type, OpenCV extension, quality flag)
+RENDER_FORMATS = {
+    "jpeg": ("image/jpeg", ".jpg", cv2.IMWRITE_JPEG_QUALITY),
+    "webp": ("image/webp", ".webp", cv2.IMWRITE_WEBP_QUALITY),
+    "png": ("image/png", ".png", None),
+}
+
+# Box colors (BGR) cycled per class name
+BOX_COLORS = [
+    (56, 56, 255),
+    (151, 157, 255),
+    (31, 112, 255),
+    (29, 178, 255),
+    (49, 210, 207),
+    (10, 249, 72),
+]
+
+
+def _class_color(class_name):
+    return BOX_COLORS[sum(class_name.encode()) % len(BOX_COLORS)]
+
+
+def draw_detections(image, detections, scale=1.0):
+    """Draw detection boxes and labels onto a BGR image in place.
+
+    Boxes are stored in original image coordinates, so ``scale`` maps them
+    onto an image that has already been resized.
+    """
+    thickness = max(1, round(sum(image.shape[:2]) / 600))
+    font_scale = thickness / 3
+    for detection in detections:
+        x1, y1, x2, y2 = (int(round(v * scale)) for v in detection["bbox"])
+        color = _class_color(detection["class"])
+        cv2.rectangle(image, (x1, y1), (x2, y2), color, thickness, cv2.LINE_AA)
+
+        label = f"{detection['class']} {detection['confidence']:.2f}"
+        (w, h), baseline = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, font_scale, max(1, thickness - 1))
+        top = y1 - h - baseline if y1 - h - baseline >= 0 else y1
+        cv2.rectangle(image, (x1, top), (x1 + w, top + h + baseline), color, -1, cv2.LINE_AA)
+        cv2.putText(image, label, (x1, top + h), cv2.FONT_HERSHEY_SIMPLEX, font_scale,
+                    (255, 255, 255), max(1, thickness - 1), cv2.LINE_AA)
+    return image
+
+
+def render_detections(image, detections, size=None, fmt="jpeg", quality=85):
+    """Render an annotated copy of an image and return the encoded bytes.
+
+    ``size`` limits the longest side of the output; the image is resized
+    before drawing so thumbnails are cheap to produce.
+    """
+    _, extension, quality_flag = RENDER_FORMATS[fmt]
+
+    scale = 1.0
+    height, width = image.shape[:2]
+    if size and max(height, width) > size:
+        scale = size / max(height, width)
+        image = cv2.resize(image, (max(1, round(width * scale)), max(1, round(height * scale))),
+                           interpolation=cv2.INTER_AREA)
+    else:
+        image = image.copy()
+
+    draw_detections(image, detections, scale)
+    params = [quality_flag, int(quality)] if quality_flag is not None else []
+    ok, encoded = cv2.imencode(extension, image, params)
+    if not ok:
+        raise ValueError(f"Could not encode image as {fmt}")
+    return encoded.tobytes()
+
+
+class RenderCache:
+    """Thread-safe LRU cache of rendered images, bounded by total bytes"""
+
+    def __init__(self, max_bytes=RENDER_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            data = self._items.get(key)
+            if data is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def put(self, key, data):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old)
+            self._items[key] = data
+            self._bytes += len(data)
+            while self._bytes > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._items),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
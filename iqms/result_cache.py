@@ -0,0 +1,82 @@
+# result_cache.py
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+# Number of results kept in memory (can be overridden through the environment)
+RESULT_CACHE_SIZE = int(os.environ.get("IQMS_RESULT_CACHE_SIZE", "1024"))
+
+
+class ResultCache:
+    """Content-addressed cache of detection results.
+
+    Keys are a SHA-256 of the model identity and inference parameters
+    followed by the image bytes, so the same image always maps to the same
+    key while a different model or image size never produces a stale hit.
+    Values are small dicts ({"detections", "image_path"}) kept in LRU order.
+
+    A cached image_path is shared by every row that hits the entry, which
+    is only safe because originals are content-addressed (see
+    imaging.original_filename): identical bytes map to one file that is
+    never overwritten. Callers must not store originals under any other name.
+    The one exception is batch.py, whose rows keep the archived file's path
+    so a run can be resumed; those paths are dropped when a row is loaded
+    as a cache entry (see imaging.is_content_addressed).
+    """
+
+    def __init__(self, model_params, max_entries=RESULT_CACHE_SIZE):
+        self.model_key = json.dumps(model_params, sort_keys=True).encode()
+        self.max_entries = max_entries
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.db_hits = 0
+        self.misses = 0
+
+    def key(self, data, params=None):
+        """Key for image bytes; params are extra inference parameters, e.g. a chamber's crop profile"""
+        digest = hashlib.sha256(self.model_key)
+        if params is not None:
+            digest.update(json.dumps(params, sort_keys=True).encode())
+        digest.update(b"\0")
+        digest.update(memoryview(data))
+        return digest.hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is not None:
+                self._items.move_to_end(key)
+                self.hits += 1
+            return entry
+
+    def put(self, key, detections, image_path=None):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._items[key] = {"detections": detections, "image_path": image_path}
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+
+    def record_db_hit(self):
+        with self._lock:
+            self.db_hits += 1
+
+    def record_miss(self):
+        with self._lock:
+            self.misses += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.db_hits + self.misses
+            return {
+                "entries": len(self._items),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "db_hits": self.db_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.db_hits) / lookups if lookups else 0.0,
+            }
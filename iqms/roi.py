@@ -0,0 +1,174 @@
+# roi.py
+"""Per-chamber region-of-interest inference.
+
+Screws sit at fixed positions for each chamber type, so a chamber with a
+profile (see database.ChamberProfile) only has its regions of interest sent
+to the model, batched and at a smaller input size. Boxes are mapped back to
+full-image coordinates, so callers get the usual detections list. Chambers
+without a profile fall back to full-frame inference.
+"""
+import asyncio
+import math
+import os
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from database import SessionLocal, ChamberProfile
+from inference import extract_detections
+
+# Model input size for crops when a profile doesn't set one
+ROI_IMGSZ = int(os.environ.get("IQMS_ROI_IMGSZ", "320"))
+# How long a looked-up profile (or the absence of one) is reused
+PROFILE_CACHE_SECONDS = float(os.environ.get("IQMS_PROFILE_CACHE_SECONDS", "60"))
+# Chambers remembered by the lookup cache before it starts over
+PROFILE_CACHE_SIZE = 4096
+
+# Crops smaller than this many pixels on a side are skipped
+MIN_CROP_PIXELS = 2
+
+Profile = namedtuple("Profile", ["chamber_number", "rois", "imgsz"])
+
+
+def validate_rois(rois):
+    """Return rois as a list of [x1, y1, x2, y2] fractions, or raise ValueError"""
+    if not rois:
+        raise ValueError("A profile needs at least one region of interest")
+    checked = []
+    for roi in rois:
+        if len(roi) != 4:
+            raise ValueError(f"Region {roi} must be [x1, y1, x2, y2]")
+        x1, y1, x2, y2 = (float(v) for v in roi)
+        if not (0.0 <= x1 < x2 <= 1.0 and 0.0 <= y1 < y2 <= 1.0):
+            raise ValueError(f"Region {roi} must satisfy 0 <= x1 < x2 <= 1 and 0 <= y1 < y2 <= 1")
+        checked.append([x1, y1, x2, y2])
+    return checked
+
+
+def profile_params(profile):
+    """Inference parameters a profile adds to the result cache key"""
+    if profile is None:
+        return None
+    return {"rois": profile.rois, "imgsz": profile.imgsz}
+
+
+def load_profile(chamber_number):
+    with SessionLocal() as db:
+        row = db.get(ChamberProfile, chamber_number)
+        if row is None:
+            return None
+        return Profile(row.chamber_number, row.rois, row.imgsz or ROI_IMGSZ)
+
+
+def save_profile(chamber_number, rois, imgsz=None):
+    rois = validate_rois(rois)
+    if imgsz is not None and imgsz < 32:
+        raise ValueError("imgsz must be at least 32")
+    with SessionLocal() as db:
+        db.merge(ChamberProfile(chamber_number=chamber_number, rois=rois, imgsz=imgsz))
+        db.commit()
+    return Profile(chamber_number, rois, imgsz or ROI_IMGSZ)
+
+
+def delete_profile(chamber_number):
+    """Delete a chamber's profile; returns False if it had none"""
+    with SessionLocal() as db:
+        deleted = db.query(ChamberProfile).filter(ChamberProfile.chamber_number == chamber_number).delete()
+        db.commit()
+    return deleted > 0
+
+
+class ProfileStore:
+    """Profiles looked up by chamber_number, cached for ``ttl`` seconds.
+
+    Chambers without a profile are cached too, so full-frame chambers only
+    cost one database lookup per interval.
+    """
+
+    def __init__(self, ttl=PROFILE_CACHE_SECONDS, max_entries=PROFILE_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._items = {}
+        self._lock = threading.Lock()
+
+    def get(self, chamber_number):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._items.get(chamber_number)
+        if entry is not None and now - entry[0] < self.ttl:
+            return entry[1]
+        profile = load_profile(chamber_number)
+        with self._lock:
+            if len(self._items) >= self.max_entries:
+                self._items.clear()
+            self._items[chamber_number] = (now, profile)
+        return profile
+
+    def save(self, chamber_number, rois, imgsz=None):
+        profile = save_profile(chamber_number, rois, imgsz)
+        self.invalidate(chamber_number)
+        return profile
+
+    def delete(self, chamber_number):
+        deleted = delete_profile(chamber_number)
+        self.invalidate(chamber_number)
+        return deleted
+
+    def invalidate(self, chamber_number):
+        with self._lock:
+            self._items.pop(chamber_number, None)
+
+
+def crop_regions(image, rois):
+    """Yield (crop, (left, top)) for each region of interest in a BGR image"""
+    height, width = image.shape[:2]
+    for x1, y1, x2, y2 in rois:
+        left, top = int(x1 * width), int(y1 * height)
+        right, bottom = min(width, math.ceil(x2 * width)), min(height, math.ceil(y2 * height))
+        if right - left < MIN_CROP_PIXELS or bottom - top < MIN_CROP_PIXELS:
+            continue
+        yield np.ascontiguousarray(image[top:bottom, left:right]), (left, top)
+
+
+def shift_detections(detections, offset):
+    """Move crop-relative boxes into full-image coordinates"""
+    left, top = offset
+    return [
+        {**d, "bbox": [d["bbox"][0] + left, d["bbox"][1] + top, d["bbox"][2] + left, d["bbox"][3] + top]}
+        for d in detections
+    ]
+
+
+async def infer_rois(engine, image, rois):
+    """Run an image's regions of interest through a BatchInferenceEngine.
+
+    The crops are queued together, so they normally go to the model as a
+    single batch (shared with other requests).
+    """
+    regions = list(crop_regions(image, rois))
+    outputs = await asyncio.gather(*(engine.infer(crop) for crop, _ in regions))
+    detections = []
+    for (_, offset), output in zip(regions, outputs):
+        detections.extend(shift_detections(output, offset))
+    return detections
+
+
+def detect_rois(model, images, profile):
+    """Detections for a list of images from one model call over all their crops.
+
+    For callers that own a model on the current thread (the desktop GUI).
+    """
+    crops = []
+    owners = []
+    for i, image in enumerate(images):
+        for crop, offset in crop_regions(image, profile.rois):
+            crops.append(crop)
+            owners.append((i, offset))
+    detections = [[] for _ in images]
+    if crops:
+        results = model(crops, imgsz=profile.imgsz, verbose=False)
+        for (i, offset), result in zip(owners, results):
+            detections[i].extend(shift_detections(extract_detections(result, model.names), offset))
+    return detections
@@ -0,0 +1,97 @@
+# rollups.py
+import os
+from collections import defaultdict
+
+from sqlalchemy import func
+from sqlalchemy.dialects.sqlite import insert
+
+from database import QualityRollup
+
+# Class names counted as good / missing screws (can be overridden through the environment)
+GOOD_CLASS = os.environ.get("IQMS_GOOD_CLASS", "good_screw")
+MISSING_CLASS = os.environ.get("IQMS_MISSING_CLASS", "missing_screw")
+
+BUCKETS = ("hour", "day")
+
+COUNT_COLUMNS = ("inspections", "defective", "good_count", "missing_count", "other_count")
+
+
+def bucket_start(timestamp, bucket):
+    if bucket == "hour":
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def rollup_increments(detections):
+    """Aggregate (chamber_number, timestamp, detections JSON) tuples into
+    per-bucket count increments keyed by (bucket, chamber_number, bucket_start)"""
+    increments = defaultdict(lambda: dict.fromkeys(COUNT_COLUMNS, 0))
+    for chamber_number, timestamp, boxes in detections:
+        good = missing = other = 0
+        for box in boxes or []:
+            if box["class"] == GOOD_CLASS:
+                good += 1
+            elif box["class"] == MISSING_CLASS:
+                missing += 1
+            else:
+                other += 1
+        for bucket in BUCKETS:
+            counts = increments[(bucket, chamber_number or "", bucket_start(timestamp, bucket))]
+            counts["inspections"] += 1
+            counts["defective"] += 1 if missing else 0
+            counts["good_count"] += good
+            counts["missing_count"] += missing
+            counts["other_count"] += other
+    return increments
+
+
+def apply_increments(session, increments):
+    """Upsert count increments into quality_rollups in the session's transaction"""
+    if not increments:
+        return
+    table = QualityRollup.__table__
+    values = [
+        {"bucket": bucket, "chamber_number": chamber_number, "bucket_start": start, **counts}
+        for (bucket, chamber_number, start), counts in increments.items()
+    ]
+    statement = insert(table).values(values)
+    statement = statement.on_conflict_do_update(
+        index_elements=["bucket", "chamber_number", "bucket_start"],
+        set_={column: table.c[column] + statement.excluded[column] for column in COUNT_COLUMNS},
+    )
+    session.execute(statement)
+
+
+def update_rollups(session, rows):
+    """GroupCommitWriter hook: roll up the Detection rows being committed"""
+    apply_increments(session, rollup_increments(
+        (row.chamber_number, row.timestamp, row.detections) for row in rows
+    ))
+
+
+def query_stats(db, bucket="hour", chamber_number=None, since=None, until=None):
+    """Read per-bucket quality stats; cost grows with buckets, not detections"""
+    columns = [func.sum(getattr(QualityRollup, column)).label(column) for column in COUNT_COLUMNS]
+    query = db.query(QualityRollup.bucket_start, *columns).filter(QualityRollup.bucket == bucket)
+    if chamber_number:
+        query = query.filter(QualityRollup.chamber_number == chamber_number)
+    if since:
+        query = query.filter(QualityRollup.bucket_start >= bucket_start(since, bucket))
+    if until:
+        query = query.filter(QualityRollup.bucket_start < until)
+    rows = query.group_by(QualityRollup.bucket_start).order_by(QualityRollup.bucket_start).all()
+
+    stats = []
+    for row in rows:
+        screws = row.good_count + row.missing_count
+        stats.append({
+            "bucket_start": row.bucket_start,
+            "inspections": row.inspections,
+            "defective": row.defective,
+            "good_count": row.good_count,
+            "missing_count": row.missing_count,
+            "other_count": row.other_count,
+            "defect_rate": row.defective / row.inspections if row.inspections else 0.0,
+            "missing_rate": row.missing_count / screws if screws else 0.0,
+        })
+    return stats
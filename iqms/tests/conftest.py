@@ -0,0 +1,18 @@
+# tests/conftest.py
+"""Shared setup: the iqms modules on sys.path, a scratch database and the
+stub model, configured before anything imports database.py"""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+IQMS_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(IQMS_DIR))
+
+_workdir = tempfile.TemporaryDirectory(prefix="iqms-tests-")
+os.environ["IQMS_DATABASE_URL"] = f"sqlite:///{Path(_workdir.name) / 'test.db'}"
+os.environ["IQMS_MODELS"] = "default=stub@stub"
+os.environ.pop("IQMS_DEFAULT_MODEL", None)
+os.environ["IQMS_SAVE_ORIGINALS"] = "0"
+os.environ["IQMS_STUB_CALL_MS"] = "0"
+os.environ["IQMS_STUB_IMAGE_MS"] = "0"
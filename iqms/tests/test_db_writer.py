@@ -0,0 +1,45 @@
+# tests/test_db_writer.py
+import pytest
+
+from database import SessionLocal, Detection, new_detection
+from db_writer import GroupCommitWriter
+
+
+def test_rows_are_acknowledged_after_commit():
+    writer = GroupCommitWriter(max_delay_ms=50)
+    try:
+        futures = [writer.submit(new_detection("writer-ok", [])) for _ in range(5)]
+        ids = [future.result(5).id for future in futures]
+    finally:
+        writer.stop()
+    with SessionLocal() as db:
+        assert db.query(Detection).filter(Detection.id.in_(ids)).count() == 5
+
+
+def test_failing_hook_retries_rows_one_per_transaction():
+    calls = []
+
+    def hook(session, rows):
+        calls.append([row.chamber_number for row in rows])
+        # Fail whole groups, and the bad row on its own
+        if len(rows) > 1 or rows[0].chamber_number == "writer-bad":
+            raise RuntimeError("hook failed")
+
+    writer = GroupCommitWriter(max_delay_ms=200, hooks=[hook])
+    try:
+        futures = [writer.submit(new_detection(chamber, [])) for chamber in ("writer-a", "writer-bad", "writer-b")]
+        good = [futures[0].result(5), futures[2].result(5)]
+        with pytest.raises(RuntimeError):
+            futures[1].result(5)
+    finally:
+        writer.stop()
+
+    assert calls[0] == ["writer-a", "writer-bad", "writer-b"]
+    assert sorted(calls[1:]) == [["writer-a"], ["writer-b"], ["writer-bad"]]
+    stats = writer.stats()
+    assert (stats["rows"], stats["failed"]) == (2, 1)
+    with SessionLocal() as db:
+        chambers = {row.chamber_number for row in db.query(Detection).filter(Detection.id.in_([r.id for r in good]))}
+        assert chambers == {"writer-a", "writer-b"}
+        # The failed group left nothing behind
+        assert db.query(Detection).filter(Detection.chamber_number == "writer-bad").count() == 0
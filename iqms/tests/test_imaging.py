@@ -0,0 +1,66 @@
+# tests/test_imaging.py
+import base64
+import os
+
+import cv2
+import numpy as np
+import pytest
+from fastapi import HTTPException
+
+from imaging import (
+    decode_image, decode_base64_image, encode_jpeg, image_size, original_filename, is_content_addressed, write_once,
+)
+
+
+def jpeg(width=64, height=48):
+    return encode_jpeg(np.full((height, width, 3), 128, dtype=np.uint8))
+
+
+def test_decode_image():
+    assert decode_image(jpeg()).shape == (48, 64, 3)
+
+
+@pytest.mark.parametrize("data", [b"", bytearray(), b"not an image", b"\xff\xd8\xff"])
+def test_undecodable_image_is_400(data):
+    with pytest.raises(HTTPException) as raised:
+        decode_image(data)
+    assert raised.value.status_code == 400
+
+
+def test_decode_base64_image():
+    data = jpeg()
+    encoded = base64.b64encode(data).decode()
+    assert decode_base64_image("data:image/jpeg;base64," + encoded) == data
+    assert decode_base64_image(encoded) == data
+
+
+@pytest.mark.parametrize("image_data", ["data:xx,@@@", "abc", "data:image/jpeg;base64,!!!!"])
+def test_invalid_base64_is_400(image_data):
+    with pytest.raises(HTTPException) as raised:
+        decode_base64_image(image_data)
+    assert raised.value.status_code == 400
+
+
+def test_image_size_reads_the_header():
+    assert image_size(jpeg(640, 480)) == (640, 480)
+    assert image_size(b"nope") is None
+
+
+def test_originals_are_content_addressed(tmp_path):
+    data = jpeg()
+    name = original_filename(data)
+    assert name.endswith(".jpg")
+    assert name == original_filename(bytearray(data))
+    assert name != original_filename(jpeg(32, 32))
+    ok, png = cv2.imencode(".png", np.zeros((4, 4, 3), dtype=np.uint8))
+    assert original_filename(png.tobytes()).endswith(".png")
+
+    assert is_content_addressed(os.path.join("uploads", name))
+    assert not is_content_addressed("/archive/C1_0001.jpg")
+    assert not is_content_addressed(None)
+
+    path = tmp_path / name
+    write_once(path, data)
+    write_once(path, b"different")
+    assert path.read_bytes() == data
+    assert os.listdir(tmp_path) == [name]
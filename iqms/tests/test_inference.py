@@ -0,0 +1,33 @@
+# tests/test_inference.py
+import asyncio
+
+from inference import LatestFrameSlot
+
+
+def test_latest_frame_slot_keeps_only_the_newest_frame():
+    async def run():
+        slot = LatestFrameSlot()
+        slot.put(1, b"a")
+        slot.put(2, b"b")
+        slot.put(3, b"c")
+        frame = await slot.take()
+        slot.put(4, b"d")
+        return slot, frame, await slot.take()
+
+    slot, first, second = asyncio.run(run())
+    assert first == (3, b"c")
+    assert second == (4, b"d")
+    assert slot.received == 4
+    assert slot.dropped == 2
+
+
+def test_latest_frame_slot_take_waits_for_a_frame():
+    async def run():
+        slot = LatestFrameSlot()
+        waiter = asyncio.ensure_future(slot.take())
+        await asyncio.sleep(0)
+        assert not waiter.done()
+        slot.put(7, b"x")
+        return await asyncio.wait_for(waiter, 1)
+
+    assert asyncio.run(run()) == (7, b"x")
@@ -0,0 +1,77 @@
+# tests/test_main2.py
+import base64
+import os
+import time
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+from conftest import IQMS_DIR
+from imaging import encode_jpeg
+
+
+@pytest.fixture(scope="module")
+def client():
+    # main2 serves static/ and templates/ relative to the working directory
+    cwd = os.getcwd()
+    os.chdir(IQMS_DIR)
+    try:
+        import main2
+
+        with TestClient(main2.app, raise_server_exceptions=False) as client:
+            deadline = time.monotonic() + 30
+            while client.get("/readyz").status_code != 200:
+                assert time.monotonic() < deadline, "model never became ready"
+                time.sleep(0.05)
+            yield client
+    finally:
+        os.chdir(cwd)
+
+
+@pytest.fixture
+def image():
+    return encode_jpeg(np.random.default_rng(0).integers(0, 255, (120, 160, 3), dtype=np.uint8))
+
+
+def test_upload(client, image):
+    response = client.post("/upload", files={"file": ("a.jpg", image, "image/jpeg")}, data={"chamber_number": "C1"})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["chamber_number"] == "C1"
+    assert isinstance(body["detections"], list)
+
+
+@pytest.mark.parametrize("data", [b"", b"not an image"])
+def test_upload_of_an_undecodable_file_is_400(client, data):
+    response = client.post("/upload", files={"file": ("a.jpg", data, "image/jpeg")}, data={"chamber_number": "C1"})
+    assert response.status_code == 400
+
+
+def test_capture(client, image):
+    image_data = "data:image/jpeg;base64," + base64.b64encode(image).decode()
+    response = client.post("/capture", data={"image_data": image_data, "chamber_number": "C1"})
+    assert response.status_code == 200
+
+
+@pytest.mark.parametrize("image_data", ["data:xx,@@@", "data:image/jpeg;base64,", "bm90IGFuIGltYWdl"])
+def test_capture_of_invalid_image_data_is_400(client, image_data):
+    response = client.post("/capture", data={"image_data": image_data, "chamber_number": "C1"})
+    assert response.status_code == 400
+
+
+def test_binary_capture(client, image):
+    response = client.post("/capture/binary", params={"chamber_number": "C1"}, content=image,
+                           headers={"content-type": "image/jpeg"})
+    assert response.status_code == 200
+
+
+@pytest.mark.parametrize("content, content_type, status", [
+    (b"", "image/jpeg", 400),
+    (b"not an image", "image/jpeg", 400),
+    (b"GIF89a", "image/gif", 415),
+])
+def test_binary_capture_errors(client, content, content_type, status):
+    response = client.post("/capture/binary", params={"chamber_number": "C1"}, content=content,
+                           headers={"content-type": content_type})
+    assert response.status_code == status
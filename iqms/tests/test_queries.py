@@ -0,0 +1,51 @@
+# tests/test_queries.py
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException
+
+from database import SessionLocal, Detection
+from queries import encode_cursor, decode_cursor, after_cursor
+
+
+def test_cursor_round_trip():
+    timestamp = datetime(2024, 5, 1, 12, 30, 15, 123456)
+    cursor = encode_cursor(timestamp, 42)
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == (timestamp, 42)
+
+
+@pytest.mark.parametrize("cursor", ["", "!!!", encode_cursor(datetime(2024, 1, 1), 1)[:-4], "bm90LWEtY3Vyc29y"])
+def test_invalid_cursor_is_400(cursor):
+    with pytest.raises(HTTPException) as raised:
+        decode_cursor(cursor)
+    assert raised.value.status_code == 400
+
+
+def test_after_cursor_pages_by_timestamp_then_id():
+    chamber = "queries-test"
+    same = datetime(2024, 1, 1, 10)
+    with SessionLocal() as db:
+        rows = [Detection(chamber_number=chamber, timestamp=t, detections=[])
+                for t in (datetime(2024, 1, 1, 9), same, same, same, datetime(2024, 1, 1, 11))]
+        db.add_all(rows)
+        db.commit()
+        ids = [row.id for row in rows]
+
+        def page(cursor, limit=2):
+            query = db.query(Detection).filter(Detection.chamber_number == chamber)
+            if cursor:
+                query = after_cursor(query, cursor)
+            return query.order_by(Detection.timestamp.desc(), Detection.id.desc()).limit(limit).all()
+
+        seen = []
+        cursor = None
+        while True:
+            batch = page(cursor)
+            if not batch:
+                break
+            seen.extend(row.id for row in batch)
+            cursor = encode_cursor(batch[-1].timestamp, batch[-1].id)
+
+    # Newest first; rows sharing a timestamp are split across pages by id
+    assert seen == [ids[4], ids[3], ids[2], ids[1], ids[0]]
@@ -0,0 +1,42 @@
+# tests/test_result_cache.py
+from result_cache import ResultCache
+
+
+def test_key_depends_on_model_params_and_bytes():
+    cache = ResultCache({"model": "a"})
+    assert cache.key(b"image") == cache.key(bytearray(b"image"))
+    assert cache.key(b"image") != cache.key(b"other")
+    assert cache.key(b"image") != cache.key(b"image", {"tiles": 640})
+    assert cache.key(b"image") != ResultCache({"model": "b"}).key(b"image")
+    # Parameter order doesn't matter
+    assert cache.key(b"image", {"a": 1, "b": 2}) == cache.key(b"image", {"b": 2, "a": 1})
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ResultCache({}, max_entries=2)
+    cache.put("a", [1], "a.jpg")
+    cache.put("b", [2])
+    assert cache.get("a") == {"detections": [1], "image_path": "a.jpg"}
+    cache.put("c", [3])
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+    assert cache.stats()["entries"] == 2
+
+
+def test_zero_entries_disables_the_cache():
+    cache = ResultCache({}, max_entries=0)
+    cache.put("a", [1])
+    assert cache.get("a") is None
+
+
+def test_stats_count_memory_and_database_hits():
+    cache = ResultCache({})
+    cache.put("a", [])
+    cache.get("a")
+    cache.record_db_hit()
+    cache.record_miss()
+    cache.record_miss()
+    stats = cache.stats()
+    assert (stats["hits"], stats["db_hits"], stats["misses"]) == (1, 1, 2)
+    assert stats["hit_rate"] == 0.5
@@ -0,0 +1,64 @@
+# tests/test_roi.py
+import numpy as np
+import pytest
+
+import roi
+from roi import crop_regions, shift_detections, validate_rois, ProfileStore, Profile
+
+
+def test_crop_regions_returns_crops_with_their_offsets():
+    image = np.arange(100 * 200 * 3, dtype=np.uint8).reshape(100, 200, 3)
+    regions = list(crop_regions(image, [[0.0, 0.0, 0.5, 0.5], [0.25, 0.5, 1.0, 1.0]]))
+
+    (first, first_offset), (second, second_offset) = regions
+    assert first_offset == (0, 0) and first.shape == (50, 100, 3)
+    assert second_offset == (50, 50) and second.shape == (50, 150, 3)
+    assert np.array_equal(second, image[50:100, 50:200])
+    assert second.flags["C_CONTIGUOUS"]
+
+
+def test_crop_regions_skips_tiny_regions():
+    image = np.zeros((100, 100, 3), dtype=np.uint8)
+    assert list(crop_regions(image, [[0.5, 0.5, 0.51, 0.9]])) == []
+
+
+def test_shift_detections():
+    detections = [{"class": "good_screw", "confidence": 0.8, "bbox": [1, 2, 3, 4]}]
+    shifted = shift_detections(detections, (10, 20))
+    assert shifted == [{"class": "good_screw", "confidence": 0.8, "bbox": [11, 22, 13, 24]}]
+    assert detections[0]["bbox"] == [1, 2, 3, 4]
+
+
+def test_validate_rois():
+    assert validate_rois([[0, 0, 1, 1]]) == [[0.0, 0.0, 1.0, 1.0]]
+    for rois in ([], [[0, 0, 1]], [[0.5, 0, 0.5, 1]], [[0, 0, 1.5, 1]]):
+        with pytest.raises(ValueError):
+            validate_rois(rois)
+
+
+def test_profile_store_reuses_lookups_until_the_ttl_expires(monkeypatch):
+    clock = [100.0]
+    lookups = []
+
+    def load_profile(chamber_number):
+        lookups.append(chamber_number)
+        return Profile(chamber_number, [[0, 0, 1, 1]], 320) if chamber_number == "C1" else None
+
+    monkeypatch.setattr(roi.time, "monotonic", lambda: clock[0])
+    monkeypatch.setattr(roi, "load_profile", load_profile)
+    store = ProfileStore(ttl=60)
+
+    assert store.get("C1").chamber_number == "C1"
+    assert store.get("C2") is None
+    clock[0] += 59
+    store.get("C1")
+    store.get("C2")
+    assert lookups == ["C1", "C2"]
+
+    clock[0] += 1
+    store.get("C1")
+    assert lookups == ["C1", "C2", "C1"]
+
+    store.invalidate("C1")
+    store.get("C1")
+    assert lookups == ["C1", "C2", "C1", "C1"]
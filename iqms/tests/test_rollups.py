@@ -0,0 +1,34 @@
+# tests/test_rollups.py
+from datetime import datetime
+
+from rollups import rollup_increments, bucket_start, GOOD_CLASS, MISSING_CLASS
+
+
+def box(name):
+    return {"class": name, "confidence": 0.9, "bbox": [0, 0, 1, 1]}
+
+
+def test_bucket_start():
+    timestamp = datetime(2024, 3, 4, 15, 42, 7, 99)
+    assert bucket_start(timestamp, "hour") == datetime(2024, 3, 4, 15)
+    assert bucket_start(timestamp, "day") == datetime(2024, 3, 4)
+
+
+def test_rollup_increments_counts_per_bucket():
+    increments = rollup_increments([
+        ("C1", datetime(2024, 3, 4, 15, 5), [box(GOOD_CLASS), box(GOOD_CLASS), box(MISSING_CLASS)]),
+        ("C1", datetime(2024, 3, 4, 15, 50), [box(GOOD_CLASS), box("scratch")]),
+        ("C1", datetime(2024, 3, 4, 16, 1), None),
+        (None, datetime(2024, 3, 4, 16, 2), []),
+    ])
+
+    assert increments[("hour", "C1", datetime(2024, 3, 4, 15))] == {
+        "inspections": 2, "defective": 1, "good_count": 3, "missing_count": 1, "other_count": 1,
+    }
+    assert increments[("hour", "C1", datetime(2024, 3, 4, 16))]["inspections"] == 1
+    assert increments[("day", "C1", datetime(2024, 3, 4))] == {
+        "inspections": 3, "defective": 1, "good_count": 3, "missing_count": 1, "other_count": 1,
+    }
+    # A missing chamber number is rolled up under ""
+    assert increments[("day", "", datetime(2024, 3, 4))]["inspections"] == 1
+    assert len(increments) == 5
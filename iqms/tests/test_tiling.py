@@ -0,0 +1,90 @@
+# tests/test_tiling.py
+import numpy as np
+import pytest
+
+from tiling import Tiling, tiling_for, tile_grid, plan_tiles, merge_detections, crop_tiles, combine_tiles
+
+
+def box(name, confidence, bbox):
+    return {"class": name, "confidence": confidence, "bbox": bbox}
+
+
+def test_tile_grid_covers_the_image_with_overlap():
+    tiles = tile_grid(1000, 700, 400, 100)
+    assert tiles == [
+        (0, 0, 400, 400), (300, 0, 700, 400), (600, 0, 1000, 400),
+        (0, 300, 400, 700), (300, 300, 700, 700), (600, 300, 1000, 700),
+    ]
+
+
+def test_tile_grid_of_a_small_image_is_one_tile():
+    assert tile_grid(300, 200, 640, 128) == [(0, 0, 300, 200)]
+
+
+def test_plan_tiles_downscales_to_fit_max_tiles():
+    tiling = Tiling(size=400, overlap=100, max_tiles=4)
+    scale, tiles = plan_tiles(2000, 2000, tiling)
+    assert scale < 1.0
+    assert len(tiles) <= 4
+    assert plan_tiles(700, 700, tiling) == (1.0, tile_grid(700, 700, 400, 100))
+
+
+def test_merge_detections_keeps_the_most_confident_overlapping_box():
+    merged = merge_detections([
+        box("good_screw", 0.6, [100, 100, 150, 150]),
+        box("good_screw", 0.9, [102, 101, 151, 152]),
+        # Cut off by a tile edge: mostly inside the box above
+        box("good_screw", 0.7, [102, 101, 130, 152]),
+        box("good_screw", 0.8, [300, 300, 340, 340]),
+        # Another class at the same place is kept
+        box("missing_screw", 0.5, [100, 100, 150, 150]),
+    ])
+    assert merged == [
+        box("good_screw", 0.9, [102, 101, 151, 152]),
+        box("good_screw", 0.8, [300, 300, 340, 340]),
+        box("missing_screw", 0.5, [100, 100, 150, 150]),
+    ]
+
+
+def test_merge_detections_of_nothing():
+    assert merge_detections([]) == []
+
+
+def test_crop_and_combine_tiles_map_boxes_back_to_the_image():
+    image = np.zeros((700, 1000, 3), dtype=np.uint8)
+    tiling = Tiling(size=400, overlap=100, always=True)
+    scale, tiles, crops = crop_tiles(image, tiling)
+    assert scale == 1.0
+    assert [crop.shape[:2] for crop in crops] == [(400, 400)] * 6
+
+    # The same screw seen by the first two tiles, in tile coordinates
+    outputs = [[] for _ in tiles]
+    outputs[0] = [box("good_screw", 0.9, [310, 10, 350, 50])]
+    outputs[1] = [box("good_screw", 0.8, [10, 10, 50, 50])]
+    assert combine_tiles(tiles, outputs, scale) == [box("good_screw", 0.9, [310, 10, 350, 50])]
+
+    assert combine_tiles(tiles[:1], [[box("good_screw", 0.9, [10, 20, 30, 40])]], 0.5) == [
+        box("good_screw", 0.9, [20.0, 40.0, 60.0, 80.0]),
+    ]
+
+
+def test_tiling_applies_by_size():
+    tiling = Tiling(min_side=2000)
+    assert not tiling.applies_to_size(1999, 1000)
+    assert tiling.applies_to_size(1000, 2000)
+    assert tiling.applies(np.zeros((2000, 10, 3), dtype=np.uint8))
+    assert Tiling(always=True).applies_to_size(10, 10)
+    assert not Tiling(min_side=0).applies_to_size(10000, 10000)
+
+
+def test_tiling_for():
+    assert tiling_for(False) is None
+    assert tiling_for(None, min_side=0) is None
+    assert tiling_for(True).always
+    assert not tiling_for(None, min_side=1000).always
+
+
+@pytest.mark.parametrize("size, overlap", [(16, 0), (640, 640), (640, -1)])
+def test_invalid_tiling(size, overlap):
+    with pytest.raises(ValueError):
+        Tiling(size=size, overlap=overlap)
@@ -0,0 +1,167 @@
+# tiling.py
+"""Tiled inference for high-resolution images.
+
+A large photo is split into overlapping tiles that the model sees at full
+resolution, so small screws survive that would vanish if the whole image
+were downscaled to the model input size. The tiles are queued together so
+they run as batches, and the boxes are mapped back to image coordinates
+and merged with cross-tile NMS. The number of tiles is capped, which keeps
+the cost of one image bounded: a photo that would need more is
+downscaled just enough to fit.
+"""
+import asyncio
+import os
+from collections import defaultdict
+
+import cv2
+import numpy as np
+
+from roi import shift_detections
+
+# Tiling settings (can be overridden through the environment)
+TILE_SIZE = int(os.environ.get("IQMS_TILE_SIZE", "640"))
+TILE_OVERLAP = int(os.environ.get("IQMS_TILE_OVERLAP", "128"))  # Pixels shared by neighbouring tiles
+TILE_BATCH_SIZE = int(os.environ.get("IQMS_TILE_BATCH_SIZE", "16"))
+MAX_TILES = int(os.environ.get("IQMS_MAX_TILES", "64"))
+# Images whose longest side reaches this are tiled automatically; 0 only tiles on request
+TILE_MIN_SIDE = int(os.environ.get("IQMS_TILE_MIN_SIDE", "2560"))
+
+# Same-class boxes from different tiles are merged when their IoU, or their
+# intersection over the smaller box (a box cut off by a tile edge), reaches these
+TILE_NMS_IOU = float(os.environ.get("IQMS_TILE_NMS_IOU", "0.5"))
+TILE_MERGE_IOS = float(os.environ.get("IQMS_TILE_MERGE_IOS", "0.8"))
+
+
+class Tiling:
+    """Tile settings for one inspection"""
+
+    def __init__(self, size=TILE_SIZE, overlap=TILE_OVERLAP, batch_size=TILE_BATCH_SIZE, max_tiles=MAX_TILES,
+                 min_side=TILE_MIN_SIDE, always=False):
+        if size < 32:
+            raise ValueError("Tile size must be at least 32")
+        if not 0 <= overlap < size:
+            raise ValueError("Tile overlap must be at least 0 and smaller than the tile size")
+        self.size = int(size)
+        self.overlap = int(overlap)
+        self.batch_size = max(1, int(batch_size))
+        self.max_tiles = max(1, int(max_tiles))
+        self.min_side = int(min_side)
+        self.always = always
+
+    def applies(self, image):
+        height, width = image.shape[:2]
+        return self.applies_to_size(width, height)
+
+    def applies_to_size(self, width, height):
+        if self.always:
+            return True
+        return self.min_side > 0 and max(width, height) >= self.min_side
+
+    def params(self):
+        """Settings that change the detections, for the result cache key"""
+        return {
+            "tiles": self.size,
+            "overlap": self.overlap,
+            "max_tiles": self.max_tiles,
+            "min_side": 0 if self.always else self.min_side,
+            "iou": TILE_NMS_IOU,
+            "ios": TILE_MERGE_IOS,
+        }
+
+
+def tiling_for(tiled=None, **settings):
+    """Tiling for a request: None means automatic by image size, False disables it"""
+    if tiled is False:
+        return None
+    if tiled is None and settings.get("min_side", TILE_MIN_SIDE) <= 0:
+        return None
+    return Tiling(always=bool(tiled), **settings)
+
+
+def _starts(length, size, stride):
+    if length <= size:
+        return [0]
+    return list(range(0, length - size, stride)) + [length - size]
+
+
+def tile_grid(width, height, size, overlap):
+    """(left, top, right, bottom) of overlapping tiles covering the image"""
+    stride = size - overlap
+    return [
+        (left, top, min(width, left + size), min(height, top + size))
+        for top in _starts(height, size, stride)
+        for left in _starts(width, size, stride)
+    ]
+
+
+def plan_tiles(width, height, tiling):
+    """Return (scale, tiles), downscaling the image until it fits in max_tiles"""
+    scale = 1.0
+    while True:
+        tiles = tile_grid(max(1, round(width * scale)), max(1, round(height * scale)), tiling.size, tiling.overlap)
+        if len(tiles) <= tiling.max_tiles:
+            return scale, tiles
+        scale *= 0.9
+
+
+def merge_detections(detections, iou_threshold=TILE_NMS_IOU, ios_threshold=TILE_MERGE_IOS):
+    """Cross-tile NMS: of overlapping same-class boxes keep the most confident"""
+    by_class = defaultdict(list)
+    for detection in detections:
+        by_class[detection["class"]].append(detection)
+
+    kept = []
+    for group in by_class.values():
+        group.sort(key=lambda d: d["confidence"], reverse=True)
+        boxes = np.array([d["bbox"] for d in group], dtype=np.float64)
+        areas = np.maximum((boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1]), 1e-9)
+        suppressed = np.zeros(len(group), dtype=bool)
+        for i in range(len(group)):
+            if suppressed[i]:
+                continue
+            kept.append(group[i])
+            rest = boxes[i + 1:]
+            width = np.minimum(boxes[i, 2], rest[:, 2]) - np.maximum(boxes[i, 0], rest[:, 0])
+            height = np.minimum(boxes[i, 3], rest[:, 3]) - np.maximum(boxes[i, 1], rest[:, 1])
+            intersection = np.clip(width, 0, None) * np.clip(height, 0, None)
+            iou = intersection / (areas[i] + areas[i + 1:] - intersection)
+            ios = intersection / np.minimum(areas[i], areas[i + 1:])
+            suppressed[i + 1:] |= (iou >= iou_threshold) | (ios >= ios_threshold)
+    kept.sort(key=lambda d: d["confidence"], reverse=True)
+    return kept
+
+
+def crop_tiles(image, tiling):
+    """Return (scale, tiles, crops): the plan and a contiguous copy of every tile"""
+    height, width = image.shape[:2]
+    scale, tiles = plan_tiles(width, height, tiling)
+    if scale < 1.0:
+        image = cv2.resize(image, (max(1, round(width * scale)), max(1, round(height * scale))),
+                           interpolation=cv2.INTER_AREA)
+    crops = [np.ascontiguousarray(image[top:bottom, left:right]) for left, top, right, bottom in tiles]
+    return scale, tiles, crops
+
+
+def combine_tiles(tiles, outputs, scale):
+    """Map per-tile detections back to image coordinates and merge them"""
+    detections = []
+    for (left, top, _, _), output in zip(tiles, outputs):
+        detections.extend(shift_detections(output, (left, top)))
+    detections = merge_detections(detections)
+
+    if scale < 1.0:
+        detections = [{**d, "bbox": [v / scale for v in d["bbox"]]} for d in detections]
+    return detections
+
+
+async def infer_tiles(engine, image, tiling, run_io):
+    """Run an image as overlapping tiles through a BatchInferenceEngine.
+
+    The engine should run the model at the tile size, so each tile is
+    inspected at full resolution. Resizing, cropping and merging are
+    CPU-heavy, so they go through ``run_io`` (e.g. WorkerPool.run_io) to
+    keep the event loop free.
+    """
+    scale, tiles, crops = await run_io(crop_tiles, image, tiling)
+    outputs = await asyncio.gather(*(engine.infer(crop) for crop in crops))
+    return await run_io(combine_tiles, tiles, outputs, scale)
@@ -0,0 +1,227 @@
+# video.py
+import asyncio
+import os
+import queue
+import threading
+
+import cv2
+
+# Frame sampling defaults (can be overridden through the environment)
+VIDEO_FRAME_STEP = int(os.environ.get("IQMS_VIDEO_FRAME_STEP", "1"))
+# Mean absolute difference (0-255) on a small grey thumbnail below which a
+# frame counts as a duplicate of the last kept one; 0 disables the check
+VIDEO_DEDUP_THRESHOLD = float(os.environ.get("IQMS_VIDEO_DEDUP_THRESHOLD", "0"))
+# Stop after this many kept frames; 0 means the whole video
+VIDEO_MAX_FRAMES = int(os.environ.get("IQMS_VIDEO_MAX_FRAMES", "0"))
+# Decoded frames allowed to wait for inference
+VIDEO_QUEUE_FRAMES = int(os.environ.get("IQMS_VIDEO_QUEUE_FRAMES", "8"))
+# Largest accepted video upload in bytes
+MAX_VIDEO_BYTES = int(float(os.environ.get("IQMS_MAX_VIDEO_MB", "500")) * 1024 * 1024)
+
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mov", ".mkv", ".webm")
+
+THUMBNAIL_SIZE = (32, 32)
+
+
+class FrameSampler:
+    """Decides which frames of a video are inspected.
+
+    Every ``step``-th frame is considered; with a ``dedup_threshold`` a
+    frame is also dropped when it barely differs from the last kept frame.
+    """
+
+    def __init__(self, step=VIDEO_FRAME_STEP, dedup_threshold=VIDEO_DEDUP_THRESHOLD):
+        self.step = max(1, int(step))
+        self.dedup_threshold = max(0.0, float(dedup_threshold))
+        self.decoded = 0
+        self.duplicates = 0
+        self._last = None
+
+    def wants(self, index):
+        return index % self.step == 0
+
+    def keep(self, frame):
+        self.decoded += 1
+        if self.dedup_threshold <= 0:
+            return True
+        grey = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        thumbnail = cv2.resize(grey, THUMBNAIL_SIZE, interpolation=cv2.INTER_AREA)
+        if self._last is not None and cv2.absdiff(thumbnail, self._last).mean() < self.dedup_threshold:
+            self.duplicates += 1
+            return False
+        self._last = thumbnail
+        return True
+
+
+def probe_video(path):
+    """Basic properties of a video file; raises ValueError if it can't be opened"""
+    cap = cv2.VideoCapture(str(path))
+    try:
+        if not cap.isOpened():
+            raise ValueError("Could not open video")
+        return {
+            "fps": cap.get(cv2.CAP_PROP_FPS) or None,
+            "frame_count": int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) or None,
+            "width": int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            "height": int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+        }
+    finally:
+        cap.release()
+
+
+def sample_frames(path, sampler, max_frames=VIDEO_MAX_FRAMES, stop=None):
+    """Yield (frame_index, position_ms, frame) for the frames the sampler keeps.
+
+    Frames off the sampling step are only grabbed, never converted to an
+    image, so a large step skips most of the decoding cost.
+    """
+    cap = cv2.VideoCapture(str(path))
+    if not cap.isOpened():
+        raise ValueError("Could not open video")
+    try:
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        index = -1
+        kept = 0
+        while stop is None or not stop.is_set():
+            index += 1
+            if not sampler.wants(index):
+                if not cap.grab():
+                    break
+                continue
+            ok, frame = cap.read()
+            if not ok:
+                break
+            if not sampler.keep(frame):
+                continue
+            yield index, round(index * 1000.0 / fps, 1) if fps else None, frame
+            kept += 1
+            if max_frames and kept >= max_frames:
+                break
+    finally:
+        cap.release()
+
+
+class VideoDecoder:
+    """Runs sample_frames on a background thread.
+
+    At most ``queue_size`` decoded frames wait for the consumer, so decoding
+    runs ahead of inference without buffering the whole video. Iterate it
+    directly from a thread or with ``async for`` over ``frames()``.
+    """
+
+    def __init__(self, path, sampler=None, max_frames=VIDEO_MAX_FRAMES, queue_size=VIDEO_QUEUE_FRAMES):
+        self.path = path
+        self.sampler = sampler or FrameSampler()
+        self.max_frames = max_frames
+        self._slots = threading.Semaphore(max(1, queue_size))
+        self._stop = threading.Event()
+        self._deliver = None
+
+    def stop(self):
+        self._stop.set()
+
+    def _start(self, deliver):
+        self._deliver = deliver
+        threading.Thread(target=self._run, name="video-decoder", daemon=True).start()
+
+    def _run(self):
+        try:
+            for item in sample_frames(self.path, self.sampler, self.max_frames, self._stop):
+                # Wait for the consumer to make room
+                while not self._slots.acquire(timeout=0.1):
+                    if self._stop.is_set():
+                        return
+                self._deliver(item)
+            end = None
+        except Exception as e:
+            end = e
+        if not self._stop.is_set():
+            self._deliver(end)
+
+    def __iter__(self):
+        frames = queue.Queue()
+        self._start(frames.put)
+        try:
+            while True:
+                item = frames.get()
+                self._slots.release()
+                if item is None:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            self.stop()
+
+    async def frames(self):
+        loop = asyncio.get_running_loop()
+        frames = asyncio.Queue()
+        self._start(lambda item: loop.call_soon_threadsafe(frames.put_nowait, item))
+        try:
+            while True:
+                item = await frames.get()
+                self._slots.release()
+                if item is None:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            self.stop()
+
+
+def _failed(error):
+    future = asyncio.get_running_loop().create_future()
+    future.set_exception(error)
+    return future
+
+
+async def pipelined(source, stages, depth):
+    """Run items from an async iterator through a chain of async stages.
+
+    Each stage works on up to ``depth`` items at once, so the stages
+    overlap and throughput is set by the slowest one rather than their sum.
+    Results are yielded in input order; an exception from the source or a
+    stage is raised when its item comes up.
+    """
+    queues = [asyncio.Queue(maxsize=max(1, depth)) for _ in stages]
+
+    async def feed():
+        try:
+            async for item in source:
+                await queues[0].put(asyncio.ensure_future(stages[0](item)))
+        except Exception as e:
+            await queues[0].put(_failed(e))
+        await queues[0].put(None)
+
+    async def relay(stage, inbox, outbox):
+        while True:
+            future = await inbox.get()
+            if future is None:
+                await outbox.put(None)
+                return
+            try:
+                item = await future
+            except Exception as e:
+                await outbox.put(_failed(e))
+                continue
+            await outbox.put(asyncio.ensure_future(stage(item)))
+
+    tasks = [asyncio.ensure_future(feed())]
+    for i in range(1, len(stages)):
+        tasks.append(asyncio.ensure_future(relay(stages[i], queues[i - 1], queues[i])))
+    try:
+        while True:
+            future = await queues[-1].get()
+            if future is None:
+                break
+            yield await future
+    finally:
+        for task in tasks:
+            task.cancel()
+        # Drop work that was started for items nobody will read
+        for pending in queues:
+            while not pending.empty():
+                future = pending.get_nowait()
+                if future is not None:
+                    future.cancel()
@@ -0,0 +1,115 @@
+# workers.py
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from inference import extract_detections
+from model_registry import MODEL_VERSIONS, get_spec, get_model, warm_up
+
+# Worker pool settings (can be overridden through the environment)
+WORKER_MODE = os.environ.get("IQMS_WORKER_MODE", "thread")  # "thread" or "process"
+WORKER_COUNT = int(os.environ.get("IQMS_WORKERS", str(max(1, (os.cpu_count() or 1) // 2))))
+IO_WORKER_COUNT = int(os.environ.get("IQMS_IO_WORKERS", "4"))
+
+# Model input size (longest image side fed to the network)
+MODEL_IMGSZ = int(os.environ.get("IQMS_IMGSZ", "640"))
+
+_local = threading.local()
+
+
+def _init_worker(torch_threads, imgsz, versions):
+    # Models are loaded on first use (see model_registry.get_model), so
+    # starting the pool is cheap; each worker keeps its own instances
+    if torch_threads:
+        try:
+            import torch
+            torch.set_num_threads(torch_threads)
+        except ImportError:
+            pass
+    _local.imgsz = imgsz
+    # Process workers don't see versions registered after import
+    MODEL_VERSIONS.update(versions)
+
+
+def predict_batch(sources, model_name=None, imgsz=None):
+    """Run one batched model call inside a worker.
+
+    Returns one detections list per source. Only plain dicts are returned
+    so the result can cross a process boundary.
+    """
+    model = get_model(model_name)
+    results = model(sources, imgsz=imgsz or _local.imgsz)
+    return [extract_detections(r, model.names) for r in results]
+
+
+def warm_up_worker(model_name=None):
+    warm_up(get_model(model_name), _local.imgsz)
+
+
+class WorkerPool:
+    """Executes model inference and blocking file/DB work off the event loop.
+
+    Inference runs on ``workers`` threads or processes, each with its own
+    instance of every model version it has used, so batches can run in
+    parallel. File and database work runs on a separate small thread pool
+    so it never waits behind inference.
+    """
+
+    def __init__(self, mode=WORKER_MODE, workers=WORKER_COUNT, io_workers=IO_WORKER_COUNT, imgsz=MODEL_IMGSZ):
+        if mode not in ("thread", "process"):
+            raise ValueError(f"Unknown worker mode: {mode}")
+        self.mode = mode
+        self.workers = max(1, int(workers))
+        self.imgsz = imgsz
+
+        # Split the cores between workers so torch does not oversubscribe them
+        torch_threads = max(1, (os.cpu_count() or 1) // self.workers)
+        executor_cls = ProcessPoolExecutor if mode == "process" else ThreadPoolExecutor
+        self._inference_executor = executor_cls(
+            max_workers=self.workers,
+            initializer=_init_worker,
+            initargs=(torch_threads, imgsz, dict(MODEL_VERSIONS)),
+        )
+        self._io_executor = ThreadPoolExecutor(
+            max_workers=max(1, int(io_workers)),
+            thread_name_prefix="iqms-io",
+        )
+
+    def model_params(self, model=None):
+        """Model identity for result caching; PyTorch keeps the original key
+        so content hashes stored before backends existed still match"""
+        spec = get_spec(model)
+        params = {"weights": spec.weights, "imgsz": self.imgsz}
+        if spec.backend != "pytorch":
+            params.update(backend=spec.backend, int8=spec.int8)
+        return params
+
+    async def predict(self, sources, model=None, imgsz=None):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._inference_executor, predict_batch, sources, model, imgsz)
+
+    async def warm_up(self, model=None):
+        """Load a model version on the workers and run a blank frame through it.
+
+        One task is sent per worker; since loading takes a while they
+        normally land on different workers, and any worker that is missed
+        still loads the model on its first batch.
+        """
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(
+            loop.run_in_executor(self._inference_executor, warm_up_worker, model)
+            for _ in range(self.workers)
+        ))
+
+    async def run_io(self, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        # Carry the request context over, so stage timings reach the request's breakdown
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(self._io_executor, functools.partial(context.run, fn, *args, **kwargs))
+
+    def shutdown(self):
+        self._inference_executor.shutdown(wait=False, cancel_futures=True)
+        self._io_executor.shutdown(wait=True)